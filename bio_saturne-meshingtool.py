@@ -5,20 +5,22 @@ _exten = file extnesion without .
 _filepath = path to a file including filename and extension
 _path = path to software"""
 
+import time
+#Records when the script started so --check can report the startup time
+START_TIME = time.perf_counter()
 import sys
+import os
+import re
+import math
+import json
+import shutil
+import logging
+import signal
+import argparse
+import threading
+import traceback
+import subprocess
 from datetime import datetime
-builtin = sys.builtin_module_names
-modules = ['traceback', 'logging', 'importlib', 'subprocess',
-          'argparse', 're', 'os', 'math', 'yaml']
-for mod in modules:
-    try:
-        exec('import ' + mod)                  
-    except ImportError as ie:
-        print('\n----------------Import Error----------------\n')
-        print('Error: {}'.format(ie))
-        print('\nTry installing using:\npip install ' + mod)
-
-logging.getLogger('matplotlib').setLevel(logging.WARNING)
 
 class LauncherError(Exception):
     '''Error handling when the a cmd is sent to the launcher
@@ -29,6 +31,17 @@ class LauncherError(Exception):
         +cmd+'\n' + message
         super().__init__(self.message)
 
+class StageTimeoutError(Exception):
+    '''Error handling when a cmd sent to the launcher function runs
+    for longer than the timeout of its stage'''
+    def __init__(self, cmd, timeout):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.message = '\n----------------Timeout Error----------------\n'\
+        +cmd+'\nwas stopped after '+ str(timeout) +' seconds (see the timeouts configuration'\
+        ' or --timeout)'
+        super().__init__(self.message)
+
 class NotFoundinFile(Exception):
     '''Error handling when a function searches for a term in a
     specific file'''
@@ -98,13 +111,19 @@ class ChimeraError(Exception):
         "\nThe file "+ error_file +" has more details"
         super().__init__(self.message)
 
-logging.basicConfig(level=logging.DEBUG)
-Logger = logging.getLogger('mesh-generator')
+class ExecutorError(Exception):
+    '''Error handling when a step run by an executor in another process,
+    or on another node, fails'''
+    def __init__(self, user_inp, message):
+        self.user_inp = user_inp
+        self.message = '\n----------------Executor Error----------------\n'\
+        +"Error running "+ user_inp +": " + message
+        super().__init__(self.message)
 
-def exit_tool():
-    '''Ends the program'''
+def exit_tool(status=0):
+    '''Ends the program, with a non-zero exit status if it failed'''
     print("\n----------------END PROGRAM----------------\n")
-    sys.exit()
+    sys.exit(status)
 
 def write_launcher_err(launcher_err, cmd):
     '''Writes the entirity of the command output to a text file'''
@@ -119,8 +138,152 @@ def write_launcher_err(launcher_err, cmd):
             lerr_file.write(le+'\n')
     return filename
 
-def launcher(cmd, ig_error=False):
-    '''Launches given commands on the command line
+def kill_process_tree(process):
+    '''Terminates a process and all of its children, which share its process group'''
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+    except ProcessLookupError:
+        pass
+
+#Processes run by launcher, so the async stage runner can stop those of worker threads
+LIVE_PROCESSES = set()
+#Whether the user can be prompted. Runs whose steps are in other processes or nodes
+#(executors other than inline, job server jobs and array tasks) log and continue instead
+PROMPTS = {'interactive': True}
+
+def stop_live_processes():
+    '''Terminates the process groups of the processes being run by launcher'''
+    for process in list(LIVE_PROCESSES):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+#Peak memory of the tools run by the stages of each thread, measured as they are reaped
+TOOL_MEMORY = threading.local()
+
+def start_tool_memory():
+    '''Starts measuring the peak memory of the tools run by this thread'''
+    usage = {'peak_mb': None, 'measured': True}
+    TOOL_MEMORY.__dict__.setdefault('stack', []).append(usage)
+    return usage
+
+def add_tool_memory(peak_mb):
+    '''Adds the peak memory (MB) of a tool to the stages measuring this thread, None if
+    the tool couldn't be measured'''
+    for usage in getattr(TOOL_MEMORY, 'stack', []):
+        if peak_mb is None:
+            usage['measured'] = False
+        else:
+            usage['peak_mb'] = max(usage['peak_mb'] or 0.0, peak_mb)
+
+def stop_tool_memory(usage):
+    '''Stops measuring and returns the peak memory (MB) of the largest tool run since
+    start_tool_memory, None if no tool's peak was measured or any couldn't be'''
+    TOOL_MEMORY.stack.remove(usage)
+    return usage['peak_mb'] if usage['measured'] else None
+
+class MeasuredPopen(subprocess.Popen):
+    '''Popen which reaps the process with os.wait4, keeping the resource usage of the
+    process itself rather than the cumulative usage of all children'''
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        try:
+            pid, sts, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+        if pid == self.pid:
+            self.rusage = rusage
+        return pid, sts
+
+def measure_tool(process):
+    '''Adds the peak memory of a reaped tool to the stages measuring this thread. Linux
+    counts the memory of this process, from which the tool was started, in the peak of
+    the tool, so only a peak above that of this process is the tool's own'''
+    import resource
+    if process.rusage is None:
+        add_tool_memory(None)
+    elif process.rusage.ru_maxrss > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+        add_tool_memory(process.rusage.ru_maxrss / 1024)
+
+def run_process(cmd, timeout=None):
+    '''Runs a command in its own process group so that the whole process tree can be
+    terminated if it runs for longer than the timeout, adding its peak memory to the
+    stage which runs it'''
+    process = MeasuredPopen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=True)
+    LIVE_PROCESSES.add(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+        measure_tool(process)
+    except subprocess.TimeoutExpired:
+        kill_process_tree(process)
+        raise StageTimeoutError(' '.join(cmd), timeout)
+    except BaseException:
+        #The process group doesn't receive the user's Ctrl+C so is stopped here
+        kill_process_tree(process)
+        raise
+    finally:
+        LIVE_PROCESSES.discard(process)
+    return process.returncode, stdout, stderr
+
+async def async_kill_process_tree(process):
+    '''Terminates an asyncio subprocess and all of its children'''
+    import asyncio
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        await asyncio.wait_for(process.communicate(), 10)
+    except asyncio.TimeoutError:
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.communicate()
+    except ProcessLookupError:
+        pass
+
+async def async_run_process(cmd, timeout=None):
+    '''Runs a command as run_process does, as an asyncio subprocess. asyncio reaps the
+    process itself, so its peak memory isn't measured'''
+    import asyncio
+    add_tool_memory(None)
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE,
+                                                   stderr=subprocess.PIPE,
+                                                   start_new_session=True)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        await async_kill_process_tree(process)
+        raise StageTimeoutError(' '.join(cmd), timeout)
+    except BaseException:
+        await async_kill_process_tree(process)
+        raise
+    return process.returncode, stdout, stderr
+
+def launcher_output(cur_cmd, returncode, stdout, stderr, ig_error):
+    '''Returns the output and error of a command run by launcher, exiting or raising a
+    LauncherError if it failed and its errors aren't ignored'''
+    if not ig_error and returncode != 0:
+        #Parses errors arising from subprocess
+        print('\n----------------Launcher Error----------------\n')
+        print(subprocess.CalledProcessError(returncode, cur_cmd, stdout, stderr))
+        exit_tool(1)
+    #No error or want to parse the error
+    if len(stderr.decode('utf-8')) == 0 or (ig_error and \
+    len(stderr.decode('utf-8')) != 0):
+        return stdout.decode('utf-8'), stderr.decode('utf-8')
+    #The output is found in stderr
+    if ig_error and len(stdout.decode('utf-8')) == 0:
+        return stderr.decode('utf-8'), stdout.decode('utf-8')
+    error_file = write_launcher_err(stderr.decode('utf-8'), ', '.join(cur_cmd))
+    raise LauncherError(' '.join(cur_cmd),
+    "\nPlease view the complete output in the file "+ error_file)
+
+def launcher(cmd, ig_error=False, timeout=None):
+    '''Launches given commands on the command line, stopping any command which runs
+    for longer than timeout seconds
     Returns the error and output of the commands'''
     ind = 0
     lstdout = []
@@ -132,40 +295,265 @@ def launcher(cmd, ig_error=False):
     end = len(cmds)
     while ind < end:
         cur_cmd = cmds[ind]
-        if not ig_error:
-            #Parses errors arising from subprocess
-            try:
-                process_1 = subprocess.run(cur_cmd, stdout = subprocess.PIPE,
-                                      stderr = subprocess.PIPE, check = True)
-            except subprocess.CalledProcessError as err:
-                print('\n----------------Launcher Error----------------\n')
-                print(err)
-                exit_tool()
-            stdout = process_1.stdout
-            stderr = process_1.stderr
-        else:
-            process_1 = subprocess.Popen(cur_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process_1.communicate()
-        #No error or want to parse the error
-        if len(stderr.decode('utf-8')) == 0 or (ig_error and \
-        len(stderr.decode('utf-8')) != 0):
-            lstderr.append(stderr.decode('utf-8'))
-            lstdout.append(stdout.decode('utf-8'))
-            ind = ind + 1
-        #The output is found in stderr
-        elif ig_error and len(stdout.decode('utf-8')) == 0:
-            lstderr.append(stdout.decode('utf-8'))
-            lstdout.append(stderr.decode('utf-8'))
-            ind = ind + 1
-        else:
-            error_file = write_launcher_err(stderr.decode('utf-8'), ', '.join(cur_cmd))
-            raise LauncherError(' '.join(cur_cmd),
-            "\nPlease view the complete output in the file "+ error_file)
+        returncode, stdout, stderr = run_process(cur_cmd, timeout)
+        out, err = launcher_output(cur_cmd, returncode, stdout, stderr, ig_error)
+        lstdout.append(out)
+        lstderr.append(err)
+        ind = ind + 1
     if len(lstderr) == 1 and len(lstdout) == 1:
         lstderr = lstderr[0]
         lstdout = lstdout[0]
     return lstdout, lstderr
 
+async def async_launcher(cmd, ig_error=False, timeout=None):
+    '''Launches a single command as launcher does, as an asyncio subprocess
+    Returns the error and output of the command'''
+    returncode, stdout, stderr = await async_run_process(cmd, timeout)
+    return launcher_output(cmd, returncode, stdout, stderr, ig_error)
+
+def new_run_report(job, run_directory):
+    '''Creates the report of the run, which records the duration and outcome of
+    every stage'''
+    return {'input': job['input'], 'input_format': job['input_format'],
+            'mesh_name': job['mesh_name'], 'config_hash': job['configs_hash'],
+            'run_directory': run_directory, 'run_path': job['run_path'],
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'timeouts': job['timeouts'], 'stages': [], 'mesh_attempts': [], 'sizes': {}}
+
+#Stages run at once by the async stage runner (and race candidates) share the run report,
+#which is only changed while holding the lock so it is never written half-changed
+RUN_REPORT_LOCK = threading.Lock()
+
+def write_run_report(run_report):
+    '''Writes the run report to the run directory'''
+    report_filepath = os.path.join(run_report['run_path'], run_report['mesh_name'] + '_report.json')
+    with RUN_REPORT_LOCK, open(report_filepath, 'w') as report_file:
+        json.dump(run_report, report_file, indent=2)
+    return report_filepath
+
+def run_stage(run_report, stage, function, *args, **kwargs):
+    '''Runs a stage of the pipeline, recording its duration and outcome in the
+    run report'''
+    start = time.perf_counter()
+    status = 'failed'
+    usage = start_tool_memory()
+    try:
+        result = function(*args, **kwargs)
+        status = 'success'
+        return result
+    except StageTimeoutError:
+        status = 'timeout'
+        raise
+    finally:
+        record_stage(run_report, stage, status, time.perf_counter() - start,
+                     stop_tool_memory(usage))
+
+def record_stage(run_report, stage, status, duration, peak_memory=None):
+    '''Records the duration and outcome of a stage in the run report, with the peak
+    memory (MB) of the largest tool it ran'''
+    with RUN_REPORT_LOCK:
+        run_report['stages'].append({'stage': stage, 'status': status,
+                                     'duration': round(duration, 3),
+                                     'peak_memory_mb': None if peak_memory is None else
+                                     round(peak_memory, 1)})
+    write_run_report(run_report)
+    update_metrics()
+
+#Metrics of the jobs of this process, added to the metrics file as stages are recorded
+METRICS = {'file': None, 'pid': None, 'jobs': [], 'caches': {}, 'extra': {}, 'written': {},
+           'finished': False}
+#Type and help of every metric family, in the Prometheus text format
+METRIC_HELP = {
+    'bio_saturne_jobs_started_total': ('counter', 'Jobs started, by input format'),
+    'bio_saturne_jobs_succeeded_total': ('counter', 'Jobs which succeeded, by input format'),
+    'bio_saturne_jobs_failed_total': ('counter', 'Jobs which failed, by input format'),
+    'bio_saturne_stage_runs_total': ('counter', 'Stages run, by stage and outcome'),
+    'bio_saturne_stage_duration_seconds': ('histogram', 'Duration of the stages, by stage'),
+    'bio_saturne_mesh_elements': ('histogram', 'Elements of the generated meshes, by input format'),
+    'bio_saturne_cache_hits_total': ('counter', 'Cache hits, by cache'),
+    'bio_saturne_cache_misses_total': ('counter', 'Cache misses, by cache'),
+    'bio_saturne_cache_hit_ratio': ('gauge', 'Fraction of the lookups of a cache which hit'),
+    'bio_saturne_server_jobs': ('gauge', 'Jobs of the job server, by status'),
+    'bio_saturne_last_update_timestamp_seconds': ('gauge', 'When the metrics were last updated'),
+}
+STAGE_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600]
+ELEMENT_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+
+def count_cache(counts, cache, hit):
+    '''Counts a hit or a miss of the given cache'''
+    cache_counts = counts.setdefault(cache, [0, 0])
+    cache_counts[0 if hit else 1] += 1
+
+def add_sample(samples, name, labels, value):
+    '''Adds to a sample, keyed by its name and its labels as (name, value) pairs'''
+    samples[(name, labels)] = samples.get((name, labels), 0) + value
+
+def observe(samples, name, labels, value, buckets):
+    '''Adds an observation to the buckets, sum and count of a histogram'''
+    for bucket in buckets + [math.inf]:
+        bucket_label = '+Inf' if bucket == math.inf else format(bucket, 'g')
+        add_sample(samples, name + '_bucket', labels + (('le', bucket_label),),
+                   1 if value <= bucket else 0)
+    add_sample(samples, name + '_sum', labels, value)
+    add_sample(samples, name + '_count', labels, 1)
+
+def metric_samples():
+    '''Returns the samples of the metrics of the jobs of this process, from their run
+    reports, with the cache lookups and the samples of jobs run by other processes'''
+    samples = dict(METRICS['extra'])
+    for job in METRICS['jobs']:
+        run_report = job.get('run_report')
+        if run_report is None:
+            continue
+        input_format = (('input_format', job['input_format']),)
+        add_sample(samples, 'bio_saturne_jobs_started_total', input_format, 1)
+        if job['error'] is not None:
+            add_sample(samples, 'bio_saturne_jobs_failed_total', input_format, 1)
+        elif METRICS['finished']:
+            add_sample(samples, 'bio_saturne_jobs_succeeded_total', input_format, 1)
+        for stage in run_report['stages']:
+            add_sample(samples, 'bio_saturne_stage_runs_total', (('stage', stage['stage']),
+                       ('status', stage['status'])), 1)
+            observe(samples, 'bio_saturne_stage_duration_seconds', (('stage', stage['stage']),),
+                    stage['duration'], STAGE_BUCKETS)
+        if 'elements' in run_report['sizes']:
+            observe(samples, 'bio_saturne_mesh_elements', input_format,
+                    run_report['sizes']['elements'], ELEMENT_BUCKETS)
+        for cache, (hits, misses) in run_report.get('caches', {}).items():
+            add_sample(samples, 'bio_saturne_cache_hits_total', (('cache', cache),), hits)
+            add_sample(samples, 'bio_saturne_cache_misses_total', (('cache', cache),), misses)
+    for cache, (hits, misses) in METRICS['caches'].items():
+        add_sample(samples, 'bio_saturne_cache_hits_total', (('cache', cache),), hits)
+        add_sample(samples, 'bio_saturne_cache_misses_total', (('cache', cache),), misses)
+    return samples
+
+def metric_family(name):
+    '''Returns the family of a sample, which differs from its name for histograms'''
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRIC_HELP:
+            return name[:-len(suffix)]
+    return name
+
+def format_metrics(samples):
+    '''Formats the samples in the Prometheus text format, with the hit ratio of every
+    cache and the time of the update'''
+    samples = dict(samples)
+    for (name, labels), hits in list(samples.items()):
+        if name == 'bio_saturne_cache_hits_total':
+            lookups = hits + samples.get(('bio_saturne_cache_misses_total', labels), 0)
+            samples[('bio_saturne_cache_hit_ratio', labels)] = hits / lookups if lookups else 0
+    samples[('bio_saturne_last_update_timestamp_seconds', ())] = round(time.time(), 3)
+    def sort_key(sample):
+        (name, labels), _ = sample
+        return (name, [(key, float(value) if key == 'le' else value) for key, value in labels])
+    lines = []
+    for family, (kind, help_text) in METRIC_HELP.items():
+        family_samples = sorted([sample for sample in samples.items() if
+                                 metric_family(sample[0][0]) == family], key=sort_key)
+        if family_samples == []:
+            continue
+        lines.append('# HELP ' + family + ' ' + help_text)
+        lines.append('# TYPE ' + family + ' ' + kind)
+        for (name, labels), value in family_samples:
+            label_text = ','.join(key + '="' + label.replace('\\', '\\\\').replace('"', '\\"')
+                                  .replace('\n', '\\n') + '"' for key, label in labels)
+            lines.append(name + ('{' + label_text + '}' if labels else '') + ' ' +
+                         (str(int(value)) if value == int(value) else repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+def read_metrics_file(metrics_filepath):
+    '''Reads the counters and histograms of a metrics file written by format_metrics'''
+    samples = {}
+    try:
+        with open(metrics_filepath) as metrics_file:
+            lines = metrics_file.read().splitlines()
+    except OSError:
+        return samples
+    for line in lines:
+        match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if match is None or METRIC_HELP.get(metric_family(match.group(1)),
+                                            ('gauge',))[0] == 'gauge':
+            continue
+        labels = tuple((key, re.sub(r'\\(.)', lambda char: '\n' if char.group(1) == 'n'
+                                    else char.group(1), value)) for key, value in
+                       re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ''))
+        samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+def start_metrics(metrics_filepath, jobs):
+    '''Starts the metrics of the jobs of this process, which are added to the metrics
+    file (if given) by update_metrics'''
+    METRICS.update({'file': None if metrics_filepath is None else
+                    os.path.abspath(metrics_filepath), 'pid': os.getpid(), 'jobs': jobs,
+                    'caches': {}, 'extra': {}, 'written': {}, 'finished': False})
+
+def update_metrics():
+    '''Updates the metrics file with the metrics of the jobs of this process, replacing
+    what this process added before so concurrent runs can share the file'''
+    if METRICS['file'] is None or METRICS['pid'] != os.getpid():
+        return
+    import fcntl
+    with open(METRICS['file'] + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        current = metric_samples()
+        samples = read_metrics_file(METRICS['file'])
+        for key in set(current) | set(METRICS['written']):
+            samples[key] = samples.get(key, 0) + current.get(key, 0) - \
+            METRICS['written'].get(key, 0)
+        #Replaced in one step so the textfile collector never reads a partial file
+        tmp_filepath = METRICS['file'] + '.' + str(os.getpid())
+        with open(tmp_filepath, 'w') as metrics_file:
+            metrics_file.write(format_metrics(samples))
+        os.replace(tmp_filepath, METRICS['file'])
+        METRICS['written'] = current
+
+def parse_timeouts(timeout_args):
+    '''Parses --timeout arguments given as seconds (for all stages) or as
+    stage=seconds'''
+    timeouts = {}
+    for timeout_arg in timeout_args or []:
+        if '=' in timeout_arg:
+            stage, seconds = timeout_arg.split('=', 1)
+        else:
+            stage, seconds = 'all', timeout_arg
+        timeouts[stage.strip()] = seconds.strip()
+    return check_timeouts(timeouts, '--timeout')
+
+def check_timeouts(timeouts, source):
+    '''Checks the timeouts are given in seconds for stages of the pipeline'''
+    stages = ['all', 'download', 'ccpem', 'chimerax', 'gmsh', 'code_saturne']
+    if not isinstance(timeouts, dict):
+        raise InputError(source, "\nTimeouts must be given as 'stage: seconds' for the"
+                         " stages: " + ', '.join(stages))
+    checked = {}
+    for stage, seconds in timeouts.items():
+        if stage not in stages:
+            raise UnsupportedError(source + ' stage ' + str(stage), stages)
+        if not isnumber(seconds) or float(seconds) <= 0:
+            raise InputError(source, "\nThe timeout for '" + stage + "' must be a positive"
+                             " number of seconds")
+        checked[stage] = float(seconds)
+    return checked
+
+def stage_timeout(timeouts, stage):
+    '''Returns the timeout in seconds for the given stage, or None for no timeout'''
+    return timeouts.get(stage, timeouts.get('all'))
+
+def link_or_copy(src_filepath, dst_filepath):
+    '''Hardlinks a file to its destination instead of copying it, falling back to a
+    reflink (copy-on-write) or a plain copy when the file systems differ'''
+    if os.path.isdir(dst_filepath):
+        dst_filepath = os.path.join(dst_filepath, os.path.basename(src_filepath))
+    try:
+        os.link(src_filepath, dst_filepath)
+    except OSError:
+        launcher(['cp', '--reflink=auto', src_filepath, dst_filepath])
+    return dst_filepath
+
+def move_to_tmp(filepath):
+    '''Moves a file or folder into the hidden .tmp directory of the run'''
+    os.replace(filepath, os.path.join('.tmp', os.path.basename(filepath)))
+
 def has_number(string):
     '''Returns any number appearing in the given string'''
     return any(s.isdigit() for s in string)
@@ -195,59 +583,127 @@ def find_nodes_elements(outstr, log_file):
 def grep_software_path(soft_name):
     '''Grep for the given software in the bashrc to check for
     Its path if an alias is used'''
-    home = os.environ['HOME']
-    check_cmd = ['find', home + '/.bashrc']
-    check_out, check_err = launcher(check_cmd, True)
-    if 'No such file or directory' in check_out:
-        return check_err
-    grep_command = ['grep', soft_name, home + '/.bashrc']
-    gc_out, gc_err = launcher(grep_command, True)
-    if len(gc_err) == 0:
-        return gc_out
-    return gc_err
+    bashrc = os.path.join(os.environ['HOME'], '.bashrc')
+    if not os.path.isfile(bashrc):
+        return ""
+    with open(bashrc, 'r', errors='replace') as bashrc_file:
+        return ''.join([line for line in bashrc_file if soft_name in line])
 
 def which_software_path(soft_name):
     '''Attempts to find the software path using which'''
-    which_path_cmd = ['which', soft_name]
-    wp_out, wp_err = launcher(which_path_cmd, True)
-    return wp_out
+    return shutil.which(soft_name)
 
-def find_software_ver(path):
-    '''Finds the version of the given software'''
-    if 'ccpem' in path:
-        ver1 = re.findall(r'\.(\d)', path)
-        ver2 = re.findall(r'(\d)\.', path)
-        ver = list(dict.fromkeys(ver2+ ver1))
-        ver = '.'.join(ver)
-        return ver
-    ver_cmd = [path, '--version']
-    ver_out, ver_err = launcher(ver_cmd, True)
+def ccpem_software_ver(path):
+    '''Finds the version of CCP-EM, which is given by its path'''
+    ver1 = re.findall(r'\.(\d)', path)
+    ver2 = re.findall(r'(\d)\.', path)
+    ver = list(dict.fromkeys(ver2+ ver1))
+    ver = '.'.join(ver)
+    return ver
+
+def parse_software_ver(ver_out, ver_err):
+    '''Finds the version in the output of the software's --version'''
     if ver_out == "" and has_number(ver_err) and ('.' in ver_err):
         return ver_err
     if ver_out != "":
         return ver_out
     return ver_err
 
+def find_software_ver(path):
+    '''Finds the version of the given software'''
+    if 'ccpem' in path:
+        return ccpem_software_ver(path)
+    ver_cmd = [path, '--version']
+    ver_out, ver_err = launcher(ver_cmd, True)
+    return parse_software_ver(ver_out, ver_err)
+
+async def async_find_software_ver(path):
+    '''Finds the version of the given software with an asyncio subprocess'''
+    if 'ccpem' in path:
+        return ccpem_software_ver(path)
+    ver_out, ver_err = await async_launcher([path, '--version'], True)
+    return parse_software_ver(ver_out, ver_err)
+
+def software_cache_filepath():
+    '''Returns the file in which the versions of previously checked software are cached'''
+    cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.environ['HOME'], '.cache'))
+    return os.path.join(cache_dir, 'bio_saturne-meshingtool', 'software_versions.json')
+
+def read_software_cache():
+    '''Reads the versions of previously checked software'''
+    try:
+        with open(software_cache_filepath(), 'r') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+def lookup_software_ver(path):
+    '''Returns the cache key and stamp of the given software, which are None if it can't
+    be cached, and the version found on a previous run if the executable hasn't changed'''
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return None, None, None
+    cache_key = os.path.realpath(path)
+    cache_stamp = [path_stat.st_mtime_ns, path_stat.st_size]
+    cache = read_software_cache()
+    hit = cache_key in cache and cache[cache_key]['stamp'] == cache_stamp
+    count_cache(METRICS['caches'], 'software_versions', hit)
+    return cache_key, cache_stamp, cache[cache_key]['version'] if hit else None
+
+def store_software_ver(cache_key, cache_stamp, version):
+    '''Caches the version of a software, re-reading the cache so versions stored since
+    it was read are kept'''
+    if cache_key is None:
+        return
+    cache_filepath = software_cache_filepath()
+    cache = read_software_cache()
+    cache[cache_key] = {'stamp': cache_stamp, 'version': version}
+    try:
+        os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+        with open(cache_filepath + '.' + str(os.getpid()), 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(cache_filepath + '.' + str(os.getpid()), cache_filepath)
+    except OSError:
+        pass
+
+def cached_software_ver(path):
+    '''Finds the version of the given software, reusing the version found on a
+    previous run if the executable hasn't changed since'''
+    cache_key, cache_stamp, version = lookup_software_ver(path)
+    if version is None:
+        version = find_software_ver(path)
+        store_software_ver(cache_key, cache_stamp, version)
+    return version
+
+async def async_cached_software_ver(path):
+    '''Finds the version of the given software as cached_software_ver does, with an
+    asyncio subprocess'''
+    cache_key, cache_stamp, version = lookup_software_ver(path)
+    if version is None:
+        version = await async_find_software_ver(path)
+        store_software_ver(cache_key, cache_stamp, version)
+    return version
+
 def input_software_path(software_name, version):
     '''Allows the user to input a path to the required software
     if the program cannot find it on their system'''
+    if not PROMPTS['interactive']:
+        raise SoftwareNotFound(software_name, version)
     enter_path = input("\nUnable to locate "+ software_name +
     " version " + version + "+ on your system\n Would you like to "
     "enter the path to this software on your system? (y/n): ")
     if enter_path.lower() == 'y':
         software_path = input("\nPlease enter the path to "
         + software_name + " version " + version + "+ :")
-        check_path_cmd = ['find', software_path]
-        check_path_out, check_path_err = launcher(check_path_cmd, True)
-        if check_path_err != "":
+        if not os.path.exists(software_path):
             raise SoftwareNotFound(software_name, version)
         return software_path
     raise SoftwareNotFound(software_name, version)
 
 
-def check_software_install(software_name, version):
-    '''Performs checks on the installation of required software of the
-    required version'''
+def find_software_path(software_name, version):
+    '''Finds the path of the given software on $PATH, in the bashrc or from the user'''
     path = None
     which_software = which_software_path(software_name)
     if which_software != "" and which_software is not None:
@@ -261,14 +717,28 @@ def check_software_install(software_name, version):
         else:
             path = path[0]
     path = path.split(" ")[0]
-    path = path.strip()
-    current_version = find_software_ver(path)
+    return path.strip()
+
+def check_software_ver(software_name, version, current_version):
+    '''Checks the version of the software found is the required version'''
     vers_exp = re.compile(r'\d\.')
     cur_version = vers_exp.findall(current_version)
     req_version = vers_exp.findall(version)
-    req_version = vers_exp.findall(version)
     if not set(req_version).issubset(cur_version):
         raise SoftwareNotFound(software_name, version)
+
+def check_software_install(software_name, version):
+    '''Performs checks on the installation of required software of the
+    required version'''
+    path = find_software_path(software_name, version)
+    check_software_ver(software_name, version, cached_software_ver(path))
+    return path
+
+async def async_check_software_install(software_name, version):
+    '''Performs the checks of check_software_install, finding the version of the
+    software with an asyncio subprocess'''
+    path = find_software_path(software_name, version)
+    check_software_ver(software_name, version, await async_cached_software_ver(path))
     return path
 
 def get_name_and_exten(filepath):
@@ -302,8 +772,9 @@ def extract_warnings(war_out):
         count = count + 1
     return warns
 
-def process_gmsh_error(err, out, input_name, log_path):
-    '''Displays the errors and/or warnings from gmsh output when meshing'''
+def process_gmsh_error(err, out, input_name, log_path, interactive=True):
+    '''Displays the errors and/or warnings from gmsh output when meshing, asking the
+    user whether to continue after warnings unless the run isn't interactive'''
     en_exp = re.compile(r'(\d+) errors')
     wn_exp = re.compile(r'(\d+) warnings')
     err_num = en_exp.findall(err)
@@ -330,6 +801,9 @@ def process_gmsh_error(err, out, input_name, log_path):
     warnings = extract_warnings(err)
     warnings = ','.join(warnings)
     print("Warning: "+ warnings)
+    if not interactive or not PROMPTS['interactive']:
+        print("Continuing mesh generation of " + input_name + " (see " + log_path + ")")
+        return
     cont = ""
     while cont not in ('y', 'n'):
         cont = input("Continue mesh generation? (y/n): ").lower()
@@ -337,40 +811,1085 @@ def process_gmsh_error(err, out, input_name, log_path):
         exit_tool()
 
 def gmsh_from_stl(soft_dict, mesh_config_dict, input_filepath, input_name, log_foldr, \
-mesh_filename, mesh_name):
+mesh_filename, mesh_name, gmsh_options=None, remesh_surface=False, log_suffix='', timeout=None):
     '''Performs volumetric meshing on an STL file using gmsh and a geo script file'''
-    meshing_options = mesh_config_dict.keys()
-    opts_lst = []
-    for opt in meshing_options:
-        if not opt in ['software', 'format', 'name']:
-            opts_lst.append('-'+opt)
-            opts_lst.append(str(mesh_config_dict[opt]))
     #Generates a logging folder in which to store any output from gmsh meshing command
-    log_file = log_foldr +'/'+mesh_name + '_gmsh.log'
-    geofile = make_geo(input_filepath, input_name)
-    mesh_cmd = [soft_dict['gmsh'][1]]+ opts_lst+['-3', '-o', mesh_filename, '-format', \
-    mesh_config_dict['format'], geofile, '-log', log_file]
-    mesh_out, mesh_err = launcher(mesh_cmd, True)
+    log_file = log_foldr +'/'+mesh_name + '_gmsh' + log_suffix + '.log'
+    geofile = make_geo(input_filepath, input_name, gmsh_options, remesh_surface)
+    mesh_cmd = gmsh_volume_cmd(soft_dict, mesh_config_dict, geofile, mesh_filename, log_file)
+    mesh_out, mesh_err = launcher(mesh_cmd, True, timeout)
     if mesh_err not in ("", None):
         process_gmsh_error(mesh_err, mesh_out, input_name, log_file)
-    print("Volumetric mesh (", mesh_filename, ") generated with", \
-    find_nodes_elements(mesh_out, log_file))
-    mv_tmp_cmd = ['mv', geofile, '.tmp']
-    launcher(mv_tmp_cmd)
+    nodes_elements = find_nodes_elements(mesh_out, log_file)
+    print("Volumetric mesh (", mesh_filename, ") generated with", nodes_elements)
+    move_to_tmp(geofile)
+    return [int(count.split()[0]) for count in nodes_elements.split(' and ')]
 
-def make_geo(stl_filepath, stl_filename):
-    '''Writes a geo script to mesh with gmsh'''
+def gmsh_volume_cmd(soft_dict, mesh_config_dict, geofile, mesh_filename, log_file):
+    '''Returns the gmsh command which meshes the volume of a geo script'''
+    mesh_cmd = [soft_dict['gmsh'][1], '-3', '-o', mesh_filename, '-format', \
+    mesh_file_format(mesh_config_dict), geofile, '-log', log_file]
+    if str(mesh_config_dict.get('binary', 'false')).lower() == 'true':
+        mesh_cmd.insert(-2, '-bin')
+    return mesh_cmd
+
+#gmsh options which only affect the volume mesh, a cached surface mesh is reused when only
+#these change
+GMSH_VOLUME_OPTIONS = ['Mesh.Algorithm3D', 'Mesh.Optimize', 'Mesh.OptimizeNetgen',
+                       'Mesh.OptimizeThreshold', 'Mesh.QualityType', 'General.NumThreads',
+                       'Mesh.MaxNumThreads1D', 'Mesh.MaxNumThreads2D', 'Mesh.MaxNumThreads3D']
+
+#Bytes read at a time when hashing a file
+DIGEST_BLOCK_SIZE = 1 << 20
+
+def file_digest(filepath):
+    '''Returns the sha256 of a file, read in blocks so large STLs are not held in memory'''
+    import hashlib
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(DIGEST_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def surface_cache_filepath(soft_dict, stl_digest, gmsh_options, remesh_surface):
+    '''Returns the file in which the surface mesh of an STL is cached, keyed by the STL, the
+    gmsh executable and the gmsh options which affect the surface'''
+    gmsh_path = os.path.realpath(soft_dict['gmsh'][1])
+    gmsh_stat = os.stat(gmsh_path)
+    surface_options = {option: value for option, value in (gmsh_options or {}).items()
+                       if option not in GMSH_VOLUME_OPTIONS}
+    surface_key = config_hash({'stl': stl_digest, 'remesh_surface': remesh_surface,
+                               'gmsh_options': surface_options,
+                               'gmsh': [gmsh_path, gmsh_stat.st_size, gmsh_stat.st_mtime_ns]})
+    return os.path.join(os.path.dirname(software_cache_filepath()), 'surfaces',
+                        surface_key + '.msh')
+
+def gmsh_surface(soft_dict, input_filepath, input_name, log_foldr, mesh_name, surface_filepath,
+                 gmsh_options=None, remesh_surface=False, log_suffix='', timeout=None,
+                 interactive=True):
+    '''Generates the surface mesh of an STL with gmsh (the 2D phase of meshing) and caches it,
+    the file is replaced atomically so concurrent runs never read a partial surface'''
+    log_file = log_foldr +'/'+mesh_name + '_gmsh' + log_suffix + '_surface.log'
+    geofile = make_geo(input_filepath, input_name + '_surface', gmsh_options, remesh_surface,
+                       volume=False)
+    os.makedirs(os.path.dirname(surface_filepath), exist_ok=True)
+    tmp_filepath = surface_filepath[:-len('.msh')] + '.' + str(os.getpid()) + '.' + \
+    str(threading.get_ident()) + '.msh'
+    surface_cmd = [soft_dict['gmsh'][1], '-2', '-o', tmp_filepath, '-format', 'msh41', geofile,
+                   '-log', log_file]
+    try:
+        surface_out, surface_err = launcher(surface_cmd, True, timeout)
+        if surface_err not in ("", None):
+            process_gmsh_error(surface_err, surface_out, input_name, log_file, interactive)
+        os.replace(tmp_filepath, surface_filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+    print("Surface mesh of", input_name, "cached in", surface_filepath)
+    move_to_tmp(geofile)
+
+def cached_surface(soft_dict, input_filepath, input_name, log_foldr, mesh_name, stl_digest,
+                   gmsh_options, remesh_surface, run_report, log_suffix='', timeout=None,
+                   interactive=True):
+    '''Returns the cached surface mesh of the STL for the gmsh options, generating it on a
+    miss, and whether it was already cached'''
+    surface_filepath = surface_cache_filepath(soft_dict, stl_digest, gmsh_options,
+                                              remesh_surface)
+    hit = os.path.isfile(surface_filepath)
+    with RUN_REPORT_LOCK:
+        count_cache(run_report.setdefault('caches', {}), 'surface_mesh', hit)
+    if not hit:
+        gmsh_surface(soft_dict, input_filepath, input_name, log_foldr, mesh_name,
+                     surface_filepath, gmsh_options, remesh_surface, log_suffix, timeout,
+                     interactive)
+    return surface_filepath, hit
+
+def gmsh_with_fallbacks(soft_dict, mesh_config_dict, input_filepath, input_name, log_foldr,
+                        mesh_filename, mesh_name, run_report, timeout=None):
+    '''Meshes the STL with gmsh, retrying with each configured fallback (e.g. another
+    3D algorithm, a coarser size or a re-triangulated surface) if meshing fails or
+    times out'''
+    base_options = mesh_config_dict.get('gmsh_options', {})
+    attempts = [{}] + mesh_config_dict.get('fallbacks', [])
+    surface_cache = str(mesh_config_dict.get('surface_cache', 'true')).lower() == 'true'
+    stl_digest = file_digest(input_filepath) if surface_cache else None
+    for attempt, fallback in enumerate(attempts):
+        gmsh_options = {**base_options, **fallback.get('gmsh_options', {})}
+        remesh_surface = fallback.get('remesh_surface', False)
+        log_suffix = '' if attempt == 0 else '_fallback' + str(attempt)
+        start = time.perf_counter()
+        attempt_report = {'attempt': attempt, 'gmsh_options': gmsh_options,
+                          'remesh_surface': remesh_surface}
+        try:
+            mesh_input, mesh_remesh = input_filepath, remesh_surface
+            if surface_cache:
+                #The volume is meshed from the cached surface, which only depends on the
+                #surface options, so sweeps and retries of 3D options skip the 2D phase
+                mesh_input, hit = cached_surface(soft_dict, input_filepath, input_name,
+                                                 log_foldr, mesh_name, stl_digest, gmsh_options,
+                                                 remesh_surface, run_report, log_suffix, timeout)
+                attempt_report['surface_cache'] = 'hit' if hit else 'miss'
+                mesh_remesh = False
+            nodes, elements = gmsh_from_stl(soft_dict, mesh_config_dict, mesh_input,
+                                            input_name, log_foldr, mesh_filename, mesh_name,
+                                            gmsh_options, mesh_remesh, log_suffix, timeout)
+            with RUN_REPORT_LOCK:
+                run_report['sizes'].update({'nodes': nodes, 'elements': elements})
+            status, error = 'success', None
+        except (GmshError, LauncherError, StageTimeoutError) as err:
+            status = 'timeout' if isinstance(err, StageTimeoutError) else 'failed'
+            error = err
+        attempt_report.update({'status': status,
+                               'duration': round(time.perf_counter() - start, 3)})
+        with RUN_REPORT_LOCK:
+            run_report['mesh_attempts'].append(attempt_report)
+        write_run_report(run_report)
+        if error is None:
+            return attempt
+        if attempt == len(attempts) - 1:
+            raise error
+        print(error)
+        print("\nRetrying with fallback " + str(attempt + 1) + ": " + str(attempts[attempt + 1])
+              + "\n")
+
+#Modes of a race of gmsh configurations, keeping the first valid mesh or the best of them all
+RACE_MODES = ['first', 'best']
+
+def tet_quality(msh_filepath):
+    '''Returns a cheap quality score of an MSH mesh, the minimum and mean of the mean ratio
+    of its tetrahedra (1 for a regular tetrahedron, 0 for a flat one)'''
+    np = import_numpy()
+    coords, tets, _ = mesh_tetrahedra(read_msh(msh_filepath))
+    corners = coords[tets[:, :4]]
+    edges = corners[:, [edge[1] for edge in TET_EDGES]] - \
+    corners[:, [edge[0] for edge in TET_EDGES]]
+    volumes = np.abs(np.einsum('ij,ij->i', edges[:, 0],
+                               np.cross(edges[:, 1], edges[:, 2]))) / 6
+    ratios = 12 * np.cbrt(3 * volumes) ** 2 / np.einsum('ijk,ijk->i', edges, edges)
+    return {'min_quality': round(float(ratios.min()), 4),
+            'mean_quality': round(float(ratios.mean()), 4)}
+
+async def race_candidate(entry, soft_dict, mesh_config_dict, input_name, geofile, mesh_filename,
+                         log_file, cores, start, score=False, timeout=None):
+    '''Meshes the volume with one configuration of a race once its share of the cores is
+    free, recording its timings in its entry of the run report'''
+    import asyncio
+    async with cores:
+        entry.update({'status': 'running',
+                      'started': round(time.perf_counter() - start, 3)})
+        try:
+            mesh_cmd = gmsh_volume_cmd(soft_dict, mesh_config_dict, geofile, mesh_filename,
+                                       log_file)
+            mesh_out, mesh_err = await async_launcher(mesh_cmd, True, timeout)
+            if mesh_err not in ("", None):
+                #Candidates never prompt, a candidate with warnings still finishes
+                process_gmsh_error(mesh_err, mesh_out, input_name, log_file, False)
+            nodes_elements = find_nodes_elements(mesh_out, log_file)
+            entry.update(zip(['nodes', 'elements'], [int(count.split()[0]) for count in
+                                                     nodes_elements.split(' and ')]))
+            if score:
+                entry['quality'] = await asyncio.to_thread(tet_quality, mesh_filename)
+        finally:
+            entry['duration'] = round(time.perf_counter() - start - entry['started'], 3)
+
+def gmsh_race(soft_dict, mesh_config_dict, input_filepath, input_name, log_foldr,
+              mesh_filename, mesh_name, run_report, timeout=None):
+    '''Meshes the STL with several gmsh configurations at once under a shared core budget,
+    keeping the first valid mesh and stopping the others, or waiting for all of them and
+    keeping the mesh with the best quality score'''
+    import asyncio
+    race = mesh_config_dict['race']
+    mode = race.get('mode', 'first')
+    candidates = race['candidates']
+    #The cores are shared between the candidates run at once, the others wait for a share
+    num_cores = race.get('cores', os.cpu_count() or 1)
+    running = min(len(candidates), num_cores)
+    threads = max(1, num_cores // running)
+    surface_cache = str(mesh_config_dict.get('surface_cache', 'true')).lower() == 'true'
+    stl_digest = file_digest(input_filepath) if surface_cache else None
+    mesh_base, mesh_exten = os.path.splitext(mesh_filename)
+    entries, errors, geofiles = [], {}, []
+    for candidate, config in enumerate(candidates):
+        gmsh_options = {**mesh_config_dict.get('gmsh_options', {}),
+                        'General.NumThreads': threads, **config.get('gmsh_options', {})}
+        remesh_surface = config.get('remesh_surface', False)
+        entry = {'candidate': candidate, 'gmsh_options': gmsh_options,
+                 'remesh_surface': remesh_surface, 'status': 'waiting',
+                 'mesh_filename': mesh_base + '_race' + str(candidate) + mesh_exten,
+                 'log_file': log_foldr + '/' + mesh_name + '_gmsh_race' + str(candidate) + '.log'}
+        entries.append(entry)
+        mesh_input = input_filepath
+        try:
+            if surface_cache:
+                #Candidates which only differ in volume options share the cached surface
+                mesh_input, hit = cached_surface(soft_dict, input_filepath, input_name,
+                                                 log_foldr, mesh_name, stl_digest, gmsh_options,
+                                                 remesh_surface, run_report,
+                                                 '_race' + str(candidate), timeout, False)
+                entry['surface_cache'] = 'hit' if hit else 'miss'
+                remesh_surface = False
+        except (GmshError, LauncherError, StageTimeoutError) as err:
+            entry['status'] = 'timeout' if isinstance(err, StageTimeoutError) else 'failed'
+            errors[candidate] = err
+            continue
+        geofiles.append(make_geo(mesh_input, input_name + '_race' + str(candidate),
+                                 gmsh_options, remesh_surface))
+        entry['geofile'] = geofiles[-1]
+
+    async def run_race():
+        cores = asyncio.Semaphore(running)
+        start = time.perf_counter()
+        tasks = {asyncio.ensure_future(race_candidate(
+            entry, soft_dict, mesh_config_dict, input_name, entry['geofile'],
+            entry['mesh_filename'], entry['log_file'], cores, start, mode == 'best',
+            timeout)): entry
+                 for entry in entries if entry['status'] == 'waiting'}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                entry = tasks[task]
+                entry['finished'] = round(time.perf_counter() - start, 3)
+                try:
+                    task.result()
+                    entry['status'] = 'success'
+                except (GmshError, LauncherError, StageTimeoutError, InputError) as err:
+                    entry['status'] = 'timeout' if isinstance(err, StageTimeoutError) \
+                    else 'failed'
+                    errors[entry['candidate']] = err
+            if mode == 'first' and any(tasks[task]['status'] == 'success' for task in done):
+                #The losers still meshing are stopped, along with their process trees
+                for task in pending:
+                    tasks[task]['status'] = 'stopped' if \
+                    tasks[task]['status'] == 'running' else 'cancelled'
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                pending = set()
+
+    try:
+        asyncio.run(run_race())
+    finally:
+        for entry in entries:
+            for key in ('geofile', 'log_file'):
+                entry.pop(key, None)
+        for geofile in geofiles:
+            move_to_tmp(geofile)
+    successes = [entry for entry in entries if entry['status'] == 'success']
+    if mode == 'first':
+        winner = min(successes, key=lambda entry: entry['finished'], default=None)
+    else:
+        winner = max(successes, key=lambda entry: (entry['quality']['min_quality'],
+                                                   entry['quality']['mean_quality']),
+                     default=None)
+    for entry in entries:
+        candidate_filename = entry.pop('mesh_filename')
+        if winner is entry:
+            os.replace(candidate_filename, mesh_filename)
+        elif os.path.exists(candidate_filename):
+            os.remove(candidate_filename)
+    with RUN_REPORT_LOCK:
+        run_report['race'] = {'mode': mode, 'cores': num_cores, 'threads': threads,
+                              'winner': None if winner is None else winner['candidate'],
+                              'candidates': entries}
+    write_run_report(run_report)
+    for candidate, err in sorted(errors.items()):
+        print("Race candidate " + str(candidate) + " " + entries[candidate]['status'] + ":",
+              err)
+    if winner is None:
+        raise errors[min(errors)]
+    with RUN_REPORT_LOCK:
+        run_report['sizes'].update({'nodes': winner['nodes'], 'elements': winner['elements']})
+    print("Volumetric mesh (", mesh_filename, ") generated by race candidate",
+          winner['candidate'], "with", winner['nodes'], "nodes and", winner['elements'],
+          "elements")
+    return winner['candidate']
+
+def mesh_file_format(mesh_config_dict):
+    '''Returns the format of the mesh file written by the mesher, FFEA files are
+    exported from an msh file'''
+    return 'msh' if mesh_config_dict['format'] == 'ffea' else mesh_config_dict['format']
+
+def make_geo(stl_filepath, stl_filename, gmsh_options=None, remesh_surface=False, volume=True):
+    '''Writes a geo script to mesh with gmsh, only the surface is meshed if volume is False'''
     geofilename = stl_filename + '.geo'
     try:
         gfile = open(geofilename, 'w')
+        for option, value in (gmsh_options or {}).items():
+            if isinstance(value, str):
+                value = '"' + value + '"'
+            gfile.write(option + ' = ' + str(value) + ';\n')
         gfile.write('Merge "' + stl_filepath + '";\n')
-        gfile.write("Surface Loop(1) = {1};\n")
-        gfile.write("Volume(1) = {1};\n")
+        if remesh_surface:
+            #Re-triangulates the surface, decimating it when coarser mesh sizes are set
+            gfile.write("ClassifySurfaces{40 * Pi/180, 1, 0, Pi};\n")
+            gfile.write("CreateGeometry;\n")
+        if not volume:
+            pass
+        elif remesh_surface or stl_filepath.endswith('.msh'):
+            #Re-triangulated and cached surfaces may be split into several surfaces
+            gfile.write("Surface Loop(1) = Surface{:};\n")
+            gfile.write("Volume(1) = {1};\n")
+        else:
+            gfile.write("Surface Loop(1) = {1};\n")
+            gfile.write("Volume(1) = {1};\n")
         gfile.close()
     except OSError as exception:
         raise OSError(exception)
     return geofilename
 
+#Number of nodes of each MSH element type
+MSH_ELEMENT_NODES = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, 10: 9, 11: 10, 12: 27,
+                     13: 18, 14: 14, 15: 1, 16: 8, 17: 20, 18: 15, 19: 13}
+#Number of nodes/elements of a block read or written at once when streaming a mesh
+MSH_CHUNK_ROWS = 65536
+MSH_COMPRESSION = {'gz': 'gzip', 'bz2': 'bz2', 'xz': 'lzma'}
+
+def open_msh(msh_filepath, mode):
+    '''Opens a mesh file, which is (de)compressed on the fly if it ends with .gz,
+    .bz2 or .xz'''
+    exten = msh_filepath.rsplit('.', 1)[-1]
+    if exten in MSH_COMPRESSION:
+        compression = __import__(MSH_COMPRESSION[exten])
+        return compression.open(msh_filepath, mode)
+    return open(msh_filepath, mode)
+
+def msh_read_line(msh_file):
+    '''Reads the next non-empty line of a mesh file'''
+    line = msh_file.readline()
+    while line.strip() == b'':
+        if line == b'':
+            raise InputError('mesh file', '\nUnexpected end of the mesh file')
+        line = msh_file.readline()
+    return line.strip()
+
+def msh_read_header(msh_file, binary, byteorder, types):
+    '''Reads the header of a section or block, given by the struct types of its
+    values e.g. iiiQ'''
+    if binary:
+        import struct
+        header_format = byteorder + types
+        return list(struct.unpack(header_format, msh_file.read(struct.calcsize(header_format))))
+    return [int(value) for value in msh_read_line(msh_file).split()]
+
+def msh_write_header(msh_file, binary, types, values):
+    '''Writes the header of a section or block'''
+    if binary:
+        import struct
+        msh_file.write(struct.pack('<' + types, *values))
+    else:
+        msh_file.write((' '.join(str(value) for value in values) + '\n').encode())
+
+def msh_read_rows(msh_file, binary, byteorder, rows, columns, dtype):
+    '''Reads rows of a node or element block into an array'''
+    np = import_numpy()
+    if binary:
+        dtype = np.dtype(dtype).newbyteorder(byteorder)
+        values = np.frombuffer(msh_file.read(rows * columns * dtype.itemsize), dtype=dtype)
+    else:
+        lines = b''.join(msh_file.readline() for _ in range(rows))
+        values = np.fromstring(lines, dtype=dtype, sep=' ')
+    if values.size != rows * columns:
+        raise InputError('mesh file', '\nUnexpected end of a block in the mesh file')
+    return values.reshape(rows, columns)
+
+def msh_write_rows(msh_file, binary, rows):
+    '''Writes rows of a node or element block from an array'''
+    if binary:
+        msh_file.write(rows.astype(rows.dtype.newbyteorder('<'), copy=False).tobytes())
+    elif rows.size > 0:
+        #17 significant digits read back to the same double
+        value_format = '%d' if rows.dtype.kind in 'iu' else '%.17g'
+        row_format = ' '.join([value_format] * rows.shape[1]) + '\n'
+        msh_file.write(((row_format * rows.shape[0]) % tuple(rows.ravel().tolist())).encode())
+
+def msh_read_data(msh_file, binary, byteorder, rows, num_components):
+    '''Reads rows of a data section, each the tag of a node or element and its values'''
+    np = import_numpy()
+    if binary:
+        dtype = np.dtype([('tag', byteorder + 'i4'), ('values', byteorder + 'f8',
+                                                      (num_components,))])
+        data = np.frombuffer(msh_file.read(rows * dtype.itemsize), dtype=dtype)
+        return data['tag'].astype(np.int64), data['values'].reshape(rows, num_components)
+    values = msh_read_rows(msh_file, binary, byteorder, rows, 1 + num_components, 'f8')
+    return values[:, 0].astype(np.int64), values[:, 1:]
+
+def msh_write_data(msh_file, binary, tags, values):
+    '''Writes rows of a data section'''
+    np = import_numpy()
+    if binary:
+        data = np.empty(len(tags), dtype=[('tag', '<i4'), ('values', '<f8', (values.shape[1],))])
+        data['tag'] = tags
+        data['values'] = values
+        msh_file.write(data.tobytes())
+    elif len(tags) > 0:
+        row_format = '%d' + ' %.17g' * values.shape[1] + '\n'
+        rows = np.column_stack([tags.astype(object), values]).ravel().tolist()
+        msh_file.write(((row_format * len(tags)) % tuple(rows)).encode())
+
+def msh_chunks(rows):
+    '''Splits the rows of a block into chunks of at most MSH_CHUNK_ROWS'''
+    return [min(MSH_CHUNK_ROWS, rows - start) for start in range(0, rows, MSH_CHUNK_ROWS)]
+
+def read_msh_entities(msh_file, binary, byteorder):
+    '''Reads the points, curves, surfaces and volumes of the $Entities section'''
+    np = import_numpy()
+    counts = msh_read_header(msh_file, binary, byteorder, 'QQQQ')
+    entities = []
+    for dim, count in enumerate(counts):
+        for _ in range(count):
+            #Points have coordinates, other entities have a bounding box and boundary
+            num_floats = 3 if dim == 0 else 6
+            if binary:
+                tag = msh_read_header(msh_file, binary, byteorder, 'i')[0]
+                floats = msh_read_rows(msh_file, binary, byteorder, 1, num_floats, 'f8')[0]
+                physicals = msh_read_rows(msh_file, binary, byteorder, 1,
+                    msh_read_header(msh_file, binary, byteorder, 'Q')[0], 'i4')[0]
+                bounding = []
+                if dim > 0:
+                    bounding = msh_read_rows(msh_file, binary, byteorder, 1,
+                        msh_read_header(msh_file, binary, byteorder, 'Q')[0], 'i4')[0]
+            else:
+                values = msh_read_line(msh_file).split()
+                tag = int(values[0])
+                floats = np.array(values[1:1 + num_floats], dtype=np.float64)
+                num_physicals = int(values[1 + num_floats])
+                physicals = [int(v) for v in values[2 + num_floats:2 + num_floats + num_physicals]]
+                bounding = [int(v) for v in values[3 + num_floats + num_physicals:]]
+            entities.append((dim, tag, [float(f) for f in floats], [int(p) for p in physicals],
+                             [int(b) for b in bounding]))
+    return entities
+
+def write_msh_entities(msh_file, binary, entities):
+    '''Writes the $Entities section from the entities read by read_msh_entities'''
+    counts = [len([entity for entity in entities if entity[0] == dim]) for dim in range(4)]
+    msh_write_header(msh_file, binary, 'QQQQ', counts)
+    for dim, tag, floats, physicals, bounding in entities:
+        if binary:
+            types = 'i' + 'd' * len(floats) + 'Q' + 'i' * len(physicals)
+            values = [tag] + floats + [len(physicals)] + physicals
+            if dim > 0:
+                types = types + 'Q' + 'i' * len(bounding)
+                values = values + [len(bounding)] + bounding
+            msh_write_header(msh_file, binary, types, values)
+        else:
+            values = [str(tag)] + ['%.17g' % f for f in floats] + [str(len(physicals))] \
+            + [str(p) for p in physicals]
+            if dim > 0:
+                values = values + [str(len(bounding))] + [str(b) for b in bounding]
+            msh_file.write((' '.join(values) + '\n').encode())
+
+def iter_msh(msh_file):
+    '''Reads an MSH 4.1 mesh (ASCII or binary) as a stream of items, yielding node
+    and element blocks in chunks so the whole mesh is never held in memory'''
+    binary = False
+    byteorder = '<'
+    while True:
+        line = msh_file.readline()
+        if line == b'':
+            return
+        section = line.strip()
+        if section == b'':
+            continue
+        if section == b'$MeshFormat':
+            version, file_type, data_size = msh_read_line(msh_file).split()
+            if version != b'4.1' or data_size != b'8':
+                raise UnsupportedError('MSH version ' + version.decode() + ' (data size '
+                                       + data_size.decode() + ')', ['4.1 (data size 8)'])
+            binary = file_type == b'1'
+            if binary:
+                #The integer 1 written in binary gives the byte order of the file
+                byteorder = '<' if msh_file.read(4) == b'\x01\x00\x00\x00' else '>'
+            yield 'format', binary
+        elif section == b'$PhysicalNames':
+            names = []
+            for _ in range(int(msh_read_line(msh_file))):
+                names.append(msh_read_line(msh_file))
+            yield 'physical_names', names
+        elif section == b'$Entities':
+            yield 'entities', read_msh_entities(msh_file, binary, byteorder)
+        elif section == b'$Nodes':
+            num_blocks = msh_read_header(msh_file, binary, byteorder, 'QQQQ')
+            yield 'nodes', num_blocks
+            for _ in range(num_blocks[0]):
+                block = msh_read_header(msh_file, binary, byteorder, 'iiiQ')
+                yield 'node_block', block
+                for rows in msh_chunks(block[3]):
+                    yield 'node_tags', msh_read_rows(msh_file, binary, byteorder, rows, 1, 'u8')
+                #Parametric nodes also have a coordinate for each dimension of the entity
+                columns = 3 + (block[0] if block[2] else 0)
+                for rows in msh_chunks(block[3]):
+                    yield 'node_coords', msh_read_rows(msh_file, binary, byteorder, rows,
+                                                       columns, 'f8')
+        elif section == b'$Elements':
+            num_blocks = msh_read_header(msh_file, binary, byteorder, 'QQQQ')
+            yield 'elements', num_blocks
+            for _ in range(num_blocks[0]):
+                block = msh_read_header(msh_file, binary, byteorder, 'iiiQ')
+                if block[2] not in MSH_ELEMENT_NODES:
+                    raise UnsupportedError('MSH element type ' + str(block[2]),
+                                           [str(t) for t in MSH_ELEMENT_NODES])
+                yield 'element_block', block
+                for rows in msh_chunks(block[3]):
+                    yield 'element_rows', msh_read_rows(msh_file, binary, byteorder, rows,
+                        1 + MSH_ELEMENT_NODES[block[2]], 'u8')
+        elif section in (b'$NodeData', b'$ElementData'):
+            #The tags of data sections are always ASCII
+            tags = []
+            for _ in range(3):
+                tags.append([msh_read_line(msh_file) for _ in range(int(msh_read_line(
+                    msh_file)))])
+            yield 'data', [section[1:].decode()] + tags
+            num_components, num_rows = int(tags[2][1]), int(tags[2][2])
+            for rows in msh_chunks(num_rows):
+                yield 'data_rows', msh_read_data(msh_file, binary, byteorder, rows,
+                                                 num_components)
+        else:
+            raise UnsupportedError('MSH section ' + section.decode(), ['$MeshFormat',
+                                   '$PhysicalNames', '$Entities', '$Nodes', '$Elements',
+                                   '$NodeData', '$ElementData'])
+        end = msh_read_line(msh_file)
+        if end != b'$End' + section[1:]:
+            raise InputError('mesh file', '\nExpected $End' + section[1:].decode() +
+                             ' in the mesh file but found ' + end[:40].decode(errors='replace'))
+        yield 'end', section[1:].decode()
+
+def write_msh_item(msh_file, binary, kind, value):
+    '''Writes an item read by iter_msh as ASCII or binary'''
+    if kind == 'format':
+        msh_file.write(b'$MeshFormat\n4.1 ' + (b'1' if binary else b'0') + b' 8\n')
+        if binary:
+            msh_file.write((1).to_bytes(4, 'little') + b'\n')
+    elif kind == 'physical_names':
+        msh_file.write(b'$PhysicalNames\n' + str(len(value)).encode() + b'\n')
+        msh_file.write(b''.join(name + b'\n' for name in value))
+    elif kind == 'entities':
+        msh_file.write(b'$Entities\n')
+        write_msh_entities(msh_file, binary, value)
+    elif kind in ('nodes', 'elements'):
+        msh_file.write(b'$' + kind.capitalize().encode() + b'\n')
+        msh_write_header(msh_file, binary, 'QQQQ', value)
+    elif kind in ('node_block', 'element_block'):
+        msh_write_header(msh_file, binary, 'iiiQ', value)
+    elif kind == 'data':
+        msh_file.write(b'$' + value[0].encode() + b'\n')
+        for tags in value[1:]:
+            msh_file.write(str(len(tags)).encode() + b'\n' + b''.join(tag + b'\n' for tag in tags))
+    elif kind == 'data_rows':
+        msh_write_data(msh_file, binary, *value)
+    elif kind == 'end':
+        #Binary data is followed by a newline before the end of the section
+        if binary and value not in ('MeshFormat', 'PhysicalNames'):
+            msh_file.write(b'\n')
+        msh_file.write(b'$End' + value.encode() + b'\n')
+    else:
+        msh_write_rows(msh_file, binary, value)
+
+def convert_msh(src_filepath, dst_filepath, binary):
+    '''Converts an MSH 4.1 mesh between ASCII and binary, (de)compressing it by the
+    extensions of the files, and returns the read and write throughput in MB/s'''
+    read_time = 0.0
+    write_time = 0.0
+    with open_msh(src_filepath, 'rb') as src_file, open_msh(dst_filepath, 'wb') as dst_file:
+        items = iter_msh(src_file)
+        while True:
+            start = time.perf_counter()
+            item = next(items, None)
+            read_time = read_time + time.perf_counter() - start
+            if item is None:
+                break
+            start = time.perf_counter()
+            write_msh_item(dst_file, binary, *item)
+            write_time = write_time + time.perf_counter() - start
+    read_mb = os.path.getsize(src_filepath) / 1e6
+    write_mb = os.path.getsize(dst_filepath) / 1e6
+    return {'read_mb': read_mb, 'read_mb_s': read_mb / max(read_time, 1e-9),
+            'write_mb': write_mb, 'write_mb_s': write_mb / max(write_time, 1e-9)}
+
+def print_conversion(src_filepath, dst_filepath, binary):
+    '''Converts a mesh given with --convert and prints the throughput'''
+    throughput = convert_msh(src_filepath, dst_filepath, binary)
+    print("Converted " + src_filepath + " to " + ('binary ' if binary else 'ASCII ') +
+          dst_filepath)
+    print("Read {read_mb:.1f} MB at {read_mb_s:.1f} MB/s, wrote {write_mb:.1f} MB at "
+          "{write_mb_s:.1f} MB/s".format(**throughput))
+
+def compress_file(filepath, compression):
+    '''Compresses a file into a gz, bz2 or xz container, replacing the original'''
+    archive_filepath = filepath + '.' + compression
+    with open(filepath, 'rb') as in_file, open_msh(archive_filepath, 'wb') as archive:
+        shutil.copyfileobj(in_file, archive, 1024 * 1024)
+    os.remove(filepath)
+    return archive_filepath
+
+def compress_mesh(mesh_filepath, compression):
+    '''Compresses the mesh into a gz, bz2 or xz container for archiving, replacing
+    the uncompressed mesh'''
+    archive_filepath = compress_file(mesh_filepath, compression)
+    print("Mesh compressed to " + archive_filepath)
+    return archive_filepath
+
+def read_msh(msh_filepath):
+    '''Reads an MSH 4.1 mesh into arrays, keeping its blocks so it can be written back'''
+    np = import_numpy()
+    mesh = {'binary': False, 'physical_names': [], 'entities': [], 'node_blocks': [],
+            'element_blocks': [], 'data': []}
+    with open_msh(msh_filepath, 'rb') as msh_file:
+        for kind, value in iter_msh(msh_file):
+            if kind == 'format':
+                mesh['binary'] = value
+            elif kind in ('physical_names', 'entities'):
+                mesh[kind] = value
+            elif kind == 'node_block':
+                mesh['node_blocks'].append([value, [], []])
+            elif kind == 'node_tags':
+                mesh['node_blocks'][-1][1].append(value[:, 0])
+            elif kind == 'node_coords':
+                mesh['node_blocks'][-1][2].append(value)
+            elif kind == 'element_block':
+                mesh['element_blocks'].append([value, []])
+            elif kind == 'element_rows':
+                mesh['element_blocks'][-1][1].append(value)
+            elif kind == 'data':
+                mesh['data'].append([value, [], []])
+            elif kind == 'data_rows':
+                mesh['data'][-1][1].append(value[0])
+                mesh['data'][-1][2].append(value[1])
+    for block in mesh['node_blocks']:
+        block[1] = np.concatenate(block[1]) if block[1] else np.zeros(0, np.uint64)
+        block[2] = np.concatenate(block[2]) if block[2] else np.zeros((0, 3))
+    for block in mesh['element_blocks']:
+        block[1] = np.concatenate(block[1]) if block[1] else \
+        np.zeros((0, 1 + MSH_ELEMENT_NODES[block[0][2]]), np.uint64)
+    for data in mesh['data']:
+        data[1] = np.concatenate(data[1]) if data[1] else np.zeros(0, np.int64)
+        data[2] = np.concatenate(data[2]) if data[2] else np.zeros((0, int(data[0][3][1])))
+    return mesh
+
+def msh_items(mesh):
+    '''Yields the items of a mesh read by read_msh in the order they are written'''
+    yield 'format', mesh['binary']
+    yield 'end', 'MeshFormat'
+    if mesh['physical_names']:
+        yield 'physical_names', mesh['physical_names']
+        yield 'end', 'PhysicalNames'
+    if mesh['entities']:
+        yield 'entities', mesh['entities']
+        yield 'end', 'Entities'
+    for section, blocks, tags in (('Nodes', mesh['node_blocks'], lambda b: b[1]),
+                                  ('Elements', mesh['element_blocks'], lambda b: b[1][:, 0])):
+        all_tags = [tags(block) for block in blocks if len(tags(block)) > 0]
+        num_rows = sum(len(block_tags) for block_tags in all_tags)
+        yield section.lower(), [len(blocks), num_rows,
+                                min([int(t.min()) for t in all_tags], default=0),
+                                max([int(t.max()) for t in all_tags], default=0)]
+        for block in blocks:
+            yield section.lower()[:-1] + '_block', block[0][:3] + [len(block[1])]
+            if section == 'Nodes':
+                yield 'node_tags', block[1][:, None]
+                yield 'node_coords', block[2]
+            else:
+                yield 'element_rows', block[1]
+        yield 'end', section
+    for header, tags, values in mesh.get('data', []):
+        yield 'data', header
+        yield 'data_rows', (tags, values)
+        yield 'end', header[0]
+
+def write_msh(msh_filepath, mesh):
+    '''Writes a mesh read by read_msh, in the encoding it was read in'''
+    with open_msh(msh_filepath, 'wb') as msh_file:
+        for kind, value in msh_items(mesh):
+            write_msh_item(msh_file, mesh['binary'], kind, value)
+
+def mesh_nodes(mesh):
+    '''Returns the tags and coordinates of all the nodes of a mesh, and an array
+    mapping node tags to their index'''
+    np = import_numpy()
+    tags = np.concatenate([block[1] for block in mesh['node_blocks']]).astype(np.int64)
+    coords = np.concatenate([block[2][:, :3] for block in mesh['node_blocks']])
+    index = np.full(int(tags.max()) + 1 if len(tags) else 1, -1, dtype=np.int64)
+    index[tags] = np.arange(len(tags))
+    return tags, coords, index
+
+#Faces of a tetrahedron ordered so their normals point outwards
+TET_FACES = [[1, 2, 3], [0, 3, 2], [0, 1, 3], [0, 2, 1]]
+#Edges of a quadratic tetrahedron in FFEA's order, and the columns of gmsh's
+#10-node tetrahedron (type 11) which are the midpoints of those edges
+TET_EDGES = [[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]]
+GMSH_TET10_EDGES = [4, 6, 7, 5, 9, 8]
+#Columns of the midpoints of the edges of each face of a quadratic tetrahedron
+FACE_EDGE_COLUMNS = [[7, 9, 8], [6, 9, 5], [4, 8, 6], [5, 7, 4]]
+
+def unique_rows(rows, num_values):
+    '''Returns the inverse and counts of the unique sorted rows of node indices,
+    hashing each row into a single integer when it fits in 64 bits'''
+    np = import_numpy()
+    rows = np.sort(rows, axis=1)
+    if num_values ** rows.shape[1] < 2 ** 63:
+        keys = np.zeros(len(rows), dtype=np.int64)
+        for column in range(rows.shape[1]):
+            keys = keys * num_values + rows[:, column]
+        _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True,
+                                              return_counts=True)
+    else:
+        _, first, inverse, counts = np.unique(rows, axis=0, return_index=True,
+                                              return_inverse=True, return_counts=True)
+    return first, inverse.ravel(), counts
+
+def mesh_tetrahedra(mesh):
+    '''Returns the node coordinates, the tetrahedra of a mesh as node indices, with
+    4 or 10 (gmsh order) nodes per tetrahedron, and the element tags of the tetrahedra'''
+    np = import_numpy()
+    tags, coords, index = mesh_nodes(mesh)
+    tet_blocks = [block[1] for block in mesh['element_blocks'] if block[0][2] in (4, 11)]
+    if tet_blocks == []:
+        raise InputError('mesh file', '\nThe mesh does not contain any tetrahedra')
+    if len(set(block.shape[1] for block in tet_blocks)) > 1:
+        raise UnsupportedError('mesh with linear and quadratic tetrahedra',
+                               ['linear', 'quadratic'])
+    tets = np.concatenate(tet_blocks).astype(np.int64)
+    return coords, index[tets[:, 1:]], tets[:, 0]
+
+def write_text_rows(text_file, rows):
+    '''Writes the rows of an array as lines of text in chunks'''
+    for start in range(0, len(rows), MSH_CHUNK_ROWS):
+        msh_write_rows(text_file, False, rows[start:start + MSH_CHUNK_ROWS])
+
+def export_ffea(mesh_filepath, mesh_name, element_order=2):
+    '''Writes the FFEA node, topology and surface files of a tetrahedral mesh.
+    Surface faces are those which belong to a single tetrahedron, found by hashing the
+    sorted nodes of every face, and linear tetrahedra are made quadratic by adding a
+    node at the midpoint of every (hashed) edge when element_order is 2'''
+    np = import_numpy()
+    coords, tets, _ = mesh_tetrahedra(read_msh(mesh_filepath))
+    #Orient every tetrahedron to have a positive volume so faces point outwards
+    corners = coords[tets[:, :4]]
+    volumes = np.einsum('ij,ij->i', np.cross(corners[:, 1] - corners[:, 0],
+                                             corners[:, 2] - corners[:, 0]),
+                        corners[:, 3] - corners[:, 0])
+    if tets.shape[1] == 10:
+        tets = tets[:, [0, 1, 2, 3] + GMSH_TET10_EDGES]
+        if element_order == 1:
+            tets = tets[:, :4]
+    flip = volumes < 0
+    #Swapping corners 1 and 2 swaps the midpoints of edges 0-1/0-2 and 1-3/2-3
+    tets[flip] = tets[flip][:, [0, 2, 1, 3, 5, 4, 6, 7, 9, 8][:tets.shape[1]]]
+    num_nodes = len(coords)
+    if element_order == 2 and tets.shape[1] == 4:
+        edges = tets[:, TET_EDGES].reshape(-1, 2)
+        first, inverse, _ = unique_rows(edges, num_nodes)
+        coords = np.concatenate([coords, coords[edges[first]].mean(axis=1)])
+        tets = np.concatenate([tets, num_nodes + inverse.reshape(-1, 6)], axis=1)
+        num_nodes = len(coords)
+    #Faces found once are on the surface
+    faces = tets[:, TET_FACES].reshape(-1, 3)
+    _, inverse, counts = unique_rows(faces, num_nodes)
+    on_surface = counts[inverse] == 1
+    surface_faces = faces[on_surface]
+    face_tets = np.nonzero(on_surface)[0] // 4
+    #Surface nodes (including midpoints of surface edges) and elements come first
+    surface_node = np.zeros(num_nodes, dtype=bool)
+    surface_node[surface_faces] = True
+    if tets.shape[1] == 10:
+        face_columns = np.array(FACE_EDGE_COLUMNS)[np.nonzero(on_surface)[0] % 4]
+        surface_node[tets[face_tets[:, None], face_columns]] = True
+    #Only nodes used by the tetrahedra are written
+    used = np.zeros(num_nodes, dtype=bool)
+    used[tets] = True
+    node_order = np.concatenate([np.nonzero(used & surface_node)[0],
+                                 np.nonzero(used & ~surface_node)[0]])
+    new_node = np.empty(num_nodes, dtype=np.int64)
+    new_node[node_order] = np.arange(len(node_order))
+    surface_tet = np.zeros(len(tets), dtype=bool)
+    surface_tet[face_tets] = True
+    tet_order = np.concatenate([np.nonzero(surface_tet)[0], np.nonzero(~surface_tet)[0]])
+    new_tet = np.empty(len(tets), dtype=np.int64)
+    new_tet[tet_order] = np.arange(len(tets))
+    num_surface_nodes = int((used & surface_node).sum())
+    num_surface_tets = int(surface_tet.sum())
+    node_filepath = mesh_name + '.node'
+    with open(node_filepath, 'wb') as node_file:
+        node_file.write(('ffea node file\nnum_nodes ' + str(len(node_order)) +
+                         '\nnum_surface_nodes ' + str(num_surface_nodes) +
+                         '\nnum_interior_nodes ' + str(len(node_order) - num_surface_nodes) +
+                         '\nsurface nodes:\n').encode())
+        write_text_rows(node_file, coords[node_order[:num_surface_nodes]])
+        node_file.write(b'interior nodes:\n')
+        write_text_rows(node_file, coords[node_order[num_surface_nodes:]])
+    top_filepath = mesh_name + '.top'
+    tets = new_node[tets[tet_order]]
+    with open(top_filepath, 'wb') as top_file:
+        top_file.write(('ffea topology file\nnum_elements ' + str(len(tets)) +
+                        '\nnum_surface_elements ' + str(num_surface_tets) +
+                        '\nnum_interior_elements ' + str(len(tets) - num_surface_tets) +
+                        '\nsurface elements:\n').encode())
+        write_text_rows(top_file, tets[:num_surface_tets])
+        top_file.write(b'interior elements:\n')
+        write_text_rows(top_file, tets[num_surface_tets:])
+    surf_filepath = mesh_name + '.surf'
+    with open(surf_filepath, 'wb') as surf_file:
+        surf_file.write(('ffea surface file\nnum_surface_faces ' + str(len(surface_faces)) +
+                         '\nfaces:\n').encode())
+        write_text_rows(surf_file, np.column_stack([new_tet[face_tets],
+                                                    new_node[surface_faces]]))
+    print("FFEA files saved as " + ', '.join([node_filepath, top_filepath, surf_filepath]) +
+          " (" + str(len(tets)) + " elements, " + str(len(node_order)) + " nodes, " +
+          str(len(surface_faces)) + " surface faces)")
+    return [node_filepath, top_filepath, surf_filepath]
+
+RENUMBER_METHODS = ['rcm', 'hilbert', 'morton']
+
+def spread_bits(values):
+    '''Spreads the lowest 21 bits of each value so two zero bits follow each bit'''
+    np = import_numpy()
+    values = values.astype(np.uint64) & np.uint64(0x1fffff)
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+                        (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3),
+                        (2, 0x1249249249249249)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+def morton_keys(grid):
+    '''Returns the Morton (Z-order) index of integer grid coordinates'''
+    np = import_numpy()
+    return (spread_bits(grid[:, 0]) << np.uint64(2)) | (spread_bits(grid[:, 1]) << np.uint64(1)) \
+    | spread_bits(grid[:, 2])
+
+def hilbert_keys(grid, bits=21):
+    '''Returns the Hilbert index of integer grid coordinates, by transposing them
+    to the Hilbert curve (Skilling, 2004) and interleaving the bits of the result'''
+    np = import_numpy()
+    grid = grid.astype(np.uint64)
+    top = np.uint64(1 << (bits - 1))
+    quad = top
+    while quad > 1:
+        low = quad - np.uint64(1)
+        for axis in range(3):
+            bit_set = (grid[:, axis] & quad) != 0
+            #Invert the low bits of the first axis or exchange them with this axis
+            grid[bit_set, 0] ^= low
+            swap = (grid[~bit_set, 0] ^ grid[~bit_set, axis]) & low
+            grid[~bit_set, 0] ^= swap
+            grid[~bit_set, axis] ^= swap
+        quad = quad >> np.uint64(1)
+    #Gray encode
+    grid[:, 1] ^= grid[:, 0]
+    grid[:, 2] ^= grid[:, 1]
+    flips = np.zeros(len(grid), dtype=np.uint64)
+    quad = top
+    while quad > 1:
+        flips[(grid[:, 2] & quad) != 0] ^= quad - np.uint64(1)
+        quad = quad >> np.uint64(1)
+    grid ^= flips[:, None]
+    return morton_keys(grid)
+
+def node_graph(mesh, index):
+    '''Returns the edges between every pair of nodes which share an element of the
+    highest dimension in the mesh, as node indices'''
+    np = import_numpy()
+    max_dim = max(block[0][0] for block in mesh['element_blocks'])
+    edges = []
+    for block in mesh['element_blocks']:
+        if block[0][0] != max_dim:
+            continue
+        nodes = index[block[1][:, 1:].astype(np.int64)]
+        for first in range(nodes.shape[1]):
+            for second in range(first + 1, nodes.shape[1]):
+                edges.append(nodes[:, [first, second]])
+    return np.concatenate(edges)
+
+def bandwidth_profile(edges, rank, num_nodes):
+    '''Returns the bandwidth and profile of the node adjacency matrix when the
+    nodes are ordered by rank'''
+    np = import_numpy()
+    ranked = rank[edges]
+    lowest = np.arange(num_nodes)
+    np.minimum.at(lowest, ranked.max(axis=1), ranked.min(axis=1))
+    return int(np.abs(ranked[:, 0] - ranked[:, 1]).max()), int((np.arange(num_nodes) -
+                                                                lowest).sum())
+
+def renumber_order(method, coords, edges):
+    '''Returns the new order of the nodes by reverse Cuthill-McKee on the node graph
+    or by a Hilbert or Morton space-filling curve through the node coordinates'''
+    np = import_numpy()
+    if method == 'rcm':
+        try:
+            from scipy.sparse import coo_matrix
+            from scipy.sparse.csgraph import reverse_cuthill_mckee
+        except ImportError as ie:
+            print('\n----------------Import Error----------------\n')
+            print('Error: {}'
+                  '\nTry installing using:\npip install scipy'.format(ie))
+            exit_tool()
+        graph = coo_matrix((np.ones(len(edges), dtype=np.int32), (edges[:, 0], edges[:, 1])),
+                           shape=(len(coords), len(coords))).tocsr()
+        return reverse_cuthill_mckee(graph, symmetric_mode=False)
+    span = coords.max(axis=0) - coords.min(axis=0)
+    grid = ((coords - coords.min(axis=0)) / max(span.max(), 1e-300) * (2 ** 21 - 1)).astype(
+        np.uint64)
+    keys = hilbert_keys(grid) if method == 'hilbert' else morton_keys(grid)
+    return np.argsort(keys, kind='stable')
+
+def renumber_mesh(mesh_filepath, method):
+    '''Renumbers the nodes of a mesh, and reorders its elements by their lowest
+    renumbered node, to improve memory locality for solvers, rewriting the mesh in
+    place. Returns the bandwidth and profile before and after'''
+    np = import_numpy()
+    mesh = read_msh(mesh_filepath)
+    tags, coords, index = mesh_nodes(mesh)
+    edges = node_graph(mesh, index)
+    before = bandwidth_profile(edges, np.arange(len(tags)), len(tags))
+    order = renumber_order(method, coords, edges)
+    rank = np.empty(len(tags), dtype=np.int64)
+    rank[order] = np.arange(len(tags))
+    after = bandwidth_profile(edges, rank, len(tags))
+    #Node tags follow the new order, nodes stay within the blocks of their entities
+    new_tags = np.zeros(len(index), dtype=np.uint64)
+    new_tags[tags] = rank + 1
+    for block in mesh['node_blocks']:
+        block_tags = new_tags[block[1].astype(np.int64)]
+        block_order = np.argsort(block_tags, kind='stable')
+        block[1] = block_tags[block_order]
+        block[2] = block[2][block_order]
+    max_element = max([int(block[1][:, 0].max()) for block in mesh['element_blocks']
+                       if len(block[1])] + [0])
+    new_elements = np.zeros(max_element + 1, dtype=np.int64)
+    for block in mesh['element_blocks']:
+        rows = block[1]
+        rows[:, 1:] = new_tags[rows[:, 1:].astype(np.int64)]
+        row_order = np.argsort(rows[:, 1:].min(axis=1), kind='stable')
+        rows = rows[row_order]
+        rows[:, 0] = np.sort(block[1][:, 0])
+        new_elements[block[1][row_order, 0].astype(np.int64)] = rows[:, 0]
+        block[1] = rows
+    #Node and element data (such as the partitions) follow their nodes and elements
+    for data in mesh['data']:
+        data_tags = (new_tags if data[0][0] == 'NodeData' else new_elements)[data[1]]
+        data_order = np.argsort(data_tags, kind='stable')
+        data[1] = data_tags[data_order].astype(np.int64)
+        data[2] = data[2][data_order]
+    write_msh(mesh_filepath, mesh)
+    stats = {'method': method, 'bandwidth_before': before[0], 'bandwidth_after': after[0],
+             'profile_before': before[1], 'profile_after': after[1]}
+    print("Renumbered " + mesh_filepath + " by " + method + ": bandwidth " + str(before[0]) +
+          " -> " + str(after[0]) + ", profile " + str(before[1]) + " -> " + str(after[1]))
+    return stats
+
+def tet_neighbours(tets, num_nodes):
+    '''Returns the pairs of tetrahedra which share a face, found by hashing faces'''
+    np = import_numpy()
+    faces = tets[:, TET_FACES].reshape(-1, 3)
+    _, inverse, _ = unique_rows(faces, num_nodes)
+    order = np.argsort(inverse, kind='stable')
+    shared = inverse[order[:-1]] == inverse[order[1:]]
+    return np.column_stack([order[:-1][shared] // 4, order[1:][shared] // 4])
+
+def split_counts(num_parts):
+    '''Splits a number of partitions into two halves'''
+    return num_parts // 2, num_parts - num_parts // 2
+
+def bisect_recursively(centroids, num_parts, split_axis):
+    '''Recursively bisects the elements at the point along split_axis(centroids)
+    which balances the elements between the partitions on either side'''
+    np = import_numpy()
+    parts = np.zeros(len(centroids), dtype=np.int64)
+    groups = [(np.arange(len(centroids)), num_parts, 0)]
+    while groups != []:
+        elements, group_parts, first_part = groups.pop()
+        if group_parts == 1:
+            parts[elements] = first_part
+            continue
+        left_parts, right_parts = split_counts(group_parts)
+        split = len(elements) * left_parts // group_parts
+        positions = centroids[elements] @ split_axis(centroids[elements])
+        order = np.argpartition(positions, split) if 0 < split < len(elements) else \
+        np.arange(len(elements))
+        groups.append((elements[order[:split]], left_parts, first_part))
+        groups.append((elements[order[split:]], right_parts, first_part + left_parts))
+    return parts
+
+def longest_axis(centroids):
+    '''Returns the axis along which the centroids are most extended'''
+    np = import_numpy()
+    axis = np.zeros(3)
+    if len(centroids) > 0:
+        axis[np.argmax(centroids.max(axis=0) - centroids.min(axis=0))] = 1
+    return axis
+
+def principal_axis(centroids):
+    '''Returns the axis of the largest variance (inertia) of the centroids'''
+    np = import_numpy()
+    if len(centroids) < 2:
+        return np.array([1.0, 0.0, 0.0])
+    eigenvalues, eigenvectors = np.linalg.eigh(np.cov(centroids, rowvar=False))
+    return eigenvectors[:, np.argmax(eigenvalues)]
+
+def partition_rcb(centroids, neighbours, num_parts):
+    '''Partitions elements by recursive coordinate bisection'''
+    return bisect_recursively(centroids, num_parts, longest_axis)
+
+def partition_inertial(centroids, neighbours, num_parts):
+    '''Partitions elements by recursive inertial bisection'''
+    return bisect_recursively(centroids, num_parts, principal_axis)
+
+def partition_metis(centroids, neighbours, num_parts):
+    '''Partitions the dual graph of the elements with METIS'''
+    np = import_numpy()
+    try:
+        import pymetis
+    except ImportError as ie:
+        print('\n----------------Import Error----------------\n')
+        print('Error: {}'
+              '\nTry installing using:\npip install pymetis'.format(ie))
+        exit_tool()
+    #Compressed adjacency of the dual graph, with each shared face in both directions
+    both = np.concatenate([neighbours, neighbours[:, ::-1]])
+    both = both[np.argsort(both[:, 0], kind='stable')]
+    xadj = np.concatenate([[0], np.cumsum(np.bincount(both[:, 0], minlength=len(centroids)))])
+    _, parts = pymetis.part_graph(num_parts, xadj=xadj, adjncy=both[:, 1])
+    return np.asarray(parts, dtype=np.int64)
+
+#Partitioners take the element centroids, the pairs of neighbouring elements and
+#the number of partitions, and return the partition of every element
+PARTITIONERS = {'rcb': partition_rcb, 'inertial': partition_inertial,
+                'metis': partition_metis}
+
+def default_partitioner():
+    '''Returns METIS when it is installed, otherwise recursive coordinate bisection'''
+    try:
+        import pymetis
+    except ImportError:
+        return 'rcb'
+    return 'metis'
+
+def partition_mesh(mesh_filepath, num_parts, method=None):
+    '''Partitions the tetrahedra of a mesh and stores the partition of every element
+    as the 'partition' element data of the mesh, rewriting it in place. Returns the
+    edge-cut (faces shared between partitions) and the load imbalance'''
+    np = import_numpy()
+    method = method or default_partitioner()
+    mesh = read_msh(mesh_filepath)
+    coords, tets, tags = mesh_tetrahedra(mesh)
+    centroids = coords[tets[:, :4]].mean(axis=1)
+    neighbours = tet_neighbours(tets[:, :4], len(coords))
+    parts = PARTITIONERS[method](centroids, neighbours, num_parts)
+    sizes = np.bincount(parts, minlength=num_parts)
+    edge_cut = int((parts[neighbours[:, 0]] != parts[neighbours[:, 1]]).sum())
+    imbalance = float(sizes.max() / (len(parts) / num_parts))
+    #Partitions are numbered from 1 as in gmsh
+    mesh['data'] = [data for data in mesh['data'] if data[0][1] != [b'"partition"']]
+    mesh['data'].append([['ElementData', [b'"partition"'], [b'0'],
+                          [b'0', b'1', str(len(tags)).encode()]], tags,
+                         (parts + 1)[:, None].astype(np.float64)])
+    write_msh(mesh_filepath, mesh)
+    stats = {'partitions': num_parts, 'method': method, 'edge_cut': edge_cut,
+             'shared_faces': len(neighbours), 'load_imbalance': round(imbalance, 4),
+             'min_elements': int(sizes.min()), 'max_elements': int(sizes.max())}
+    print("Partitioned " + mesh_filepath + " into " + str(num_parts) + " by " + method +
+          ": edge-cut " + str(edge_cut) + " of " + str(len(neighbours)) + " shared faces, "
+          "load imbalance " + str(round(imbalance, 4)))
+    return stats
+
 def change_user_script(study_name, case_name):
     '''Changes CodeSaturne's user script to point to the input mesh located in the /MESH folder'''
     #Find line number of script which needs changing
@@ -394,38 +1913,59 @@ def change_user_script(study_name, case_name):
         raise NotFoundinFile('domain.mesh_input = "../MESH/mesh_input.csm"', 'cs_user_scripts.py', \
         error_message)
 
-def cs_generate_volume(cs_prepro_path, mesh_filename, log_foldr):
+def cs_generate_volume(cs_prepro_path, mesh_filename, log_foldr, timeout=None):
     '''Runs post-volume using CodeSaturne's preprocessor which outputs information on a
     given volumetric mesh'''
     mesh_name, mesh_exten = get_name_and_exten(mesh_filename)
     cs_cmd = [cs_prepro_path, '--log', log_foldr+'/'+mesh_name+'_cspreprocessor.log',
               '--post-volume', mesh_filename]
-    cs_out, cs_err = launcher(cs_cmd, True)
+    cs_out, cs_err = launcher(cs_cmd, True, timeout)
     #Indicates the given mesh file is in 2D and has no volume
     if 'The mesh does not contain volume elements' in cs_out:
         raise CodeSaturneError('generating a volume', 'Ensure the mesh is defined in 3D')
     if cs_err != "":
         raise CodeSaturneError('generating a volume', '\n'+cs_err)
 
-def cs_prepare_files(study_name, case_name, cs_path):
+#Template study prepared once by the job server, which is copied for every case
+CS_TEMPLATE = {}
+
+def cs_template_study(cs_path, cache_dir, timeout=None):
+    '''Creates the template study which is copied instead of running code_saturne create'''
+    template = os.path.join(cache_dir, 'template_study')
+    hit = os.path.isdir(os.path.join(template, 'template_case'))
+    count_cache(METRICS['caches'], 'cs_template', hit)
+    if not hit:
+        shutil.rmtree(template, ignore_errors=True)
+        os.makedirs(cache_dir, exist_ok=True)
+        launcher([[cs_path, 'create', '--study', template, 'template_case', '--copy-ref']],
+                 timeout=timeout)
+    CS_TEMPLATE['study'] = template
+
+def cs_prepare_files(study_name, case_name, cs_path, timeout=None):
     '''Create a case and prepare the files and directories needed to run it'''
     #Create case
     case_cmd = [cs_path, 'create', '--study', study_name, case_name, '--copy-ref']
     #Create symbolic link to mesh file in /MESH
     symbl_cmd = ['ln', '-s', '-r', 'mesh_input.csm', study_name + '/MESH/']
-    #Copy reference data into /DATA
-    refd_cmd = ['cp', study_name +'/'+ case_name +'/DATA/REFERENCE/cs_user_scripts.py',
-                study_name +'/'+ case_name +'/DATA/']
-    launcher([case_cmd, symbl_cmd, refd_cmd])
+    if 'study' in CS_TEMPLATE:
+        #Copied rather than linked as the case is modified by the run
+        shutil.copytree(CS_TEMPLATE['study'], study_name, symlinks=True)
+        os.rename(study_name + '/template_case', study_name + '/' + case_name)
+        launcher([symbl_cmd], timeout=timeout)
+    else:
+        launcher([case_cmd, symbl_cmd], timeout=timeout)
+    #Link reference data into /DATA (sed -i replaces rather than edits the linked file)
+    link_or_copy(study_name +'/'+ case_name +'/DATA/REFERENCE/cs_user_scripts.py',
+                 study_name +'/'+ case_name +'/DATA/')
     #Change script file to point at csm mesh assuming the first occurance of
     #'domain.mesh_input = None' is the line to change
     change_user_script(study_name, case_name)
 
-def cs_run_quality(cs_path, study_name, case_name, wd_name):
+def cs_run_quality(cs_path, study_name, case_name, wd_name, timeout=None):
     '''Run the quality check using CodeSaturne's preprocessor'''
-    #Copy the /REFERENCE/cs_user_mesh.c into SRC folder
-    cp_mesh_cmd = ['cp', study_name+'/'+ case_name+'/SRC/REFERENCE/cs_user_mesh.c',
-                   study_name+'/'+ case_name+'/SRC']
+    #Link the /REFERENCE/cs_user_mesh.c into SRC folder
+    link_or_copy(study_name+'/'+ case_name+'/SRC/REFERENCE/cs_user_mesh.c',
+                 study_name+'/'+ case_name+'/SRC')
     #Run the data preparation stage
     run_init_cmd = [cs_path, 'run', '--case', study_name+'/'+ case_name, '--id',
                     wd_name, '--initialize']
@@ -434,33 +1974,71 @@ def cs_run_quality(cs_path, study_name, case_name, wd_name):
     +wd_name+'/', '--quality']
     #Check for run_solver.log file
     check_solv_cmd = ['ls', study_name+'/'+ case_name+'/RESU/'+wd_name+'/']
-    solv_out, solv_err = launcher([cp_mesh_cmd, run_init_cmd, run_solv_cmd, check_solv_cmd])
+    solv_out, solv_err = launcher([run_init_cmd, run_solv_cmd, check_solv_cmd],
+                                  timeout=timeout)
     solv_files = solv_out[-1].split('\n')
     if not 'run_solver.log' in solv_files:
         raise CodeSaturneError('running cs_solver --quality', 'Check for the generation of'
         'run_solver.log when running cs_solver script in', study_name+'/'+ case_name+'/RESU/'
         +wd_name+'/')
 
-def cs_prepro_quality(cs_prepro_path, cs_path, mesh_filename, log_foldr):
+def cs_quality_study(cs_path, mesh_filename, timeout=None):
+    '''Prepares the CodeSaturne study and case for the quality check of the mesh, which
+    doesn't need the mesh itself so can be prepared while it is generated'''
+    mesh_name, exten = get_name_and_exten(mesh_filename)
+    cs_prepare_files(mesh_name + '_study', mesh_name +'_case', cs_path, timeout)
+
+def cs_prepro_quality(cs_prepro_path, cs_path, mesh_filename, log_foldr, timeout=None,
+                      study_ready=False):
     '''Runs the steps required to generate a CodeSaturne case for the mesh and
-    generate information on its quality'''
+    generate information on its quality, unless the study is ready'''
     mesh_name, exten = get_name_and_exten(mesh_filename)
     case_name = mesh_name +'_case'
     study_name = mesh_name + '_study'
     wd_name = mesh_name +'_quality'
-    cs_generate_volume(cs_prepro_path, mesh_filename, log_foldr)
-    cs_prepare_files(study_name, case_name, cs_path)
-    cs_run_quality(cs_path, study_name, case_name, wd_name)
+    cs_generate_volume(cs_prepro_path, mesh_filename, log_foldr, timeout)
+    if not study_ready:
+        cs_quality_study(cs_path, mesh_filename, timeout)
+    cs_run_quality(cs_path, study_name, case_name, wd_name, timeout)
     quality_file = study_name+'/'+ case_name+'/RESU/'+wd_name+'/'+'run_solver.log'
-    qual_foldr_cmd = ['mkdir', mesh_name+'_quality']
-    cp_qual_cmd = ['cp', quality_file, mesh_name+'_quality/'+mesh_name+'_quality.log']
-    launcher([qual_foldr_cmd, cp_qual_cmd])
+    os.mkdir(mesh_name+'_quality')
+    link_or_copy(quality_file, mesh_name+'_quality/'+mesh_name+'_quality.log')
     #run_solver.log contains the output of the quality check (post-volume)
     return mesh_name+'_quality/'+mesh_name+'_quality.log'
 
 
-def extract_configs(yaml_file, input_exten, soft_dict):
-    '''Extract the configuration arguments from the yaml file'''
+def import_yaml():
+    '''Imports PyYAML only when a configuration file needs to be parsed'''
+    try:
+        import yaml
+    except ImportError as ie:
+        print('\n----------------Import Error----------------\n')
+        print('Error: {}'
+              '\nTry installing using:\npip install pyyaml'.format(ie))
+        exit_tool()
+    return yaml
+
+def load_configs(yaml_file):
+    '''Parses the yaml configuration file once so it can be shared by all checks'''
+    yaml = import_yaml()
+    #The C loader is used when PyYAML has been built with libyaml
+    loader = getattr(yaml, 'CLoader', yaml.Loader)
+    try:
+        with open(yaml_file, 'r') as stream:
+            user_config_dict = yaml.load(stream, Loader=loader)
+    except OSError as exception:
+        raise InputError(yaml_file, "\nUnable to read the configuration file: "+str(exception))
+    except yaml.YAMLError:
+        raise InputError(yaml_file, "\nPlease check the contents of your yaml "
+                         "configuration file \n(use http://www.yamllint.com/ to" 
+                         " check for formatting errors)")
+    if not isinstance(user_config_dict, dict):
+        raise InputError(yaml_file, "\nThe configuration file must contain 'option: value'"
+                         " pairs")
+    return user_config_dict
+
+def extract_configs(user_config_dict, input_exten, soft_dict):
+    '''Extract the configuration arguments from the parsed yaml file'''
     mesh_config_dict = {}
     map_config_dict = {}
     chi_config_dict = {}
@@ -469,17 +2047,27 @@ def extract_configs(yaml_file, input_exten, soft_dict):
     accepted_configs_dict = {'software':[['all'], 'mesh'], 'format':[['all'], 'mesh'],
                              'name':[['all'], 'mesh'], 'threshold':[['map', 'emd'], 'map'],
                              'dust_filter':[['map', 'emd'], 'map'],
+                             'dust_size':[['map', 'emd'], 'map'],
+                             'out_of_core':[['map', 'emd'], 'map'],
+                             'bin_factor':[['map', 'emd'], 'map'],
+                             'target_voxel_size':[['map', 'emd'], 'map'],
+                             'memory_limit':[['map', 'emd'], 'map'],
                              'probe_radius': [['pdb'], 'chi'],
-                             'grid_spacing':[['stl', 'pdb', 'map', 'emd'], 'chi']}
-    loader = yaml.Loader
+                             'grid_spacing':[['stl', 'pdb', 'map', 'emd'], 'chi'],
+                             'timeouts':[['all'], 'mesh'],
+                             'gmsh_options':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'fallbacks':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'race':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'binary':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'surface_cache':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'compress':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'element_order':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'renumber':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'partitions':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'partition_method':[['stl', 'pdb', 'map', 'emd'], 'mesh'],
+                             'budget':[['all'], 'mesh'],
+                             'retention':[['all'], 'mesh']}
     meshing_soft = {}
-    stream = open(yaml_file, 'r')
-    try:
-        user_config_dict = yaml.load(stream, Loader=loader)
-    except yaml.YAMLError:
-        raise InputError(yaml_file, "\nPlease check the contents of your yaml "
-                         "configuration file \n(use http://www.yamllint.com/ to" 
-                         " check for formatting errors)")
     user_configs = list(user_config_dict.keys())
     accepted_configs = list(accepted_configs_dict.keys())
     #Check the required configurations are provided
@@ -508,44 +2096,41 @@ def extract_configs(yaml_file, input_exten, soft_dict):
     meshing_soft[user_config_dict['software']] = [soft_dict[user_config_dict['software']][0]]
     return meshing_soft, mesh_config_dict, map_config_dict, chi_config_dict
 
-def software_checks(soft_dict):
+def software_checks(soft_dict, known_softs=None):
     '''Checks the required software is installed at the required version
     and updates the dictionary such that it now contains the path on the user's machine'''
     upd_soft_dict = {}
     for soft, ver in soft_dict.items():
+        #Software already found at the required version (e.g. by the job server) is reused
+        if known_softs is not None and known_softs.get(soft, [None])[0] == ver[0]:
+            upd_soft_dict[soft] = known_softs[soft]
+            continue
         path = check_software_install(soft, ver[0])
         upd_soft_dict[soft] = [ver[0], path]
     return upd_soft_dict
 
+async def async_software_checks(soft_dict, known_softs=None):
+    '''Performs the checks of software_checks, running the --version of every software
+    at once'''
+    import asyncio
+    upd_soft_dict = {}
+    softs = []
+    for soft, ver in soft_dict.items():
+        if known_softs is not None and known_softs.get(soft, [None])[0] == ver[0]:
+            upd_soft_dict[soft] = known_softs[soft]
+        else:
+            softs.append((soft, ver))
+    paths = await asyncio.gather(*[async_check_software_install(soft, ver[0])
+                                   for soft, ver in softs])
+    for (soft, ver), path in zip(softs, paths):
+        upd_soft_dict[soft] = [ver[0], path]
+    return upd_soft_dict
+
 def paraview_vis_surface(pv_path, mesh_filename):
     '''Launches the resultant mesh file in Paraview'''
     vis_mesh_cmd = [pv_path, mesh_filename]
     vis_mesh_out, vis_mesh_err = launcher(vis_mesh_cmd)
 
-def extract_hist_data(data_lines, quality_file):
-    '''Finds the frequency and upper and lower bounds of each histogram bin in the quality file'''
-    bins = []
-    freqs = []
-    count = 0
-    while count < len(data_lines):
-        cur_freq = re.search(r"=.*(\d+)", data_lines[count]).group(1)
-        freqs.append(int(cur_freq))
-        bin_start = re.search(r"\[(.*);", data_lines[count]).group(1)
-        try:
-            val = float(bin_start)
-        except:
-            raise TypeError
-        bins.append(val)
-        if count == len(data_lines) -1:
-            bin_end = re.search(r";(.*)[\]\[]", data_lines[count]).group(1)
-            try:
-                val = float(bin_end)
-            except:
-                raise TypeError
-            bins.append(val)
-        count = count + 1
-    return bins, freqs
-
 def format_title(lines, hist_count):
     '''Formats the titles of each histogram'''
     #Strips white space colons and indexing digits
@@ -562,39 +2147,33 @@ def format_title(lines, hist_count):
         word_count = word_count + 1
     return new_title
 
-def save_histogram(title, bins, freqs, mesh_name):
-    '''Uses matplot lib to plot and save the histograms'''
-    try:
-        plt = importlib.import_module("matplotlib.pyplot")
-    except ImportError:
-        print('\n----------------Import Error----------------\n')
-        print('Error: {}'
-              '\nTry installing using:\npip install maplotlib'.format(ie))
+def import_matplotlib():
+    '''Imports the object-oriented matplotlib API with non-interactive backends'''
     try:
-        np = importlib.import_module("numpy")
+        from matplotlib.figure import Figure
+        #Captures the output log of matplotlib so this isn't displayed
+        logging.getLogger('matplotlib').setLevel(logging.WARNING)
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.backends.backend_pdf import PdfPages
     except ImportError as ie:
         print('\n----------------Import Error----------------\n')
         print('Error: {}'
-              '\nTry installing using:\npip install numpy'.format(ie))
-    #Captures the output log of matplotlib so this isn't displayed
-    plt_logger = logging.getLogger('matplotlib')
-    Logger.setLevel(level=logging.DEBUG)
-    fh = logging.StreamHandler()
-    fh_formatter = logging.Formatter('%(asctime)s %(levelname)s \
-    %(lineno)d:%(filename)s(%(process)d) - %(message)s')
-    fh.setFormatter(fh_formatter)
-    Logger.addHandler(fh)
+              '\nTry installing using:\npip install matplotlib'.format(ie))
+        exit_tool()
+    return Figure, FigureCanvasAgg, PdfPages
+
+def draw_histogram(axes, title, bins, freqs):
+    '''Draws a histogram on the given matplotlib axes'''
     values = range(len(bins))
     #Represents the bin values as decimals
     exp, new_bins = decimal_representation(bins)
-    freqs.insert(0, 0)
-    widths = [-1] * (len(values) -1)
-    widths.insert(0, 0)
-    cur_fig = plt.bar(x=values, tick_label=new_bins, height=freqs, width=widths, align="edge");
-    plt.xticks(fontsize = 6)
-    plt.title(title);
-    plt.ylabel('Frequency');
-    plt.margins(x=0);
+    heights = [0] + list(freqs)
+    widths = [0] + [-1] * (len(values) -1)
+    axes.bar(x=values, tick_label=new_bins, height=heights, width=widths, align="edge")
+    axes.tick_params(axis='x', labelsize=6)
+    axes.set_title(title)
+    axes.set_ylabel('Frequency')
+    axes.margins(x=0)
     #Implement superscripting
     if exp != 0:
         sup_script = str.maketrans("-0123456789", "⁻⁰¹²³⁴⁵⁶⁷⁸⁹")
@@ -602,10 +2181,40 @@ def save_histogram(title, bins, freqs, mesh_name):
         x_axis = ' '.join(title.split(' ')[3:]) + ' Factor (10' + sup_exp + ')'
     else:
         x_axis = ' '.join(title.split(' ')[3:])
-    plt.xlabel(x_axis);
-    file_name = mesh_name + '_'+title.replace(' ', '_') + '.pdf'
-    plt.savefig(mesh_name+'_quality/'+mesh_name+'_histograms/'+file_name);
-    plt.close();
+    axes.set_xlabel(x_axis)
+
+def save_histogram(title, bins, freqs, hist_filepath):
+    '''Plots and saves a single histogram to its own file'''
+    Figure, FigureCanvasAgg, PdfPages = import_matplotlib()
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    draw_histogram(fig.add_subplot(), title, bins, freqs)
+    fig.savefig(hist_filepath)
+    return hist_filepath
+
+def save_histogram_pages(histograms, hist_filepath):
+    '''Plots all the histograms as the pages of a single pdf'''
+    Figure, FigureCanvasAgg, PdfPages = import_matplotlib()
+    with PdfPages(hist_filepath) as pdf:
+        for hist in histograms:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            draw_histogram(fig.add_subplot(), hist['metric'], hist['bins'], hist['counts'])
+            pdf.savefig(fig)
+    return hist_filepath
+
+def save_histogram_grid(histograms, hist_filepath):
+    '''Plots all the histograms in a grid on a single png'''
+    Figure, FigureCanvasAgg, PdfPages = import_matplotlib()
+    cols = math.ceil(math.sqrt(len(histograms)))
+    rows = math.ceil(len(histograms) / cols)
+    fig = Figure(figsize=(6.4 * cols, 4.8 * rows), constrained_layout=True)
+    FigureCanvasAgg(fig)
+    for ind, hist in enumerate(histograms):
+        axes = fig.add_subplot(rows, cols, ind + 1)
+        draw_histogram(axes, hist['metric'], hist['bins'], hist['counts'])
+    fig.savefig(hist_filepath, dpi=100)
+    return hist_filepath
 
 def decimal_representation(floats):
     '''Returns a decimal representation of histogram bin bounds
@@ -631,108 +2240,227 @@ def decimal_representation(floats):
     exp = exp*-1
     return exp, new_floats
 
-def generate_histograms(quality_file, hist_title_lines, hist_start_lines,
-                        hist_end_lines, mesh_name):
-    '''Runs the functions required to create and save the histogram files'''
-    hist_count = 0
-    while hist_count < len(hist_title_lines):
-        cur_start = hist_start_lines[hist_count]
-        cur_end = hist_end_lines[hist_count]
-        cur_title = format_title(hist_title_lines, hist_count)
-        #Find the line numbers in the quality file where the data starts and ends
-        start_line = re.search(r"(\d+):.*", cur_start).group(1)
-        end_line = re.search(r"(\d+):", cur_end).group(1)
-        #Get all file content between these lines which are the data to plot
-        data_lines_cmd = ['sed', '-n', start_line+','+end_line+'p', quality_file]
-        data_lines_out, data_lines_err = launcher(data_lines_cmd)
-        data_lines = data_lines_out.split('\n')
-        data_lines = data_lines[:-1]
-        cur_bins, cur_freqs = extract_hist_data(data_lines, quality_file)
-        save_histogram(cur_title, cur_bins, cur_freqs, mesh_name)
-        hist_count = hist_count + 1
-
-def remove_hist_without_data(hist_titles_out, hist_titles, hist_start_out, min_vals, max_vals):
-    '''Prevents histograms without data from being plotted'''
-    line_re = re.compile(r'(\d+):')
-    title_lns = line_re.findall(hist_titles_out)
-    start_lns = line_re.findall(hist_start_out)
-    new_hist_titles = []
-    new_mins = []
-    new_maxs = []
-    title_count = 0
-    start_count = 0
-    while title_count < len(title_lns):
-        cur_start_ln = float(start_lns[start_count].replace('\n', ''))
-        cur_title_ln = float(title_lns[title_count].replace('\n', ''))
-        #All histograms with data have it 5 lines below their title
-        if cur_start_ln == cur_title_ln + 5:
-            start_count = start_count + 1
-            new_hist_titles.append(hist_titles[title_count])
-            new_mins.append(min_vals[title_count])
-            new_maxs.append(max_vals[title_count])
-        title_count = title_count + 1
-    return new_hist_titles, new_mins, new_maxs
-
-def remove_hist_min_max(hist_titles, min_vals, max_vals, hist_data_start, hist_data_end):
-    '''Removes histogram data with 0 as the minimum and the maximum'''
-    count = 0
-    while count < len(hist_titles):
-        if float(min_vals[count]) == 0 and float(max_vals[count]) == 0:
-            hist_titles.pop(count)
-            hist_data_start.pop(count)
-            hist_data_end.pop(count)
-        count = count + 1
-    return hist_titles, hist_data_start, hist_data_end
-
-def preprocess_hist_data(quality_file, mesh_name):
-    '''Returns the lines in the file with important data for histogram generation'''
-    #Finds the title lines
-    hist_titles_cmd = ['grep', 'Histogram of', quality_file, '-n']
-    hist_titles_out, hist_titles_err = launcher(hist_titles_cmd)
-    hist_titles = hist_titles_out.split('\n')
-    hist_titles.remove("")
-    #Finds the start and end lines of the data
-    hist_end_cmd = ['grep', r']', quality_file, '-n']
-    hist_start_cmd = ['grep', r'1 : \[', quality_file, '-n']
-    hstart_end_out, hstart_end_err = launcher([hist_start_cmd, hist_end_cmd])
-    hist_data_start = hstart_end_out[0].split('\n')
-    hist_data_end = hstart_end_out[1].split('\n')
-    hist_data_start.remove("")
-    hist_data_end.remove("")
-    #Finds the lines of the maximum and minimum value of each histogram
-    min_cmd = ['grep', 'minimum value = ', quality_file]
-    max_cmd = ['grep', 'maximum value = ', quality_file]
-    min_out, min_err = launcher(min_cmd)
-    max_out, max_err = launcher(max_cmd)
-    min_vals = min_out.replace('minimum value = ', '').strip().split('\n')
-    max_vals = max_out.replace('maximum value = ', '').strip().split('\n')
-    #Catches errors which may occur for the histogram data
-    if len(hist_data_start) != len(hist_data_end):
-        raise NotFoundinFile('an equal number of start and end data points for histograms', \
-        quality_file)
-    if len(min_vals) != len(max_vals):
-        raise NotFoundinFile('an equal number of maximum and minimum values for histograms', \
-        quality_file)
-    if len(hist_titles) != len(min_vals):
-        raise NotFoundinFile('maximum and minimum values for all histograms', quality_file)
-    if len(hist_data_end) != len(hist_titles):
-        hist_titles, min_vals, max_vals = remove_hist_without_data(hist_titles_out, hist_titles, \
-        hstart_end_out[0], min_vals, max_vals)
-    hist_titles, hist_data_start, hist_data_end = remove_hist_min_max(hist_titles, min_vals, \
-    max_vals, hist_data_start, hist_data_end)
-    return hist_titles, hist_data_start, hist_data_end
-
-def process_cs_quality(quality_file, save_hist, mesh_name):
-    '''Generates histograms if specified using the -hg flag'''
+def histograms_with_data(histograms):
+    '''Prevents histograms without data, or with 0 as the minimum and the maximum,
+    from being plotted'''
+    return [hist for hist in histograms if hist['counts'] != [] and
+            not (hist['minimum'] == 0 and hist['maximum'] == 0)]
+
+def generate_histograms(histograms, mesh_name, hist_layout='pdf', hist_workers=1):
+    '''Renders the histograms either as one pdf per histogram (in parallel worker
+    processes), as the pages of one pdf or as a grid on one png'''
+    hist_foldr = mesh_name+'_quality/'+mesh_name+'_histograms/'
+    histograms = histograms_with_data(histograms)
+    if histograms == []:
+        return []
+    if hist_layout == 'multipage':
+        return [save_histogram_pages(histograms, hist_foldr+mesh_name+'_histograms.pdf')]
+    if hist_layout == 'grid':
+        return [save_histogram_grid(histograms, hist_foldr+mesh_name+'_histograms.png')]
+    hist_args = [(hist['metric'], hist['bins'], hist['counts'],
+                  hist_foldr+mesh_name+'_'+hist['metric'].replace(' ', '_')+'.pdf')
+                 for hist in histograms]
+    hist_workers = min(hist_workers, len(hist_args))
+    if hist_workers <= 1:
+        return [save_histogram(*h_args) for h_args in hist_args]
+    import concurrent.futures
+    #Workers are started by the fork server, in its working directory
+    with concurrent.futures.ProcessPoolExecutor(max_workers=hist_workers,
+                                                mp_context=forkserver_context()) as executor:
+        futures = [executor.submit(save_histogram, *h_args[:3], os.path.abspath(h_args[3]))
+                   for h_args in hist_args]
+        return [future.result() for future in futures]
+
+def process_cs_quality(quality_file, save_hist, mesh_name, input_arg, input_format,
+                       configs_hash, run_directory, quality_db, hist_layout='pdf',
+                       hist_workers=1):
+    '''Writes a structured record of the quality check, appends it to the quality
+    database and generates histograms if specified using the -hg flag'''
+    record = make_quality_record(quality_file, mesh_name, input_arg, input_format,
+                                 configs_hash, run_directory)
+    json_filepath, csv_filepath = write_quality_record(record, mesh_name)
+    print("Quality record stored in "+ json_filepath + " and " + csv_filepath)
+    if quality_db is not None:
+        store_quality_record(quality_db, record)
+        print("Quality record appended to the database " + quality_db)
     if save_hist:
         print("\n----------HISTOGRAMS----------\n")
         hist_foldr_cmd = ['mkdir', mesh_name+'_quality/'+mesh_name + '_histograms']
         launcher(hist_foldr_cmd)
-        hist_titles, hist_data_start, hist_data_end = preprocess_hist_data(quality_file, mesh_name)
-        generate_histograms(quality_file, hist_titles, hist_data_start, hist_data_end, mesh_name)
-        print("Histograms successfully generated and stored as pdfs in /"+mesh_name+'_quality/'\
+        generate_histograms(record['histograms'], mesh_name, hist_layout, hist_workers)
+        print("Histograms successfully generated and stored in /"+mesh_name+'_quality/'\
         +mesh_name + '_histograms')
 
+def parse_quality_file(quality_file):
+    '''Parses the mesh statistics and every histogram (bins, counts, minimum and
+    maximum) in the quality file'''
+    stat_exp = re.compile(r'^\s*Number of ([A-Za-z][A-Za-z ]*?)\s*:\s*(\d+)\s*$')
+    min_exp = re.compile(r'minimum value =\s*(\S+)')
+    max_exp = re.compile(r'maximum value =\s*(\S+)')
+    data_exp = re.compile(r'^\s*\d+\s*:\s*\[\s*(\S+)\s*;\s*(\S+)\s*[\]\[]\s*=\s*(\d+)')
+    mesh_stats = {}
+    histograms = []
+    cur_hist = None
+    with open(quality_file, 'r') as qual_file:
+        for line in qual_file:
+            if 'Histogram of' in line:
+                cur_hist = {'metric': format_title([line], 0), 'minimum': None,
+                            'maximum': None, 'bins': [], 'counts': []}
+                histograms.append(cur_hist)
+                continue
+            stat = stat_exp.match(line)
+            if stat is not None:
+                mesh_stats[stat.group(1).lower().replace(' ', '_')] = int(stat.group(2))
+                continue
+            if cur_hist is None:
+                continue
+            min_val = min_exp.search(line)
+            max_val = max_exp.search(line)
+            data = data_exp.match(line)
+            if min_val is not None and isnumber(min_val.group(1)):
+                cur_hist['minimum'] = float(min_val.group(1))
+            elif max_val is not None and isnumber(max_val.group(1)):
+                cur_hist['maximum'] = float(max_val.group(1))
+            elif data is not None:
+                #Bins are stored as edges so there is one more bin than count
+                if cur_hist['bins'] == []:
+                    cur_hist['bins'].append(float(data.group(1)))
+                cur_hist['bins'].append(float(data.group(2)))
+                cur_hist['counts'].append(int(data.group(3)))
+    return mesh_stats, histograms
+
+def config_hash(config_dict):
+    '''Returns a short hash identifying a set of configurations'''
+    import hashlib
+    config_str = json.dumps(config_dict, sort_keys=True, default=str)
+    return hashlib.sha256(config_str.encode('utf-8')).hexdigest()[:16]
+
+def make_quality_record(quality_file, mesh_name, input_arg, input_format, configs_hash,
+                        run_directory):
+    '''Builds a structured record of the quality check of a mesh'''
+    mesh_stats, histograms = parse_quality_file(quality_file)
+    return {'input': input_arg, 'input_format': input_format, 'config_hash': configs_hash,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'mesh_name': mesh_name, 'run_directory': run_directory,
+            'quality_file': quality_file, 'mesh_stats': mesh_stats,
+            'histograms': histograms}
+
+def write_quality_record(record, mesh_name):
+    '''Writes the quality record as JSON and as a columnar CSV with one row per
+    histogram bin'''
+    import csv
+    record_name = mesh_name+'_quality/'+mesh_name+'_quality'
+    with open(record_name+'.json', 'w') as json_file:
+        json.dump(record, json_file, indent=2)
+    columns = ['input', 'input_format', 'config_hash', 'timestamp', 'mesh_name', 'metric',
+               'minimum', 'maximum', 'bin', 'bin_start', 'bin_end', 'count']
+    with open(record_name+'.csv', 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for hist in record['histograms']:
+            for ind, count in enumerate(hist['counts']):
+                writer.writerow([record['input'], record['input_format'],
+                                 record['config_hash'], record['timestamp'],
+                                 record['mesh_name'], hist['metric'], hist['minimum'],
+                                 hist['maximum'], ind + 1, hist['bins'][ind],
+                                 hist['bins'][ind+1], count])
+    return record_name+'.json', record_name+'.csv'
+
+def open_quality_db(db_filepath):
+    '''Opens (and creates if needed) the cross-run quality database'''
+    import sqlite3
+    os.makedirs(os.path.dirname(db_filepath), exist_ok=True)
+    #A timeout allows concurrent batch runs to append to the same database
+    connection = sqlite3.connect(db_filepath, timeout=60)
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            input TEXT, input_format TEXT, config_hash TEXT, timestamp TEXT,
+            mesh_name TEXT, run_directory TEXT, quality_file TEXT, mesh_stats TEXT);
+        CREATE TABLE IF NOT EXISTS histograms (
+            run_id INTEGER REFERENCES runs(id), metric TEXT,
+            minimum REAL, maximum REAL, bins TEXT, counts TEXT);
+        CREATE INDEX IF NOT EXISTS runs_input ON runs(input);
+        CREATE INDEX IF NOT EXISTS runs_config_hash ON runs(config_hash);
+        CREATE INDEX IF NOT EXISTS runs_timestamp ON runs(timestamp);
+        CREATE INDEX IF NOT EXISTS histograms_metric ON histograms(metric, run_id);
+        ''')
+    return connection
+
+def store_quality_record(db_filepath, record):
+    '''Appends the quality record of a run to the cross-run quality database'''
+    connection = open_quality_db(db_filepath)
+    try:
+        with connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (input, input_format, config_hash, timestamp, mesh_name,'
+                ' run_directory, quality_file, mesh_stats) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (record['input'], record['input_format'], record['config_hash'],
+                 record['timestamp'], record['mesh_name'], record['run_directory'],
+                 record['quality_file'], json.dumps(record['mesh_stats'])))
+            run_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO histograms (run_id, metric, minimum, maximum, bins, counts)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                [(run_id, hist['metric'], hist['minimum'], hist['maximum'],
+                  json.dumps(hist['bins']), json.dumps(hist['counts']))
+                 for hist in record['histograms']])
+    finally:
+        connection.close()
+    return run_id
+
+def quality_db_filepath():
+    '''Returns the default quality database, in the user's data directory so runs don't
+    leave a database in whichever directory they were started from'''
+    data_dir = os.environ.get('XDG_DATA_HOME', os.path.join(os.environ['HOME'], '.local',
+                                                            'share'))
+    return os.path.join(data_dir, 'bio_saturne-meshingtool', 'quality.db')
+
+def query_worst_meshes(db_filepath, metric, num):
+    '''Returns the worst meshes in the quality database for the given metric, with the
+    worst value of each mesh (input, name and configurations) over all its runs'''
+    if not os.path.isfile(db_filepath):
+        raise InputError('quality database', db_filepath + ' does not exist')
+    #Small cells are the worst for size metrics, large values are the worst otherwise
+    if 'volume' in metric.lower() or 'thickness' in metric.lower():
+        order, value, worst = 'ASC', 'minimum', 'MIN'
+    else:
+        order, value, worst = 'DESC', 'maximum', 'MAX'
+    #Metrics are matched exactly, with or without the 'Histogram of the' of their titles
+    names = [prefix + metric.lower().strip() for prefix in ('', 'histogram of ',
+                                                            'histogram of the ')]
+    import sqlite3
+    import urllib.parse
+    #Opened read-only so a query never creates or changes the database
+    connection = sqlite3.connect('file:' + urllib.parse.quote(db_filepath) + '?mode=ro',
+                                 uri=True, timeout=60)
+    try:
+        #The other columns are those of the run with the worst value of each mesh
+        rows = connection.execute(
+            'SELECT ' + worst + '(h.' + value + ') AS worst, h.metric, r.input, r.mesh_name,'
+            ' r.config_hash, r.timestamp, r.run_directory FROM histograms h'
+            ' JOIN runs r ON h.run_id = r.id'
+            ' WHERE LOWER(h.metric) IN (?, ?, ?) AND h.' + value + ' IS NOT NULL'
+            ' GROUP BY r.input, r.mesh_name, r.config_hash'
+            ' ORDER BY worst ' + order + ' LIMIT ?',
+            (*names, num)).fetchall()
+    except sqlite3.DatabaseError as err:
+        raise InputError('quality database', db_filepath + ' is not a quality database (' +
+                         str(err) + ')')
+    finally:
+        connection.close()
+    return value, rows
+
+def print_worst_meshes(db_filepath, metric, num):
+    '''Prints the worst meshes in the quality database for the given metric'''
+    value, rows = query_worst_meshes(db_filepath, metric, num)
+    print("\n----------WORST "+str(num)+" MESHES BY "+metric.upper()+"----------\n")
+    if rows == []:
+        print("No histograms of '"+metric+"' in "+db_filepath)
+    for row in rows:
+        print('%-12.5g %s | %s (%s) | config %s | %s | %s' % row)
+    print("\nValues shown are the worst " + value + " of each mesh over its runs")
+
 def make_logging_folder(mesh_name):
     '''Makes a logging directory for gmsh and CodeSaturne output'''
     log_foldr_cmd = ['mkdir', mesh_name+'_loggers']
@@ -741,9 +2469,8 @@ def make_logging_folder(mesh_name):
 
 def mesh_filename_preexist(mesh_name, mesh_exten):
     '''Checks if the given name for the mesh file already exists in the current directory'''
-    lsout, lserr = launcher(['ls'])
     mesh_filename = format_mesh_filename(mesh_name, mesh_exten)
-    if mesh_filename in lsout:
+    if mesh_filename in os.listdir('.'):
         cont = ""
         #Allows the user to enter a new file name or overwrite the pre-exsisting file
         print("WARNING: File of the name", mesh_filename, "already exists in the"
@@ -771,11 +2498,13 @@ def format_mesh_filename(mesh_name, mesh_exten):
         "(this name shouldn't include an extension)")
     return mesh_filename
 
-def check_mesh_filename(mesh_name, mesh_exten, input_name):
+def check_mesh_filename(mesh_name, mesh_exten, input_name, interactive=True):
     '''Checks the mesh filename'''
     #If it isn't provided the name of the input file is used partially
     if mesh_name is None:
         mesh_name = input_name + "_3d"
+    if not interactive:
+        return format_mesh_filename(mesh_name, mesh_exten)
     #Then check if the file already exsists
     mesh_filename = mesh_filename_preexist(mesh_name, mesh_exten)
     return mesh_filename
@@ -788,8 +2517,108 @@ def check_meshing_args(mesh_config_dict, supported_dict):
     if not mesh_config_dict['software'] in supported_dict['meshing_soft']:
         #Check the meshing software is supported
         raise UnsupportedError('configured meshing software', supported_dict['meshing_soft'])
+    if 'timeouts' in mesh_config_dict:
+        mesh_config_dict['timeouts'] = check_timeouts(mesh_config_dict['timeouts'],
+                                                      'timeouts')
+    check_gmsh_options(mesh_config_dict.get('gmsh_options', {}), 'gmsh_options')
+    if str(mesh_config_dict.get('binary', 'false')).lower() not in ('true', 'false'):
+        raise InputError('configurations', "\nInvalid value for argument 'binary' in the"
+                         " configuration file. This must be True or False")
+    if str(mesh_config_dict.get('surface_cache', 'true')).lower() not in ('true', 'false'):
+        raise InputError('configurations', "\nInvalid value for argument 'surface_cache' in"
+                         " the configuration file. This must be True or False")
+    if 'compress' in mesh_config_dict and mesh_config_dict['compress'] not in MSH_COMPRESSION:
+        raise UnsupportedError('configured mesh compression', list(MSH_COMPRESSION))
+    if 'renumber' in mesh_config_dict and mesh_config_dict['renumber'] not in RENUMBER_METHODS:
+        raise UnsupportedError('configured renumbering', RENUMBER_METHODS)
+    if 'partitions' in mesh_config_dict and (not isinstance(mesh_config_dict['partitions'], int)
+                                             or mesh_config_dict['partitions'] < 1):
+        raise InputError('configurations', "\nInvalid value for argument 'partitions' in the"
+                         " configuration file. This must be a positive integer")
+    if 'partition_method' in mesh_config_dict and \
+    mesh_config_dict['partition_method'] not in PARTITIONERS:
+        raise UnsupportedError('configured partitioning', list(PARTITIONERS))
+    budget = mesh_config_dict.get('budget', {})
+    if not isinstance(budget, dict) or not set(budget).issubset(['elements', 'memory_mb',
+                                                                  'runtime']) or \
+    not all(isnumber(limit) and float(limit) > 0 for limit in budget.values()):
+        raise InputError('budget', "\nThe budget must give positive limits for any of"
+                         " 'elements', 'memory_mb' and 'runtime' (seconds)")
+    check_retention(mesh_config_dict.get('retention', {}))
+    if mesh_config_dict.get('element_order', 2) not in (1, 2):
+        raise InputError('configurations', "\nInvalid value for argument 'element_order' in"
+                         " the configuration file. This must be 1 (linear) or 2 (quadratic)")
+    #Each fallback overrides the gmsh options and/or re-triangulates the surface
+    fallbacks = mesh_config_dict.get('fallbacks', [])
+    if not isinstance(fallbacks, list):
+        raise InputError('fallbacks', "\nFallbacks must be given as a list")
+    check_gmsh_variants(fallbacks, 'fallbacks', 'fallback')
+    if 'race' in mesh_config_dict:
+        check_race(mesh_config_dict)
+
+def check_retention(retention):
+    '''Checks the retention policy gives a supported action for any of the classes of files
+    after success and/or failure'''
+    outcomes = ['success', 'failure']
+    if not isinstance(retention, dict) or \
+    not set(retention).issubset(outcomes + ['compression']) or \
+    not all(isinstance(retention.get(outcome, {}), dict) and
+            set(retention.get(outcome, {})).issubset(RETENTION_CLASSES) for outcome in outcomes):
+        raise InputError('retention', "\nThe retention policy must give the action for any of"
+                         " " + ', '.join(RETENTION_CLASSES) + " after 'success' and/or"
+                         " 'failure'")
+    for outcome in outcomes:
+        if not set(retention.get(outcome, {}).values()).issubset(RETENTION_ACTIONS):
+            raise UnsupportedError('retention action', RETENTION_ACTIONS)
+    if retention.get('compression', 'gz') not in MSH_COMPRESSION:
+        raise UnsupportedError('retention compression', list(MSH_COMPRESSION))
+
+def check_gmsh_variants(variants, source, name):
+    '''Checks each fallback or race candidate overrides the gmsh options and/or
+    re-triangulates the surface'''
+    for variant in variants:
+        if not isinstance(variant, dict) or variant == {} or \
+        not set(variant).issubset(['gmsh_options', 'remesh_surface']):
+            raise InputError(source, "\nEach " + name + " must set 'gmsh_options' and/or"
+                             " 'remesh_surface'")
+        check_gmsh_options(variant.get('gmsh_options', {}), source)
+        if not isinstance(variant.get('remesh_surface', False), bool):
+            raise InputError(source, "\n'remesh_surface' must be true or false")
+
+def check_race(mesh_config_dict):
+    '''Checks the race gives at least two candidates and that its mode and cores are
+    supported'''
+    race = mesh_config_dict['race']
+    if not isinstance(race, dict) or not set(race).issubset(['mode', 'cores', 'candidates']) \
+    or not isinstance(race.get('candidates'), list) or len(race['candidates']) < 2:
+        raise InputError('race', "\nThe race must give a list of at least two 'candidates',"
+                         " and optionally its 'mode' and 'cores'")
+    check_gmsh_variants(race['candidates'], 'race', 'candidate')
+    if race.get('mode', 'first') not in RACE_MODES:
+        raise UnsupportedError('race mode', RACE_MODES)
+    if 'cores' in race and (not isinstance(race['cores'], int) or
+                            isinstance(race['cores'], bool) or race['cores'] < 1):
+        raise InputError('race', "\nThe cores of the race must be a positive integer")
+    if 'fallbacks' in mesh_config_dict:
+        raise InputError('race', "\nFallbacks can't be combined with a race, give them as"
+                         " candidates of the race instead")
+    if race.get('mode', 'first') == 'best' and mesh_file_format(mesh_config_dict) != 'msh':
+        raise InputError('race', "\nThe quality of the candidates of a 'best' race is scored"
+                         " from MSH meshes, so the format must be 'msh' or 'ffea'")
 
-def check_input_args(input_format, inp, supported_input, soft_dict, yaml_file):
+def check_gmsh_options(gmsh_options, source):
+    '''Checks gmsh options are given as 'Category.Option: value' pairs'''
+    if not isinstance(gmsh_options, dict):
+        raise InputError(source, "\ngmsh options must be given as 'Category.Option: value'"
+                         " e.g. 'Mesh.Algorithm3D: 10'")
+    for option, value in gmsh_options.items():
+        if not re.match(r'^[A-Z][A-Za-z]*\.[A-Za-z0-9]+$', str(option)) or \
+        not isinstance(value, (int, float, str)) or isinstance(value, bool):
+            raise InputError(source, "\nInvalid gmsh option '" + str(option) + ": " +
+                             str(value) + "', options must be given as 'Category.Option:"
+                             " value' e.g. 'Mesh.Algorithm3D: 10'")
+
+def check_input_args(input_format, inp, supported_input, soft_dict, user_config_dict):
     '''Check the input argument'''
     #Check the format of the input file is supported
     if input_format not in supported_input:
@@ -803,6 +2632,8 @@ def check_input_args(input_format, inp, supported_input, soft_dict, yaml_file):
             r" emd_{entry number} e.g. emd_3066")
     else:
         input_name, input_exten = get_name_and_exten(inp)
+        if not os.path.isfile(inp):
+            raise InputError('input file', '\n' + inp + ' does not exist')
         #Check the format of the input file matches the format argument given
         if input_exten != input_format:
             raise InputError('input file', '\nPlease ensure the input file is saved with'
@@ -810,16 +2641,10 @@ def check_input_args(input_format, inp, supported_input, soft_dict, yaml_file):
     #Add extra software requirements for map cleaning and generating an stl
     if input_format in ('map', 'emd'):
         soft_dict['ucsf-chimerax'] = ['1.3']
-        loader = yaml.Loader
-        stream = open(yaml_file, 'r')
-        try:
-            mesh_config_dict = yaml.load(stream, Loader=loader)
-        except yaml.YAMLError:
-            raise InputError(yaml_file, "\nPlease check the contents of your yaml "
-                         "configuration file \n(use http://www.yamllint.com/ to" 
-                         " check for formatting errors)")
-        mesh_configs = list(mesh_config_dict.keys())
-        if 'threshold' in mesh_configs or 'dust_filter'in mesh_configs:
+        mesh_configs = list(user_config_dict.keys())
+        #Maps processed natively out-of-core don't require CCP-EM
+        if ('threshold' in mesh_configs or 'dust_filter'in mesh_configs) and \
+        not out_of_core_map(user_config_dict):
             soft_dict['ccpem'] = ['1.5']
     elif input_format == 'pdb':
         soft_dict['ucsf-chimerax'] = ['1.3']
@@ -827,38 +2652,147 @@ def check_input_args(input_format, inp, supported_input, soft_dict, yaml_file):
         soft_dict['gmsh'] = ['4.8']
     return soft_dict
 
-def clean_directory(mesh_name, ini_dir):
-    '''Move any folders/files that weren't initially in the directory to .tmp'''
-    ls_cmd = ['ls']
-    ls_out, ls_err = launcher(ls_cmd)
-    ls_out = ls_out.split('\n')
-    mesh_cont = [c for c in ls_out if mesh_name in c and not '_study' in c]
-    keep = ini_dir + mesh_cont
-    mv_fldrs = [c for c in ls_out if (not c in keep) and (c != "")]
-    for mv_fldr in mv_fldrs:
-        mv_tmp_cmd = ['mv', mv_fldr, '.tmp']
-        launcher(mv_tmp_cmd)
-
-def download_emd(emd):
-    '''Use rsync to download the map file from EMDB'''
-    print("\n------------DOWNLOADING EMD FILE--------------\n")
-    if emd.isdigit():
-        entry_num = int(emd)
-    else:
-        num_re = re.compile(r'emd_(\d*)')
-        entry_num = num_re.findall(emd)[0]
-    emd_cmd = ['rsync', '-rlpt', '-v', '-z', '--delete',
+#Classes of the files left in a run directory which the retention policy keeps, compresses
+#or deletes, the mesh, its exports, the quality files and the run report are always kept
+RETENTION_CLASSES = ['logs', 'downloads', 'study', 'intermediates']
+RETENTION_ACTIONS = ['keep', 'compress', 'delete']
+
+def retention_class(name, log_foldr):
+    '''Returns the retention class of a file or folder of a run directory or its .tmp'''
+    if name.startswith(os.path.basename(log_foldr)) or name.startswith('cmd_err_'):
+        return 'logs'
+    if name.startswith('EMD-') or re.match(r'^emd_\d+\.map', name):
+        return 'downloads'
+    if '_study' in name:
+        return 'study'
+    return 'intermediates'
+
+def path_size(path):
+    '''Returns the number of files in a file or folder and their total size in bytes,
+    without following symbolic links'''
+    if not os.path.isdir(path) or os.path.islink(path):
+        return 1, os.lstat(path).st_size
+    num_files, num_bytes = 0, 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            num_files += 1
+            num_bytes += os.lstat(os.path.join(root, filename)).st_size
+    return num_files, num_bytes
+
+def compress_artifact(path, compression):
+    '''Compresses a file, or archives a folder as a tar stream, with a streaming gz, bz2
+    or xz compressor, replacing the original. Links and compressed files are left as
+    they are'''
+    import tarfile
+    if os.path.islink(path) or path.endswith(tuple('.' + exten for exten in MSH_COMPRESSION)):
+        return path
+    if not os.path.isdir(path):
+        return compress_file(path, compression)
+    archive_path = path + '.tar.' + compression
+    with tarfile.open(archive_path, 'w|' + compression) as archive:
+        archive.add(path, arcname=os.path.basename(path))
+    shutil.rmtree(path)
+    return archive_path
+
+def apply_retention(job, outcome, ini_dir):
+    '''Keeps, compresses or deletes each class of the files left in the run directory and
+    its .tmp by the retention policy for the outcome (success or failure) of the job,
+    moving kept intermediate files to .tmp, and returns the sizes of what was kept'''
+    retention = job['mesh_config_dict'].get('retention', {})
+    policy = {**{artifact: 'keep' for artifact in RETENTION_CLASSES},
+              **retention.get(outcome, {})}
+    compression = retention.get('compression', 'gz')
+    summary = {'outcome': outcome, 'outputs': {'files': 0, 'bytes': 0}, 'classes': {
+        artifact: {'action': policy[artifact], 'files': 0, 'bytes': 0, 'kept_bytes': 0}
+        for artifact in RETENTION_CLASSES}}
+    #Every file is listed before any is moved, so files moved to .tmp aren't seen twice
+    entries = [(folder, name) for folder in ('.', '.tmp') if os.path.isdir(folder)
+               for name in sorted(os.listdir(folder)) if (folder, name) != ('.', '.tmp')]
+    for folder, name in entries:
+        path = os.path.join(folder, name)
+        artifact = retention_class(name, job['log_foldr'])
+        if folder == '.' and (name.startswith('.') or name in ini_dir or \
+        (job['mesh_name'] in name and artifact not in ('logs', 'study'))):
+            num_files, num_bytes = path_size(path)
+            summary['outputs']['files'] += num_files
+            summary['outputs']['bytes'] += num_bytes
+            continue
+        action = policy[artifact]
+        num_files, num_bytes = path_size(path)
+        #The logs stay beside the mesh, any other files kept are moved to .tmp
+        if folder == '.' and action != 'delete' and artifact != 'logs':
+            move_to_tmp(path)
+            path = os.path.join('.tmp', name)
+        if action == 'delete':
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        elif action == 'compress':
+            path = compress_artifact(path, compression)
+        class_summary = summary['classes'][artifact]
+        class_summary['files'] += num_files
+        class_summary['bytes'] += num_bytes
+        if action != 'delete':
+            class_summary['kept_bytes'] += path_size(path)[1]
+    summary['kept_bytes'] = summary['outputs']['bytes'] + sum(
+        class_summary['kept_bytes'] for class_summary in summary['classes'].values())
+    return summary
+
+def print_retention(summary):
+    '''Prints the size of each class of files before and after the retention policy'''
+    print("Outputs: " + str(summary['outputs']['files']) + " files, " +
+          format_size(summary['outputs']['bytes']))
+    for artifact, class_summary in summary['classes'].items():
+        if class_summary['files'] > 0:
+            print(artifact.capitalize() + " (" + class_summary['action'] + "): " +
+                  str(class_summary['files']) + " files, " +
+                  format_size(class_summary['bytes']) + " -> " +
+                  format_size(class_summary['kept_bytes']))
+    print("Kept " + format_size(summary['kept_bytes']) + " for this run")
+
+def format_size(num_bytes):
+    '''Formats a size in bytes with a binary unit'''
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if num_bytes < 1024 or unit == 'GiB':
+            return (str(num_bytes) if unit == 'B' else '%.1f' % num_bytes) + ' ' + unit
+        num_bytes = num_bytes / 1024
+
+def collect_scratch_artifacts(artifacts, run_path, final_path, keep_scratch):
+    '''Moves the final artifacts of a run out of the scratch directory and removes
+    the intermediate files left in scratch'''
+    os.makedirs(final_path, exist_ok=True)
+    for artifact in artifacts:
+        shutil.move(artifact, os.path.join(final_path, os.path.basename(artifact)))
+    os.chdir(final_path)
+    print("Final mesh, logging and quality files moved to " + final_path)
+    if keep_scratch:
+        print("Further files generated by intercalated software are stored in " + run_path)
+    else:
+        shutil.rmtree(run_path, ignore_errors=True)
+
+def download_emd(emd, timeout=None):
+    '''Use rsync to download the map file from EMDB'''
+    print("\n------------DOWNLOADING EMD FILE--------------\n")
+    if emd.isdigit():
+        entry_num = int(emd)
+    else:
+        num_re = re.compile(r'emd_(\d*)')
+        entry_num = num_re.findall(emd)[0]
+    emd_cmd = ['rsync', '-rlpt', '-v', '-z', '--delete',
                'rsync.ebi.ac.uk::pub/databases/emdb/structures/EMD-' \
     +str(entry_num)+'/map', './EMD-'+str(entry_num)]
-    mv_emd_cmd = ['cp', 'EMD-'+str(entry_num)+'/map/emd_'+str(entry_num)+'.map.gz', '.']
-    #Unzip the downloaded compressed map file
-    unzip_cmd = ['gunzip', 'emd_'+str(entry_num)+'.map.gz']
-    launcher([emd_cmd, mv_emd_cmd, unzip_cmd])
+    launcher(emd_cmd, timeout=timeout)
+    #Unzip the downloaded compressed map file straight out of the rsync tree
     map_filename = 'emd_'+str(entry_num)+'.map'
+    import gzip
+    with gzip.open('EMD-'+str(entry_num)+'/map/'+map_filename+'.gz', 'rb') as gz_file, \
+    open(map_filename, 'wb') as map_file:
+        shutil.copyfileobj(gz_file, map_file, 16*1024*1024)
     print(map_filename + " successfully downloaded\n")
     return map_filename
 
-def ccpem_cleaning(ccpem_path, map_filepath, map_name, map_config_dict):
+def ccpem_cleaning(ccpem_path, map_filepath, map_name, map_config_dict, timeout=None):
     '''Perform map cleaning using CCPEM toolkit'''
     config_cmd = []
     map_configs = map_config_dict.keys()
@@ -881,11 +2815,286 @@ def ccpem_cleaning(ccpem_path, map_filepath, map_name, map_config_dict):
     ccpem_cmd = ['ccpem-python', ccpem_path[0:-10]+ \
     'lib/py2/ccpem/src/ccpem_core/map_tools/TEMPy/map_preprocess.pyc', '-m', map_filepath] \
     + config_cmd + ['-out', map_name +'_cleaned.map']
-    launcher(ccpem_cmd)
+    launcher(ccpem_cmd, timeout=timeout)
     #Return the cleaned map name
     return map_name+'_cleaned.map'
 
-def process_chi_error(chi_err, cxc_filename, run_directory):
+def import_numpy():
+    '''Imports numpy only on the paths which process arrays'''
+    try:
+        import numpy
+    except ImportError as ie:
+        print('\n----------------Import Error----------------\n')
+        print('Error: {}'
+              '\nTry installing using:\npip install numpy'.format(ie))
+        exit_tool()
+    return numpy
+
+def out_of_core_map(map_config_dict):
+    '''Returns whether the map is processed natively chunk-by-chunk instead of by CCP-EM'''
+    return bool(map_config_dict.get('out_of_core')) or 'bin_factor' in map_config_dict \
+    or 'target_voxel_size' in map_config_dict
+
+def check_map_args(map_config_dict):
+    '''Check the configurations provided for native map processing are valid'''
+    for config in ('bin_factor', 'target_voxel_size', 'memory_limit', 'dust_size'):
+        if config in map_config_dict and (not isnumber(map_config_dict[config]) or
+                                          float(map_config_dict[config]) <= 0):
+            raise InputError('configurations', "\nInvalid value for argument '" + config +
+                             "' in the configuration file. This must be a positive number")
+    if 'bin_factor' in map_config_dict and 'target_voxel_size' in map_config_dict:
+        raise InputError('configurations', "\nPlease give only one of 'bin_factor' and"
+                         " 'target_voxel_size' in the configuration file")
+    if 'bin_factor' in map_config_dict and \
+    float(map_config_dict['bin_factor']) != int(float(map_config_dict['bin_factor'])):
+        raise InputError('configurations', "\nInvalid value for argument 'bin_factor' in"
+                         " the configuration file. This must be an integer")
+    if str(map_config_dict.get('out_of_core', 'false')).lower() not in ('true', 'false'):
+        raise InputError('configurations', "\nInvalid value for argument 'out_of_core' in"
+                         " the configuration file. This must be True or False")
+
+def read_mrc_header(map_filepath):
+    '''Reads the header of an MRC map, returning the fields needed to memory-map
+    its data'''
+    np = import_numpy()
+    with open(map_filepath, 'rb') as map_file:
+        header = map_file.read(1024)
+    if len(header) < 1024:
+        raise InputError('map file', map_filepath + ' is not an MRC map')
+    #The machine stamp gives the byte order of the file
+    byteorder = '>' if header[212] == 0x11 else '<'
+    ints = np.frombuffer(header, dtype=byteorder+'i4', count=256)
+    floats = np.frombuffer(header, dtype=byteorder+'f4', count=256)
+    modes = {0: 'i1', 1: 'i2', 2: 'f4', 6: 'u2', 12: 'f2'}
+    mode = int(ints[3])
+    if mode not in modes:
+        raise UnsupportedError('MRC mode ' + str(mode), [str(m) for m in modes])
+    #Data is stored by section, then row, then column
+    shape = (int(ints[2]), int(ints[1]), int(ints[0]))
+    sampling = [int(m) for m in ints[7:10]]
+    voxel_sizes = [float(floats[10 + ind]) / sampling[ind] for ind in range(3)
+                   if sampling[ind] > 0 and floats[10 + ind] > 0]
+    voxel_size = sum(voxel_sizes) / len(voxel_sizes) if voxel_sizes != [] else 1.0
+    return {'header': header, 'byteorder': byteorder, 'dtype': byteorder + modes[mode],
+            'shape': shape, 'offset': 1024 + int(ints[23]), 'voxel_size': voxel_size}
+
+def map_sections(map_filepath, mrc, start, stop, mode='r'):
+    '''Memory-maps only the sections start:stop of an MRC map so that pages are
+    released once the chunk is no longer used'''
+    np = import_numpy()
+    section_bytes = mrc['shape'][1] * mrc['shape'][2] * np.dtype(mrc['dtype']).itemsize
+    return np.memmap(map_filepath, dtype=mrc['dtype'], mode=mode,
+                     offset=mrc['offset'] + start * section_bytes,
+                     shape=(stop - start, mrc['shape'][1], mrc['shape'][2]))
+
+def write_mrc_header(map_filepath, mrc, shape, stats, bin_factor=1):
+    '''Writes the header of a float32 MRC map with the given shape and
+    (min, max, mean, rms) statistics, based on the header of the original map
+    which was binned by bin_factor'''
+    np = import_numpy()
+    byteorder = mrc['byteorder']
+    ints = np.frombuffer(mrc['header'], dtype=byteorder+'i4').copy()
+    floats = ints.view(byteorder+'f4')
+    #Voxel sizes (x, y, z) of the original map, saved before the header is changed
+    voxel_sizes = [floats[10 + ind] / ints[7 + ind] if ints[7 + ind] > 0 else 0.0
+                   for ind in range(3)]
+    starts = [int(start) for start in ints[4:7]]
+    ints[0:3] = [shape[2], shape[1], shape[0]]
+    ints[3] = 2
+    ints[4:7] = [start // bin_factor for start in starts]
+    ints[7:10] = [shape[2], shape[1], shape[0]]
+    #The voxel size grows with the bin factor, trailing voxels which didn't fill a bin
+    #were dropped so the cell shrinks to the binned shape
+    for ind in range(3):
+        if voxel_sizes[ind] > 0:
+            floats[10 + ind] = shape[2 - ind] * voxel_sizes[ind] * bin_factor
+    #A binned voxel is centred on the middle of the voxels it averages, so the origin
+    #moves by half of the bin (and by the part of the start which isn't a whole bin)
+    floats[49:52] = [floats[49 + ind] + (starts[ind] % bin_factor + (bin_factor - 1) / 2) *
+                     voxel_sizes[ind] for ind in range(3)]
+    floats[19:22] = stats[0:3]
+    floats[54] = stats[3]
+    ints[23] = 0
+    with open(map_filepath, 'r+b') as map_file:
+        map_file.write(ints.tobytes())
+
+def map_bin_factor(map_config_dict, voxel_size):
+    '''Returns the factor by which the map is binned, from bin_factor or
+    target_voxel_size'''
+    if 'bin_factor' in map_config_dict:
+        return int(float(map_config_dict['bin_factor']))
+    if 'target_voxel_size' in map_config_dict:
+        return max(1, int(float(map_config_dict['target_voxel_size']) // voxel_size))
+    return 1
+
+def chunk_sections(section_bytes, memory_limit):
+    '''Returns how many sections can be held in memory at once within the limit'''
+    return max(1, int(memory_limit // section_bytes))
+
+def process_map_chunked(map_filepath, map_name, map_config_dict):
+    '''Bins, thresholds and dust filters a map chunk-by-chunk over memory-mapped
+    sections so that the memory used is bounded by memory_limit (MB) regardless
+    of the size of the map'''
+    np = import_numpy()
+    mrc = read_mrc_header(map_filepath)
+    bin_factor = map_bin_factor(map_config_dict, mrc['voxel_size'])
+    memory_limit = float(map_config_dict.get('memory_limit', 1024)) * 1024 * 1024
+    threshold = map_config_dict.get('threshold')
+    if threshold is not None:
+        if not isnumber(threshold):
+            raise InputError('configurations', "\nInvalid value for argument 'threshold'"
+            "in the configuration file. This must be an integer or float")
+        threshold = float(threshold)
+    out_shape = tuple(dim // bin_factor for dim in mrc['shape'])
+    if 0 in out_shape:
+        raise InputError('configurations', "\nThe bin factor " + str(bin_factor) +
+                         " is larger than the map " + map_filepath)
+    out_filename = map_name + '_processed.map'
+    out_mrc = {'header': mrc['header'], 'byteorder': '<', 'dtype': '<f4', 'shape': out_shape,
+               'offset': 1024}
+    with open(out_filename, 'wb') as out_file:
+        out_file.write(bytes(1024))
+        out_file.truncate(1024 + 4 * out_shape[0] * out_shape[1] * out_shape[2])
+    #Each output section needs bin_factor input sections plus float32 working copies
+    in_section_bytes = mrc['shape'][1] * mrc['shape'][2] * np.dtype(mrc['dtype']).itemsize
+    section_bytes = bin_factor * (in_section_bytes + mrc['shape'][1] * mrc['shape'][2] * 4) \
+    + 3 * 4 * out_shape[1] * out_shape[2]
+    dust_filter = str(map_config_dict.get('dust_filter', 'false')).lower() == 'true'
+    if dust_filter:
+        section_bytes = max(section_bytes, dust_section_bytes(out_shape[1] * out_shape[2]))
+    chunk = chunk_sections(section_bytes, memory_limit)
+    ny, nx = out_shape[1] * bin_factor, out_shape[2] * bin_factor
+    for start in range(0, out_shape[0], chunk):
+        stop = min(out_shape[0], start + chunk)
+        in_sections = map_sections(map_filepath, mrc, start * bin_factor, stop * bin_factor)
+        block = np.array(in_sections[:, :ny, :nx], dtype=np.float32)
+        del in_sections
+        if bin_factor > 1:
+            block = block.reshape(stop - start, bin_factor, out_shape[1], bin_factor,
+                                  out_shape[2], bin_factor).mean(axis=(1, 3, 5), dtype=np.float32)
+        if threshold is not None:
+            block[block < threshold] = 0
+        out_sections = map_sections(out_filename, out_mrc, start, stop, 'r+')
+        out_sections[:] = block
+        out_sections.flush()
+        del out_sections, block
+    if dust_filter:
+        dust_filter_chunked(out_filename, out_mrc, chunk, threshold or 0,
+                            float(map_config_dict.get('dust_size', 0.01)))
+    write_mrc_header(out_filename, mrc, out_shape, map_stats_chunked(out_filename, out_mrc,
+                                                                     chunk), bin_factor)
+    print("Map processed in chunks of " + str(chunk) + " sections (bin factor " +
+          str(bin_factor) + "), saved as " + out_filename)
+    return out_filename
+
+def map_stats_chunked(map_filepath, mrc, chunk):
+    '''Returns the minimum, maximum, mean and rms of a map computed chunk-by-chunk'''
+    np = import_numpy()
+    total = 0.0
+    total_sq = 0.0
+    minimum = np.inf
+    maximum = -np.inf
+    count = mrc['shape'][0] * mrc['shape'][1] * mrc['shape'][2]
+    for start in range(0, mrc['shape'][0], chunk):
+        sections = map_sections(map_filepath, mrc, start, min(mrc['shape'][0], start + chunk))
+        minimum = min(minimum, float(sections.min()))
+        maximum = max(maximum, float(sections.max()))
+        total = total + float(sections.sum(dtype=np.float64))
+        total_sq = total_sq + float(np.square(sections, dtype=np.float64).sum())
+        del sections
+    mean = total / count
+    return minimum, maximum, mean, math.sqrt(max(0.0, total_sq / count - mean * mean))
+
+def label_sections(sections, threshold):
+    '''Labels the connected densities above the threshold in a chunk of sections'''
+    try:
+        from scipy import ndimage
+    except ImportError as ie:
+        print('\n----------------Import Error----------------\n')
+        print('Error: {}'
+              '\nTry installing using:\npip install scipy'.format(ie))
+        exit_tool()
+    return ndimage.label(sections > threshold)
+
+#Bytes kept by the union-find for each label, a slot and an int in each of its two lists
+UNION_FIND_LABEL_BYTES = 2 * (8 + 32)
+
+def dust_section_bytes(section_voxels):
+    '''Returns the bytes used to dust filter each section of float32 voxels: the
+    voxels, their masks and int32 labels, and for each label (at most one for every
+    other voxel) its int64 size and its entries in the union-find'''
+    return section_voxels * (4 + 1 + 4 + 2) + section_voxels // 2 * (8 + UNION_FIND_LABEL_BYTES)
+
+def find_root(parent, label):
+    '''Finds the root of a label in the union-find forest, compressing its path'''
+    root = label
+    while parent[root] != root:
+        root = parent[root]
+    while parent[label] != root:
+        parent[label], label = root, parent[label]
+    return root
+
+def dust_filter_chunked(map_filepath, mrc, chunk, threshold, dust_size=0.01):
+    '''Removes densities smaller than dust_size (a fraction) of the largest density.
+    Densities are labelled chunk-by-chunk and joined across chunk boundaries with a
+    union-find, then a second pass zeroes the voxels of the small densities'''
+    np = import_numpy()
+    parent = [0]
+    sizes = [0]
+    prev_plane = None
+    offsets = []
+    #First pass labels each chunk and joins densities which touch across chunks
+    for start in range(0, mrc['shape'][0], chunk):
+        sections = map_sections(map_filepath, mrc, start, min(mrc['shape'][0], start + chunk))
+        labels, num = label_sections(sections, threshold)
+        del sections
+        offset = len(parent) - 1
+        offsets.append(offset)
+        sizes.extend(np.bincount(labels.ravel(), minlength=num + 1)[1:].tolist())
+        labels[labels > 0] += offset
+        parent.extend(range(offset + 1, offset + num + 1))
+        if prev_plane is not None:
+            touching = (prev_plane > 0) & (labels[0] > 0)
+            pairs = set(zip(prev_plane[touching].tolist(), labels[0][touching].tolist()))
+            for label_a, label_b in pairs:
+                root_a = find_root(parent, label_a)
+                root_b = find_root(parent, label_b)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+        prev_plane = labels[-1].copy()
+        del labels
+    if len(parent) == 1:
+        return
+    roots = np.array([find_root(parent, label) for label in range(len(parent))])
+    root_sizes = np.bincount(roots, weights=sizes)
+    keep = root_sizes[roots] >= dust_size * root_sizes[1:].max()
+    keep[0] = False
+    #Second pass relabels each chunk identically and removes the small densities
+    for ind, start in enumerate(range(0, mrc['shape'][0], chunk)):
+        sections = map_sections(map_filepath, mrc, start, min(mrc['shape'][0], start + chunk),
+                                'r+')
+        labels, num = label_sections(sections, threshold)
+        labels[labels > 0] += offsets[ind]
+        sections[~keep[labels]] = 0
+        sections.flush()
+        del sections, labels
+
+def chimera_error(chi_err, cxc_script, chi_filepath):
+    '''Writes the full ChimeraX output to a file and returns a ChimeraError with
+    its readable error message'''
+    #Find output which has readble error messages
+    err_exp = re.compile(r'Error: (.*)')
+    try:
+        main_err = err_exp.findall(chi_err)[0]
+    except:
+        main_err = ""
+    chi_err = chi_err.split('\n')
+    with open(chi_filepath, 'w') as chi_file:
+        for chi_ln in chi_err:
+            chi_file.write(chi_ln + '\n')
+    return ChimeraError(cxc_script, chi_filepath, main_err)
+
+def process_chi_error(chi_err, cxc_filename):
     '''Extracts relevant information to raise a ChimeraError'''
     #Read the chimera script to display to the user
     cxc_script = ""
@@ -897,27 +3106,12 @@ def process_chi_error(chi_err, cxc_filename, run_directory):
                 eof = True
             else:
                 cxc_script = cxc_script + '\t'+cur_line
-    #Find output which has readble error messages
-    err_exp = re.compile(r'Error: (.*)')
-    try:
-        main_err = err_exp.findall(chi_err)[0]
-    except:
-        main_err = ""
-    chi_err = chi_err.split('\n')
-    chi_filename = 'chimera_error.txt'
-    with open(chi_filename, 'w') as chi_file:
-        for chi_ln in chi_err:
-            chi_file.write(chi_ln + '\n')
-    raise ChimeraError(cxc_script, main_err, run_directory + '/' + chi_filename)
+    raise chimera_error(chi_err, cxc_script, os.path.abspath('chimera_error.txt'))
 
-def to_stl(chimera_path, filepath, name, exten, chi_config_dict, run_directory):
-    '''Convert the given file to an STL using ChimeraX'''
-    print("\n------------CONVERTING TO STL------------\n")
-    cxc_filename = name+"_chimerax_script.cxc"
+def chimera_commands(filepath, name, exten, chi_config_dict, stl_filepath=None):
+    '''Returns the ChimeraX commands which surface the given file and save it as an STL'''
     chi_configs = chi_config_dict.keys()
-    cxc_file = open(cxc_filename, 'w')
-    cxc_file.write("log hide\n")
-    cxc_file.write(f"open {filepath}\n")
+    commands = [f"open {filepath}"]
     #PDB files require a probe radius to generate a surface
     if 'probe_radius' not in chi_configs and exten == 'pdb':
         raise InputError('configurations', "\nPlease provide a value for 'probe_radius'"
@@ -928,34 +3122,108 @@ def to_stl(chimera_path, filepath, name, exten, chi_config_dict, run_directory):
             raise InputError('configurations', "\nInvalid value for argument '"+cc+"' in the"
             " configuration file. This must be an integer or float")
         if cc == 'probe_radius':
-            cxc_file.write(f"surface probeRadius {chi_config_dict[cc]}\n")
+            commands.append(f"surface probeRadius {chi_config_dict[cc]}")
             #Ribbon representations of pbd files must be hidden or they create an inner surface
-            cxc_file.write("hide all\n")
-            cxc_file.write("~ribbon\n")
+            commands.append("hide all")
+            commands.append("~ribbon")
         else:
-            cxc_file.write(f"surface gridSpacing {chi_config_dict[cc]}\n")
-    cxc_file.write(f"save {name}.stl\n")
-    cxc_file.write("quit")
-    cxc_file.close()
+            commands.append(f"surface gridSpacing {chi_config_dict[cc]}")
+    commands.append(f"save {stl_filepath or name + '.stl'}")
+    return commands
+
+def to_stl(chimera_path, filepath, name, exten, chi_config_dict, run_directory, timeout=None):
+    '''Convert the given file to an STL using ChimeraX'''
+    print("\n------------CONVERTING TO STL------------\n")
+    cxc_filename = name+"_chimerax_script.cxc"
+    commands = chimera_commands(filepath, name, exten, chi_config_dict)
+    with open(cxc_filename, 'w') as cxc_file:
+        cxc_file.write("log hide\n")
+        for command in commands:
+            cxc_file.write(command + "\n")
+        cxc_file.write("quit")
     #Run the script with no gui and offscreen logging
     chi_cmd = [chimera_path, '--nogui', '--offscreen', '--exit', cxc_filename]
-    chi_out, chi_err = launcher(chi_cmd, True)
+    chi_out, chi_err = launcher(chi_cmd, True, timeout)
     if chi_err != "":
-        process_chi_error(chi_err, cxc_filename, run_directory)
-    mv_tmp_cmd = ['mv', cxc_filename, '.tmp']
-    launcher(mv_tmp_cmd)
+        process_chi_error(chi_err, cxc_filename)
+    move_to_tmp(cxc_filename)
     print("Successfully generated "+ name + ".stl can be found in "+ run_directory +"\n")
     return name
 
+"""Python script run inside a single ChimeraX session to surface a batch of inputs.
+Each input is run in a fresh session and its outcome is written to the results file as
+soon as it finishes, so a failure (or crash) is attributed to the input which caused it"""
+CHIMERA_BATCH_SCRIPT = '''import json
+import traceback
+from chimerax.core.commands import run
+batch = json.loads({batch!r})
+results = {{}}
+for ind, surface_input in enumerate(batch['inputs']):
+    try:
+        run(session, 'close session')
+        for command in surface_input['commands']:
+            run(session, command, log=False)
+        results[str(ind)] = ''
+    except Exception:
+        results[str(ind)] = traceback.format_exc()
+    with open(batch['results'], 'w') as results_file:
+        json.dump(results, results_file)
+'''
+
+def to_stl_batch(chimera_path, surface_inputs, script_directory, timeout=None):
+    '''Converts many files to STLs in one ChimeraX process, where each surface input
+    gives its filepath, name, exten, chi_config_dict and run_path
+    Returns the ChimeraError of every input which failed, by its position'''
+    print("\n------------CONVERTING TO STL (BATCH OF "+str(len(surface_inputs))+")------------\n")
+    script_filepath = os.path.join(script_directory, 'chimerax_batch_script.py')
+    results_filepath = os.path.join(script_directory, 'chimerax_batch_results.json')
+    batch = {'results': results_filepath, 'inputs': []}
+    for surf in surface_inputs:
+        stl_filepath = os.path.join(surf['run_path'], surf['name'] + '.stl')
+        batch['inputs'].append({'name': surf['name'], 'commands': chimera_commands(
+            surf['filepath'], surf['name'], surf['exten'], surf['chi_config_dict'],
+            stl_filepath)})
+    with open(script_filepath, 'w') as script_file:
+        script_file.write(CHIMERA_BATCH_SCRIPT.format(batch=json.dumps(batch)))
+    chi_cmd = [chimera_path, '--nogui', '--offscreen', '--exit', script_filepath]
+    try:
+        chi_out, chi_err = launcher(chi_cmd, True, timeout)
+    except StageTimeoutError as err:
+        chi_err = str(err)
+    try:
+        with open(results_filepath, 'r') as results_file:
+            results = json.load(results_file)
+    except (OSError, ValueError):
+        results = {}
+    errors = {}
+    unfinished = False
+    for ind, surf in enumerate(surface_inputs):
+        cxc_script = ''.join(['\t' + command + '\n' for command in
+                              batch['inputs'][ind]['commands']])
+        chi_filepath = os.path.join(surf['run_path'], 'chimera_error.txt')
+        if str(ind) not in results:
+            #The first input without a result is the one ChimeraX stopped on
+            if not unfinished:
+                errors[ind] = chimera_error(chi_err, cxc_script, chi_filepath)
+            else:
+                errors[ind] = ChimeraError(cxc_script, chi_filepath, "not surfaced as"
+                                           " ChimeraX stopped on a previous input")
+            unfinished = True
+        elif results[str(ind)] != '':
+            errors[ind] = chimera_error(results[str(ind)], cxc_script, chi_filepath)
+        else:
+            print("Successfully generated "+ surf['name'] + ".stl can be found in "
+                  + surf['run_path'])
+    return errors
+
 def get_initial_dir():
     '''Lists all the files initially in the directory before running the pipeline'''
-    ini_dir = []
-    ls_cmd = ['ls', '-a']
-    ls_out, ls_err = launcher(ls_cmd)
-    ini_dir = ls_out.split('\n')
-    ini_dir = [i for i in ini_dir if i != ""]
+    ini_dir = os.listdir('.')
     #Checks if there is already a hidden tmp directory
-    if '.tmp' in ini_dir:
+    if '.tmp' in ini_dir and not PROMPTS['interactive']:
+        print("Hidden directory .tmp already exists in the directory (from a previous run)"
+              " and is left as it is")
+    elif '.tmp' in ini_dir:
         print("Hidden directory .tmp already exists in the directory (from a previous run)\n"
         "If you want to retain this directory please rename it appropriately and"
         "start this run again")
@@ -971,163 +3239,1791 @@ def get_initial_dir():
                 exit_tool()
     return ini_dir
 
-def main():
-    initial_contents = get_initial_dir()
-    meshing_soft = {}
-    #CodeSaturne is the only software required for any input format
-    base_softs = {
-        'code_saturne': ['7.0'],
-        'cs_preprocess': ['7.0'],
-        }
-    #All supported formats and softwares which may be given as arguments
-    supported_dict = {
-        'meshing_soft': ['gmsh', 'salome'],
-        'input_format':['stl', 'map', 'emd', 'msh', 'pdb'],
-        'mesh_format':['msh']
-    }
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", required=True, help="path to the input file")
-    parser.add_argument("-f", "--format", required=True, help="format of the input file")
-    parser.add_argument("-c", "--configs", required=False, help="file name (and path) to "
-    "configuration yaml file")
-    #Histograms and visualisation are optional flags
-    parser.add_argument("-hg", "--histograms", required=False, help="flag to generate "
-    "histograms to assess mesh quality", action="store_true")
-    parser.add_argument("-v", "--visualise", required=False, help="Generates a "
-    "visualisation of the surface in Paraview", action='store_true')
-    args = parser.parse_args()
+#Prior cost model, used until enough run reports are found to calibrate it.
+#Stage durations are intercept + slope * size (surface triangles for chimerax,
+#volume elements for gmsh and code_saturne)
+DEFAULT_COST_MODEL = {'triangle_scale': 1.0, 'element_scale': 1.0, 'kb_per_element': 1.0,
+                      'base_memory_mb': 100.0,
+                      'stages': {'chimerax': [5.0, 2e-5], 'gmsh': [1.0, 2e-5],
+                                 'code_saturne': [10.0, 1e-5]}}
+#Size which drives the duration of each modelled stage
+STAGE_SIZES = {'chimerax': 'surface_triangles', 'gmsh': 'elements', 'code_saturne': 'elements'}
 
-    #Generate a software dictionary with all the baseline required software
-    soft_dict = base_softs.copy()
+def stl_triangle_count(stl_filepath):
+    '''Returns the number of triangles of a binary or ASCII STL'''
+    with open(stl_filepath, 'rb') as stl_file:
+        header = stl_file.read(84)
+        num_triangles = int.from_bytes(header[80:84], 'little') if len(header) == 84 else 0
+        if os.path.getsize(stl_filepath) == 84 + 50 * num_triangles:
+            return num_triangles
+        stl_file.seek(0)
+        return sum(1 for line in stl_file if line.lstrip().startswith(b'facet'))
+
+def stl_features(stl_filepath):
+    '''Returns the triangle count, surface area and enclosed volume of an STL'''
+    np = import_numpy()
+    with open(stl_filepath, 'rb') as stl_file:
+        header = stl_file.read(84)
+        num_triangles = int.from_bytes(header[80:84], 'little') if len(header) == 84 else 0
+        #Binary STLs have 50 bytes per triangle after the header
+        if os.path.getsize(stl_filepath) == 84 + 50 * num_triangles:
+            dtype = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attr', '<u2')])
+            vertices = np.frombuffer(stl_file.read(), dtype=dtype)['vertices'].astype(np.float64)
+        else:
+            stl_file.seek(0)
+            vertices = np.array([line.split()[1:4] for line in stl_file
+                                 if line.lstrip().startswith(b'vertex')], dtype=np.float64)
+            vertices = vertices[:len(vertices) // 3 * 3].reshape(-1, 3, 3)
+    cross = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    area = float(np.linalg.norm(cross, axis=1).sum() / 2)
+    #Divergence theorem, exact for a closed surface
+    volume = abs(float(np.einsum('ij,ij->i', vertices[:, 0], cross).sum() / 6))
+    return {'surface_triangles': len(vertices), 'surface_area': area, 'volume': volume}
+
+def input_features(job):
+    '''Returns the metadata of the input which drives the cost of meshing it:
+    the triangle count, surface area and volume of the surface (estimated before
+    surfacing), or the size of a mesh'''
+    chi_configs = job['chi_config_dict']
+    if job['input_format'] == 'msh':
+        return {'file_mb': os.path.getsize(job['input_filepath']) / 1e6}
+    if job['input_format'] == 'stl':
+        return stl_features(job['input_filepath'])
+    if job['input_format'] == 'pdb':
+        with open(job['input_filepath'], errors='replace') as pdb_file:
+            atoms = sum(1 for line in pdb_file if line.startswith(('ATOM', 'HETATM')))
+        #Roughly 20 cubic Angstroms of protein per atom
+        volume = 20.0 * atoms
+        spacing = float(chi_configs.get('grid_spacing', 0.5))
+    elif job['input_format'] == 'map' and os.path.isfile(job['input_filepath']):
+        mrc = read_mrc_header(job['input_filepath'])
+        voxel_size = mrc['voxel_size'] * map_bin_factor(job['map_config_dict'],
+                                                          mrc['voxel_size'])
+        #Assume a fifth of the box is above the contour threshold
+        volume = 0.2 * mrc['shape'][0] * mrc['shape'][1] * mrc['shape'][2] * \
+        mrc['voxel_size'] ** 3
+        spacing = float(chi_configs.get('grid_spacing', voxel_size))
+    else:
+        #emd entries are only known once downloaded
+        return {}
+    #A molecular surface has about twice the area of a sphere of the same volume
+    area = 2 * (36 * math.pi) ** (1 / 3) * volume ** (2 / 3)
+    return {'surface_triangles': 2 * area / spacing ** 2, 'surface_area': area,
+            'volume': volume, 'estimated_surface': True}
 
+def mesh_size(features, mesh_config_dict):
+    '''Returns the size of the volume elements gmsh will generate, from the gmsh
+    size options or the average edge length of the surface triangles'''
+    options = mesh_config_dict.get('gmsh_options', {})
+    size = options.get('Mesh.MeshSizeMax', options.get('Mesh.CharacteristicLengthMax'))
+    if size is None:
+        size = math.sqrt(4 * features['surface_area'] / (math.sqrt(3) *
+                                                         max(features['surface_triangles'], 1)))
+    factor = options.get('Mesh.MeshSizeFactor', options.get('Mesh.CharacteristicLengthFactor', 1))
+    return max(float(size) * float(factor), 1e-12)
+
+def raw_element_count(features, mesh_config_dict):
+    '''Returns the uncalibrated number of tetrahedra filling the volume, each of
+    which is about 0.118 of the cube of its edge length'''
+    return features['volume'] / (0.118 * mesh_size(features, mesh_config_dict) ** 3)
+
+def linear_fit(points):
+    '''Least squares fit of y = intercept + slope * x'''
+    num = len(points)
+    mean_x = sum(x for x, y in points) / num
+    mean_y = sum(y for x, y in points) / num
+    var_x = sum((x - mean_x) ** 2 for x, y in points)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x if var_x > 0 else 0.0
+    slope = max(slope, 0.0)
+    return [max(mean_y - slope * mean_x, 0.0), slope]
+
+def median(values):
+    '''Returns the median of a list of values'''
+    values = sorted(values)
+    return (values[(len(values) - 1) // 2] + values[len(values) // 2]) / 2
+
+def calibrate_cost_model(history_dir):
+    '''Fits the cost model to the run reports of prior runs in history_dir,
+    keeping the prior for anything with fewer than two runs to fit'''
+    import glob
+    model = json.loads(json.dumps(DEFAULT_COST_MODEL))
+    reports = []
+    for report_filepath in glob.glob(os.path.join(history_dir, '*', '*_report.json')):
+        try:
+            with open(report_filepath) as report_file:
+                reports.append(json.load(report_file))
+        except (OSError, ValueError):
+            continue
+    ratios = {'triangle_scale': [], 'element_scale': [], 'kb_per_element': []}
+    stage_points = {stage: [] for stage in STAGE_SIZES}
+    for report in reports:
+        sizes = report.get('sizes', {})
+        features = report.get('features', {})
+        if features.get('estimated_surface') and sizes.get('surface_triangles'):
+            ratios['triangle_scale'].append(sizes['surface_triangles'] /
+                                            features['surface_triangles'])
+        if features.get('raw_elements') and sizes.get('elements'):
+            ratios['element_scale'].append(sizes['elements'] / features['raw_elements'])
+        for stage in report.get('stages', []):
+            if stage['status'] != 'success' or stage['stage'] not in STAGE_SIZES:
+                continue
+            size = sizes.get(STAGE_SIZES[stage['stage']])
+            if size is not None:
+                stage_points[stage['stage']].append((size, stage['duration']))
+            if stage['stage'] == 'gmsh' and sizes.get('elements') and stage.get('peak_memory_mb'):
+                ratios['kb_per_element'].append(stage['peak_memory_mb'] * 1024 / sizes['elements'])
+    for key, values in ratios.items():
+        if len(values) >= 2:
+            model[key] = median(values)
+    for stage, points in stage_points.items():
+        if len(points) >= 2:
+            model['stages'][stage] = linear_fit(points)
+    model['runs'] = len(reports)
+    return model
+
+def estimate_job(job, model):
+    '''Estimates the surface triangles, volume elements, peak memory and duration of
+    each modelled stage of a job'''
+    features = input_features(job)
+    estimate = {'stages': {}}
+    if job['input_format'] == 'msh':
+        #Roughly 100 bytes per element of an ASCII mesh
+        estimate['elements'] = features['file_mb'] * 1e4
+    elif features != {}:
+        triangles = features['surface_triangles']
+        if features.get('estimated_surface'):
+            triangles = triangles * model['triangle_scale']
+        estimate['surface_triangles'] = triangles
+        features['raw_elements'] = raw_element_count({**features, 'surface_triangles': triangles},
+                                                     job['mesh_config_dict'])
+        estimate['elements'] = features['raw_elements'] * model['element_scale']
+    if 'elements' in estimate:
+        estimate['peak_memory_mb'] = model['base_memory_mb'] + \
+        model['kb_per_element'] * estimate['elements'] / 1024
+    for stage, size in STAGE_SIZES.items():
+        if size in estimate and (stage != 'chimerax' or job['input_format'] != 'stl') and \
+        (stage == 'code_saturne' or job['input_format'] != 'msh'):
+            intercept, slope = model['stages'][stage]
+            estimate['stages'][stage] = intercept + slope * estimate[size]
+    estimate['runtime'] = sum(estimate['stages'].values())
+    return features, estimate
+
+def over_budget(estimate, budget):
+    '''Returns the estimates of a job which are over its configured budget'''
+    over = []
+    for key, estimate_key in (('elements', 'elements'), ('memory_mb', 'peak_memory_mb'),
+                              ('runtime', 'runtime')):
+        if key in budget and estimate.get(estimate_key, 0) > float(budget[key]):
+            over.append(key + ' ' + format(estimate[estimate_key], '.3g') + ' > ' +
+                        str(budget[key]))
+    return over
+
+def job_stages(job):
+    '''Returns the stages which will be run for a job, in order'''
+    mesh_configs = job['mesh_config_dict']
+    stages = []
+    if job['input_format'] == 'emd':
+        stages.append('download')
+    if job['input_format'] in ('map', 'emd') and out_of_core_map(job['map_config_dict']):
+        stages.append('map_processing')
+    elif job['input_format'] in ('map', 'emd') and job['map_config_dict'] != {}:
+        stages.append('ccpem')
+    if job['input_format'] in ('pdb', 'map', 'emd'):
+        stages.append('chimerax')
+    if job['input_format'] != 'msh':
+        stages.append('gmsh')
+        stages = stages + [stage for stage, config in (('renumber', 'renumber'),
+                           ('partition', 'partitions')) if config in mesh_configs]
+        if mesh_configs['format'] == 'ffea':
+            stages.append('ffea')
+    stages = stages + ['code_saturne', 'quality']
+    if job['input_format'] != 'msh' and 'compress' in mesh_configs:
+        stages.append('compress')
+    return stages
+
+def print_plan(jobs, model):
+    '''Prints the stages of every job with their estimated costs, and returns the
+    number of jobs over their budget'''
+    print("\n----------------PLAN----------------\n")
+    print("Cost model calibrated from " + str(model['runs']) + " prior run reports\n")
+    refused = 0
+    for job in jobs:
+        features, estimate = estimate_job(job, model)
+        print(job['input'] + " -> " + job['mesh_name'])
+        for key, label in (('surface_triangles', 'surface triangles'),
+                           ('elements', 'volume elements'), ('peak_memory_mb', 'peak memory (MB)'),
+                           ('runtime', 'runtime (s)')):
+            if key in estimate:
+                print("  estimated " + label + ": " + format(estimate[key], '.3g'))
+        for stage in job_stages(job):
+            duration = estimate['stages'].get(stage)
+            print("  " + stage.ljust(16) + ("~" + format(duration, '.3g') + " s"
+                                            if duration is not None else "-"))
+        over = over_budget(estimate, job['mesh_config_dict'].get('budget', {}))
+        if over != []:
+            refused = refused + 1
+            print("  REFUSED, over budget: " + ', '.join(over))
+        print()
+    return refused
+
+def plan_job(job, model):
+    '''Records the input features and cost estimates of the job in its run report and
+    refuses it if it is over its configured budget'''
+    features, estimate = estimate_job(job, model)
+    with RUN_REPORT_LOCK:
+        job['run_report'].update({'features': features, 'estimate': estimate})
+    over = over_budget(estimate, job['mesh_config_dict'].get('budget', {}))
+    if over != []:
+        raise InputError('budget', "\nThe job is estimated to be over its budget: " +
+                         ', '.join(over) + " (see --plan)")
+
+def check_report(soft_dict, jobs, check_imports=True):
+    '''Reports the result of a --check dry-run and the time taken to start up'''
+    print("\n----------------CHECK----------------\n")
+    for job in jobs:
+        print("Input " + job['input'] + " and configurations are valid, the mesh will be"
+              " saved as " + job['mesh_name'])
+    for soft, ver_path in soft_dict.items():
+        print(soft + " (" + ver_path[0] + "+): " + ver_path[1])
+    startup_ms = (time.perf_counter() - START_TIME) * 1000
+    print("Checks completed in %.0f ms" % startup_ms)
+    #Plotting modules must only be imported on the paths which need them
+    heavy_modules = [mod for mod in ('matplotlib', 'numpy') if mod in sys.modules]
+    if check_imports and heavy_modules != []:
+        raise InputError('startup', ', '.join(heavy_modules) + ' imported during --check')
+
+def prepare_job(input_arg, input_format, configs_filepath, supported_dict, soft_dict,
+                cli_timeouts, interactive=True):
+    '''Checks an input and its configurations, adding the software they require to the
+    software dictionary, and returns the job which describes its run'''
+    mesh_config_dict = {}
+    map_config_dict = {}
+    chi_config_dict = {}
     #Meshing configurations are only not provided when the input
     #Is a mesh itself
-    if args.format != 'msh' and args.configs is None:
+    if input_format != 'msh' and configs_filepath is None:
         raise InputError('arguments', 'a configuration (.yaml) file is required for the' 
-        ' input format ' + args.format + '.\nPlease refer to the documentation on this '
+        ' input format ' + input_format + '.\nPlease refer to the documentation on this '
         'which can be found here:\nhttps://github.com/CCPBioSim/bio_saturne-meshingtool')
-    elif args.format == 'msh' and args.configs is None:
-        mesh_filepath = '../'+args.input
-        
+    elif input_format == 'msh' and configs_filepath is None:
+        mesh_filepath = os.path.abspath(input_arg)
+    #The configuration file is parsed once and shared by all the checks
+    user_config_dict = {}
+    if configs_filepath is not None:
+        user_config_dict = load_configs(configs_filepath)
 
     #Check all arguments and configurations are supported for the input
     #Update the software dictionary depending on required software for specific input formats
     #e.g. ChimeraX for emd and map inputs
-    soft_dict = check_input_args(args.format, args.input, supported_dict['input_format'], soft_dict, args.configs)
-    input_filepath = '../'+args.input
+    soft_dict = check_input_args(input_format, input_arg, supported_dict['input_format'],
+                                 soft_dict, user_config_dict)
+    input_filepath = os.path.abspath(input_arg)
     #For emd entry inputs, the input name is emd_{entry number} and extension is emd
     input_name, input_exten = get_name_and_exten(input_filepath)
     #Check the meshing configurations if provided
-    if args.configs is not None:
+    if configs_filepath is not None:
         #Extract configs from yaml and update required software dictionary
         meshing_soft, mesh_config_dict, map_config_dict, chi_config_dict = \
-        extract_configs(args.configs, input_exten, soft_dict)
+        extract_configs(user_config_dict, input_exten, soft_dict)
         soft_dict.update(meshing_soft)
         check_meshing_args(mesh_config_dict, supported_dict)
+        check_map_args(map_config_dict)
         #Format/verify the mesh filename
-        if 'name' in mesh_config_dict:
-            mesh_filepath = check_mesh_filename(mesh_config_dict['name'],
-                                                mesh_config_dict['format'],
-                                                input_name)
-        else:
-            mesh_filepath = check_mesh_filename(None, mesh_config_dict['format'], input_name)
-
-
-    #If the visualisation flag is enabled add paraview to the software dictionary
-    if args.visualise:
-        soft_dict['paraview'] = ['5.7.0']
-
-    #Check all the required software is installed to run the pipeline
-    soft_dict = software_checks(soft_dict)
-
+        mesh_filepath = check_mesh_filename(mesh_config_dict.get('name'),
+                                            mesh_file_format(mesh_config_dict), input_name,
+                                            interactive)
     #Extract the mesh name from the filepath
     mesh_name, mesh_exten = get_name_and_exten(mesh_filepath)
+    return {'input': input_arg, 'input_format': input_format,
+            'input_filepath': input_filepath, 'input_name': input_name,
+            'input_exten': input_exten, 'mesh_config_dict': mesh_config_dict,
+            'map_config_dict': map_config_dict, 'chi_config_dict': chi_config_dict,
+            'configs_hash': config_hash({**mesh_config_dict, **map_config_dict,
+                                         **chi_config_dict}),
+            'mesh_filepath': mesh_filepath, 'mesh_name': mesh_name,
+            #Timeouts given on the command line override those in the configuration file
+            'timeouts': {**mesh_config_dict.get('timeouts', {}), **cli_timeouts},
+            'surface': None, 'exports': [], 'error': None}
 
-    #Make the run directory in which to store all other files
+def start_job(job, launch_directory, scratch_dir=None):
+    '''Makes the run directory of a job, in which to store all other files, and
+    changes to it'''
     now = datetime.now()
     date_time = now.strftime("_%d%m%Y_%H%M%S")
-    run_directory = mesh_name + date_time
-    runcmd = ['mkdir', run_directory]
-    launcher(runcmd)
+    run_directory = job['mesh_name'] + date_time
+    #Intermediate files are written to scratch and only the final artifacts moved back
+    if scratch_dir is not None:
+        run_root = os.path.abspath(scratch_dir)
+    else:
+        run_root = launch_directory
+    #Inputs of a batch started within the same second are given unique directories
+    count = 1
+    while os.path.exists(os.path.join(run_root, run_directory)) or \
+    os.path.exists(os.path.join(launch_directory, run_directory)):
+        count = count + 1
+        run_directory = job['mesh_name'] + date_time + '_' + str(count)
+    run_path = os.path.join(run_root, run_directory)
+    os.makedirs(run_path)
 
     #Change to the run directory so all subsequent files are stored here
-    os.chdir(run_directory)
+    os.chdir(run_path)
     print("------------------------------------------------------------------")
     print("All files generated by bio_saturne-meshingtool for this run can be\n"
-          "found in "+ run_directory)
+          "found in "+ run_path)
     print("------------------------------------------------------------------")
 
     #Make hidden directory to store temporary files
-    tmpcmd = ['mkdir', '.tmp']
-    launcher(tmpcmd)
+    os.mkdir('.tmp')
+    job['run_directory'] = run_directory
+    job['run_path'] = run_path
+    job['run_report'] = new_run_report(job, run_directory)
     #Make the logging folder for all log files during pipeline
-    log_foldr = make_logging_folder(mesh_name)
+    job['log_foldr'] = os.path.join(run_path, make_logging_folder(job['mesh_name']))
+    #Files of the job are given by absolute paths so stages don't depend on the working
+    #directory, which the async stage runner's threads share
+    job['mesh_filepath'] = os.path.join(run_path, job['mesh_filepath'])
+
+def download_job(job):
+    '''Downloads the map of an emd input, unless it has already been downloaded'''
+    if job['input_exten'] == 'emd' and 'map_filepath' not in job:
+        job['map_filepath'] = run_stage(job['run_report'], 'download', download_emd,
+                                        job['input_name'],
+                                        stage_timeout(job['timeouts'], 'download'))
 
+def prepare_surface(job, soft_dict):
+    '''Downloads and cleans the map of emd and map inputs, recording the file to
+    be surfaced by ChimeraX for emd, map and pdb inputs'''
+    run_report = job['run_report']
+    timeouts = job['timeouts']
+    job['surface'] = None
     #Handles emd entry number and map file inputs
-    if input_exten in ("emd", "map"):
-        if input_exten == 'emd': 
-            map_filepath = download_emd(input_name)
-        elif input_exten == 'map':
-            map_filepath = '../'+input_filepath
+    if job['input_exten'] in ("emd", "map"):
+        download_job(job)
+        map_filepath = job.get('map_filepath', job['input_filepath'])
         #Filters map and converts the format to stl
         map_name, map_exten = get_name_and_exten(map_filepath)
-        if map_config_dict != {}:
-            map_filepath = ccpem_cleaning(soft_dict['ccpem'][1], map_filepath, map_name,
-                                          map_config_dict)
-        input_name = to_stl(soft_dict['ucsf-chimerax'][1], map_filepath, map_name, map_exten,
-                            chi_config_dict, run_directory)
-        input_exten = 'stl'
-        input_filepath = input_name + '.' + input_exten
-    elif input_exten == 'pdb':
-        pdb_name, pdb_exten = get_name_and_exten(input_filepath)
-        #Generates a surface for the pdb and converts this to an STL using Chimera
-        input_name = to_stl(soft_dict['ucsf-chimerax'][1], input_filepath, pdb_name, 'pdb',
-                            chi_config_dict, run_directory)
-        input_exten = 'stl'
-        input_filepath = input_name + '.' + input_exten
-
-    #Handles STL file on input or from conversion
-    if input_exten == "stl":
+        if out_of_core_map(job['map_config_dict']):
+            map_filepath = run_stage(run_report, 'map_processing', process_map_chunked,
+                                     map_filepath, map_name, job['map_config_dict'])
+        elif job['map_config_dict'] != {}:
+            map_filepath = run_stage(run_report, 'ccpem', ccpem_cleaning, soft_dict['ccpem'][1],
+                                     map_filepath, map_name, job['map_config_dict'],
+                                     stage_timeout(timeouts, 'ccpem'))
+        job['surface'] = {'filepath': os.path.abspath(map_filepath), 'name': map_name,
+                          'exten': map_exten}
+    elif job['input_exten'] == 'pdb':
+        pdb_name, pdb_exten = get_name_and_exten(job['input_filepath'])
+        job['surface'] = {'filepath': job['input_filepath'], 'name': pdb_name,
+                          'exten': 'pdb'}
+    if job['surface'] is not None:
+        job['surface']['chi_config_dict'] = job['chi_config_dict']
+        job['surface']['run_path'] = job['run_path']
+
+def surfaced_job(job, stl_name):
+    '''Points the job at the STL generated by ChimeraX'''
+    job['input_name'] = stl_name
+    job['input_exten'] = 'stl'
+    job['input_filepath'] = os.path.join(job['run_path'], stl_name + '.stl')
+
+def surface_job(job, soft_dict):
+    '''Generates a surface for a single job and converts this to an STL using ChimeraX'''
+    if job['surface'] is None:
+        return
+    surf = job['surface']
+    surfaced_job(job, run_stage(job['run_report'], 'chimerax', to_stl,
+                                soft_dict['ucsf-chimerax'][1], surf['filepath'], surf['name'],
+                                surf['exten'], job['chi_config_dict'], job['run_directory'],
+                                stage_timeout(job['timeouts'], 'chimerax')))
+
+def surface_jobs(jobs, soft_dict):
+    '''Generates a surface for every job which needs one and converts this to an STL
+    using ChimeraX, with a single ChimeraX process for a batch of inputs'''
+    surf_jobs = [job for job in jobs if job['error'] is None and job['surface'] is not None]
+    if len(surf_jobs) <= 1:
+        run_jobs(jobs, surface_job, soft_dict)
+        return
+    #The batch runs until the longest of the inputs' timeouts
+    timeouts = [stage_timeout(job['timeouts'], 'chimerax') for job in surf_jobs]
+    timeout = None if None in timeouts else max(timeouts)
+    start = time.perf_counter()
+    usage = start_tool_memory()
+    try:
+        errors = to_stl_batch(soft_dict['ucsf-chimerax'][1],
+                              [job['surface'] for job in surf_jobs],
+                              os.path.join(surf_jobs[0]['run_path'], '.tmp'), timeout)
+    finally:
+        peak_memory = stop_tool_memory(usage)
+    duration = time.perf_counter() - start
+    #The inputs share the ChimeraX process, so its duration and peak memory
+    for ind, job in enumerate(surf_jobs):
+        if ind in errors:
+            job['error'] = errors[ind]
+            record_stage(job['run_report'], 'chimerax', 'failed', duration, peak_memory)
+            print(job['error'])
+        else:
+            surfaced_job(job, job['surface']['name'])
+            record_stage(job['run_report'], 'chimerax', 'success', duration, peak_memory)
+
+def mesh_job(job, soft_dict):
+    '''Meshes the STL of the job, which was given on input or converted'''
+    mesh_config_dict = job['mesh_config_dict']
+    if job['input_exten'] == "stl":
+        triangles = stl_triangle_count(job['input_filepath'])
+        with RUN_REPORT_LOCK:
+            job['run_report']['sizes']['surface_triangles'] = triangles
         #Handles meshing STL files using gmsh
         if mesh_config_dict['software'] == 'gmsh':
             print("\n----------------GMSH----------------\n")
-            gmsh_from_stl(soft_dict, mesh_config_dict, input_filepath, input_name, log_foldr,
-                          mesh_filepath, mesh_name)
+            mesher = gmsh_race if 'race' in mesh_config_dict else gmsh_with_fallbacks
+            run_stage(job['run_report'], 'gmsh', mesher, soft_dict,
+                      mesh_config_dict, job['input_filepath'], job['input_name'],
+                      job['log_foldr'], job['mesh_filepath'], job['mesh_name'],
+                      job['run_report'], stage_timeout(job['timeouts'], 'gmsh'))
+            if 'renumber' in mesh_config_dict:
+                print("\n----------------RENUMBER----------------\n")
+                renumbering = run_stage(job['run_report'], 'renumber', renumber_mesh,
+                                        job['mesh_filepath'], mesh_config_dict['renumber'])
+                with RUN_REPORT_LOCK:
+                    job['run_report']['renumbering'] = renumbering
+            if 'partitions' in mesh_config_dict:
+                print("\n----------------PARTITION----------------\n")
+                partitioning = run_stage(job['run_report'], 'partition', partition_mesh,
+                                         job['mesh_filepath'], mesh_config_dict['partitions'],
+                                         mesh_config_dict.get('partition_method'))
+                with RUN_REPORT_LOCK:
+                    job['run_report']['partitioning'] = partitioning
+            #FFEA files are exported from the mesh, which is kept for the quality check
+            if mesh_config_dict['format'] == 'ffea':
+                print("\n----------------FFEA----------------\n")
+                job['exports'] = run_stage(job['run_report'], 'ffea', export_ffea,
+                                           job['mesh_filepath'], job['mesh_name'],
+                                           mesh_config_dict.get('element_order', 2))
         #Handles meshing STL files using Salome
         elif mesh_config_dict['software'] == 'salome':
             print("salome")
 
-    #Run Quality Checks on resultant mesh_filepath
+def quality_job(job, soft_dict, args, quality_db):
+    '''Runs the quality checks on the resultant mesh of the job'''
     print("\n----------------CODESATURNE----------------\n")
-    quality_file = cs_prepro_quality(soft_dict['cs_preprocess'][1], soft_dict['code_saturne'][1],
-                                     mesh_filepath, log_foldr)
-    print("CodeSaturne quality assessment complete.\nFile: "+ run_directory +"/"+ quality_file +"\n")
-
+    quality_file = run_stage(job['run_report'], 'code_saturne', cs_prepro_quality,
+                             soft_dict['cs_preprocess'][1], soft_dict['code_saturne'][1],
+                             job['mesh_filepath'], job['log_foldr'],
+                             stage_timeout(job['timeouts'], 'code_saturne'),
+                             job.get('cs_study', False))
+    print("CodeSaturne quality assessment complete.\nFile: "+ job['run_directory'] +"/"
+          + quality_file +"\n")
+    job['quality_file'] = quality_file
     #If histogram flag is given then save data in histogram form for the mesh
-    if not args.histograms:
-        save_hist = False
-    else:
-        save_hist = True
-    process_cs_quality(quality_file, save_hist, mesh_name)
+    run_stage(job['run_report'], 'quality', process_cs_quality, quality_file, args.histograms,
+              job['mesh_name'], job['input'], job['input_format'], job['configs_hash'],
+              job['run_directory'], quality_db, args.hist_layout, args.hist_workers)
 
-    #Clean the directory by moving any intermediate files/folders to .tmp
+def cs_study_job(job, soft_dict):
+    '''Prepares the CodeSaturne study for the quality check of the job ahead of the mesh'''
+    run_stage(job['run_report'], 'cs_study', cs_quality_study, soft_dict['code_saturne'][1],
+              job['mesh_filepath'], stage_timeout(job['timeouts'], 'code_saturne'))
+    job['cs_study'] = True
+
+def archive_job(job):
+    '''Compresses the resultant mesh of the job when configured, after its quality check'''
+    if job['input_format'] != 'msh' and 'compress' in job['mesh_config_dict']:
+        print("\n----------------COMPRESS----------------\n")
+        job['mesh_filepath'] = run_stage(job['run_report'], 'compress', compress_mesh,
+                                         job['mesh_filepath'],
+                                         job['mesh_config_dict']['compress'])
+
+def finish_job(job, args, launch_directory, initial_contents):
+    '''Cleans the run directory of the job by the retention policy, which moves the
+    intermediate files/folders kept to .tmp, then moves the artifacts out of scratch'''
     print("\n----------------CLEAN----------------\n")
-    clean_directory(mesh_name, initial_contents)
-    print("Further files generated by intercalated software are stored in "
-          +run_directory+"/.tmp")
-    exit_tool()
+    mesh_name = job['mesh_name']
+    retention = apply_retention(job, 'success', initial_contents)
+    with RUN_REPORT_LOCK:
+        job['run_report']['retention'] = retention
+    print_retention(job['run_report']['retention'])
+    if args.scratch_dir is not None:
+        logs = [name for name in os.listdir('.')
+                if retention_class(name, job['log_foldr']) == 'logs']
+        artifacts = logs + [mesh_name+'_quality', write_run_report(job['run_report'])]
+        if job['input_format'] != 'msh':
+            artifacts[:0] = [job['mesh_filepath']] + job['exports']
+        collect_scratch_artifacts(artifacts, job['run_path'], os.path.join(
+            launch_directory, job['run_directory']), args.keep_scratch)
+    else:
+        write_run_report(job['run_report'])
+        print("Further files generated by intercalated software are stored in "
+              +job['run_directory']+"/.tmp")
 
+def retain_failed_jobs(jobs, initial_contents):
+    '''Applies the retention policy for failures to the run directories of the failed jobs,
+    which are otherwise left as they are'''
+    for job in jobs:
+        if job['error'] is None or 'run_path' not in job or \
+        'retention' in job['run_report'] or not os.path.isdir(job['run_path']):
+            continue
+        os.chdir(job['run_path'])
+        try:
+            retention = apply_retention(job, 'failure', initial_contents)
+            with RUN_REPORT_LOCK:
+                job['run_report']['retention'] = retention
+            write_run_report(job['run_report'])
+        except OSError as err:
+            print("Retention policy not applied to " + job['run_path'] + ": " + str(err))
 
-try:
-    main()
-except Exception as e:
-    print(e)
-    if not hasattr(e, 'message'):
-        print('\n----------------ERROR----------------\n')
-        print(logging.error(traceback.format_exc()))
-    elif '----------------' not in e.message:
-        print('\n----------------ERROR----------------\n')
-        print(logging.error(traceback.format_exc()))
-    exit_tool()
+def run_jobs(jobs, step, *args):
+    '''Runs a step of the pipeline in the run directory of every job which hasn't
+    failed, in a batch an error only fails the input which caused it'''
+    for job in jobs:
+        if job['error'] is not None:
+            continue
+        os.chdir(job['run_path'])
+        try:
+            step(job, *args)
+        except Exception as err:
+            if len(jobs) == 1:
+                raise
+            job['error'] = err
+            print(err)
+            print("\n" + job['input'] + " failed, continuing with the remaining inputs\n")
+
+async def run_stage_graph(stages):
+    '''Runs stages, given by name as (the names of the stages they need, function), each
+    as soon as the stages it needs have finished. Coroutine functions run in the event
+    loop and others in a worker thread. Raises the error of the first stage which failed'''
+    import asyncio
+    tasks = {}
+    async def run_graph_stage(name):
+        needs, function = stages[name]
+        for need in needs:
+            await tasks[need]
+        if asyncio.iscoroutinefunction(function):
+            return await function()
+        return await asyncio.to_thread(function)
+    try:
+        for name in stages:
+            tasks[name] = asyncio.ensure_future(run_graph_stage(name))
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    except BaseException:
+        #Cancelled stages leave the tools run by worker threads, which are stopped here
+        stop_live_processes()
+        raise
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+def run_job_async(job, soft_dict, known_softs, args, launch_directory, initial_contents,
+                  cost_model, quality_db):
+    '''Runs a single job with the async stage runner, so the software checks overlap
+    with the download and the CodeSaturne study is prepared while the mesh is generated'''
+    import asyncio
+    softs = {}
+    async def check_softs():
+        softs.update(await async_software_checks(soft_dict, known_softs))
+    #The run directory is made and entered in the event loop, before any stage starts in
+    #a worker thread, and no stage leaves the run directory while others run
+    async def start():
+        start_job(job, launch_directory, args.scratch_dir)
+        plan_job(job, cost_model)
+    #The heavy steps are still dispatched through the executor
+    stages = {'software': ([], check_softs),
+              'start': ([], start),
+              'download': (['start'], lambda: download_job(job)),
+              'map': (['download', 'software'], lambda: prepare_surface(job, softs)),
+              'surface': (['map'], lambda: surface_job(job, softs)),
+              'mesh': (['surface'], lambda: EXECUTORS[args.executor]([job], 'mesh', (softs,),
+                                                                     args)),
+              'cs_study': (['start', 'software'], lambda: cs_study_job(job, softs)),
+              'quality': (['mesh', 'cs_study'], lambda: EXECUTORS[args.executor](
+                  [job], 'quality', (softs, args, quality_db), args)),
+              'archive': (['quality'], lambda: archive_job(job)),
+              'finish': (['archive'], lambda: finish_job(job, args, launch_directory,
+                                                         initial_contents))}
+    asyncio.run(run_stage_graph(stages))
+
+def heavy_steps():
+    '''Returns the steps which run the heavy external tools (gmsh, cs_solver), by name
+    so they can be dispatched to another process or node'''
+    return {'mesh': mesh_job, 'quality': quality_job}
+
+def run_job_step(job, step, step_args):
+    '''Runs a step for one job in its run directory, in this or another process,
+    returning the updated job and the message of any error'''
+    os.chdir(job['run_path'])
+    try:
+        heavy_steps()[step](job, *step_args)
+    except Exception as err:
+        return job, getattr(err, 'message', traceback.format_exc())
+    #Errors which would end the tool (exit_tool) only fail the job in a worker
+    except SystemExit as err:
+        return job, "The " + step + " step exited with status " + str(err.code) + \
+        ", see its output"
+    return job, None
+
+def apply_step_result(jobs, job, updated_job, error):
+    '''Updates a job with the result of a step run by another process, in a batch an
+    error only fails the input which caused it'''
+    job.update(updated_job)
+    if error is None:
+        return
+    error = ExecutorError(job['input'], error)
+    if len(jobs) == 1:
+        raise error
+    job['error'] = error
+    print(error)
+    print("\n" + job['input'] + " failed, continuing with the remaining inputs\n")
+
+def execute_inline(jobs, step, step_args, args):
+    '''Runs the step for every job in turn in this process'''
+    run_jobs(jobs, heavy_steps()[step], *step_args)
+
+def init_step_worker():
+    '''Prepares a worker process of the local pool, which like an array task can't
+    prompt for input'''
+    PROMPTS['interactive'] = False
+
+def execute_local(jobs, step, step_args, args):
+    '''Runs the step for the jobs in parallel in a local pool of --workers processes'''
+    import concurrent.futures
+    pending = [job for job in jobs if job['error'] is None]
+    workers = min(args.workers, len(pending))
+    if workers <= 1:
+        return execute_inline(jobs, step, step_args, args)
+    #The async runner calls this from a stage thread, so workers are started by the
+    #fork server rather than forked from this process
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=forkserver_context(),
+                                                initializer=init_step_worker) as executor:
+        futures = [executor.submit(run_job_step, job, step, step_args) for job in pending]
+        results = [future.result() for future in futures]
+    for job, (updated_job, error) in zip(pending, results):
+        apply_step_result(jobs, job, updated_job, error)
+
+ARRAY_SCRIPT = '''#!/bin/sh
+#SBATCH --job-name=bio_saturne_{step}
+#SBATCH --array=0-{last}
+#SBATCH --output={task_dir}/task_%a.out
+#PBS -N bio_saturne_{step}
+#PBS -J 0-{last}
+#PBS -o {task_dir}
+#The task is given by the scheduler's array index, or as the first argument
+TASK_ID=${{SLURM_ARRAY_TASK_ID:-${{PBS_ARRAY_INDEX:-$1}}}}
+cd {task_dir}
+exec {python} {script} --run-task {task_dir}/task_$TASK_ID.pkl
+'''
+
+def write_array_tasks(jobs, step, step_args, array_dir):
+    '''Writes a task for every job and the job-array script which runs them, to a
+    directory shared with the compute nodes'''
+    import pickle
+    task_dir = os.path.join(os.path.abspath(array_dir), step + datetime.now().strftime(
+        "_%d%m%Y_%H%M%S_%f"))
+    os.makedirs(task_dir)
+    for task, job in enumerate(jobs):
+        with open(os.path.join(task_dir, 'task_' + str(task) + '.pkl'), 'wb') as task_file:
+            pickle.dump((job, step, step_args), task_file)
+    script_filepath = os.path.join(task_dir, step + '_array.sh')
+    with open(script_filepath, 'w') as script_file:
+        script_file.write(ARRAY_SCRIPT.format(step=step, last=len(jobs) - 1, task_dir=task_dir,
+                                              python=sys.executable,
+                                              script=os.path.abspath(__file__)))
+    os.chmod(script_filepath, 0o755)
+    return task_dir, script_filepath
+
+def run_array_task(task_filepath):
+    '''Runs a task of a job array (--run-task), writing the result next to it'''
+    import pickle
+    with open(task_filepath, 'rb') as task_file:
+        job, step, step_args = pickle.load(task_file)
+    result = run_job_step(job, step, step_args)
+    #The result is renamed into place so it is only collected once complete
+    with open(task_filepath + '.part', 'wb') as result_file:
+        pickle.dump(result, result_file)
+    os.replace(task_filepath + '.part', task_filepath[:-len('.pkl')] + '_result.pkl')
+    return result[1] is None
+
+def execute_array(jobs, step, step_args, args):
+    '''Runs the step for the jobs as a cluster job array, then collects the results
+    from the shared directory. With --submit-cmd local the tasks are run in turn on
+    this host instead of being submitted'''
+    import pickle
+    pending = [job for job in jobs if job['error'] is None]
+    if pending == []:
+        return
+    task_dir, script_filepath = write_array_tasks(pending, step, step_args, args.array_dir)
+    print("Job array for the " + step + " step written to " + script_filepath)
+    if args.submit_cmd == 'local':
+        for task in range(len(pending)):
+            with open(os.path.join(task_dir, 'task_' + str(task) + '.out'), 'w') as out_file:
+                subprocess.run(['sh', script_filepath, str(task)], stdout=out_file,
+                               stderr=subprocess.STDOUT, check=False)
+    else:
+        #The submit command is expected to block until the array finishes (e.g. sbatch --wait)
+        launcher(args.submit_cmd.split() + [script_filepath])
+    for task, job in enumerate(pending):
+        result_filepath = os.path.join(task_dir, 'task_' + str(task) + '_result.pkl')
+        if not os.path.isfile(result_filepath):
+            apply_step_result(jobs, job, {}, "The task produced no result, see " +
+                              os.path.join(task_dir, 'task_' + str(task) + '.out'))
+            continue
+        with open(result_filepath, 'rb') as result_file:
+            apply_step_result(jobs, job, *pickle.load(result_file))
+
+#Executors run a heavy step for every job which hasn't failed
+EXECUTORS = {'inline': execute_inline, 'local': execute_local, 'array': execute_array}
+
+def summarise_jobs(jobs):
+    '''Prints the outcome of every input in a batch and returns the number which failed'''
+    failed = [job for job in jobs if job['error'] is not None]
+    if len(jobs) > 1:
+        print("\n----------------BATCH SUMMARY----------------\n")
+        for job in jobs:
+            outcome = 'failed' if job['error'] is not None else 'success'
+            print(job['input'] + ": " + outcome + " (" + job.get('run_directory', '') + ")")
+        print("\n" + str(len(jobs) - len(failed)) + " of " + str(len(jobs)) + " inputs meshed")
+    return len(failed)
+
+def warm_softwares(base_softs):
+    '''Finds the software on $PATH which jobs may require, so the job server checks
+    it only once'''
+    known_softs = {}
+    softs = {**base_softs, 'gmsh': ['4.8'], 'ucsf-chimerax': ['1.3'], 'ccpem': ['1.5']}
+    for soft, ver in softs.items():
+        if which_software_path(soft) in ("", None):
+            continue
+        try:
+            known_softs[soft] = [ver[0], check_software_install(soft, ver[0])]
+        except SoftwareNotFound as err:
+            print(err)
+    return known_softs
+
+#Modules used by jobs, imported once by the fork server of the job server so jobs don't
+#pay for their imports
+WARM_MODULES = ['yaml', 'numpy', 'matplotlib.figure', 'matplotlib.backends.backend_agg',
+                'matplotlib.backends.backend_pdf', 'sqlite3']
+
+def forkserver_context():
+    '''Returns the multiprocessing context which starts worker processes from the fork
+    server, with this script and WARM_MODULES imported, rather than forking this process,
+    whose other threads (of the async stage runner or the job server) may hold locks'''
+    import multiprocessing
+    mp_context = multiprocessing.get_context('forkserver')
+    #Only applies if the fork server isn't running yet
+    mp_context.set_forkserver_preload(['__main__'] + WARM_MODULES)
+    return mp_context
+
+#Options (by dest) which jobs of the job server may give, any others must be left as their
+#defaults so a job can't run commands, load tasks or write outside its run directories
+SERVER_JOB_OPTIONS = ['input', 'format', 'configs', 'histograms', 'hist_layout', 'timeout',
+                      'no_quality_db', 'stage_runner', 'check', 'plan']
+
+def check_server_job_args(job_args):
+    '''Returns the error of the command-line arguments of a job of the job server, or
+    None if it only gives the options jobs are allowed to'''
+    parser = make_parser()
+    try:
+        args = vars(parser.parse_args(job_args))
+    except SystemExit:
+        return 'the arguments are not valid, see the usage of the command line'
+    defaults = vars(parser.parse_args([]))
+    refused = [dest for dest, value in args.items()
+               if dest not in SERVER_JOB_OPTIONS and value != defaults[dest]]
+    if refused != []:
+        return 'jobs may only give ' + ', '.join(SERVER_JOB_OPTIONS) + ' (not ' + \
+        ', '.join(refused) + ')'
+    return None
+
+def server_socket_filepath():
+    '''Returns the default Unix socket on which the job server listens'''
+    return os.path.join(os.path.dirname(software_cache_filepath()), 'server.sock')
+
+def run_server_job(record, base_softs, supported_dict, known_softs, cs_template, conn):
+    '''Runs a job of the job server in a process started by its fork server, writing its
+    output to the log of the job and sending back the outcome of every input'''
+    #The metrics of the job are sent back to the server rather than inherited from it
+    start_metrics(None, [])
+    PROMPTS['interactive'] = False
+    #The fork server was started before the template study was made
+    CS_TEMPLATE.update(cs_template)
+    log_fd = os.open(record['log'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.chdir(record['cwd'])
+    results = []
+    error = None
+    exit_code = 1
+    try:
+        parser = make_parser()
+        args = parser.parse_args(record['args'])
+        jobs = run_pipeline(parser, args, base_softs, supported_dict, known_softs)
+        exit_code = 1 if summarise_jobs(jobs) > 0 else 0
+        results = [{'input': job['input'], 'run_directory': job.get('run_directory'),
+                    'run_path': job.get('run_path'),
+                    'error': None if job['error'] is None else
+                    getattr(job['error'], 'message', str(job['error']))} for job in jobs]
+    #Arguments such as --check and argument errors end the job early
+    except SystemExit as err:
+        exit_code = err.code if isinstance(err.code, int) else 1
+    except Exception as err:
+        error = getattr(err, 'message', traceback.format_exc())
+        print(error)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.send({'results': results, 'error': error, 'metrics': metric_samples()})
+        conn.close()
+    os._exit(exit_code)
+
+def server_worker(state):
+    '''Runs queued jobs of the job server one at a time, each in a process started by
+    the fork server, which has the modules of the jobs imported but none of the threads
+    of the server'''
+    mp_context = state['mp_context']
+    while True:
+        record = state['jobs'][state['queue'].get()]
+        record['status'] = 'running'
+        record['started'] = datetime.now().isoformat(timespec='seconds')
+        receiver, sender = mp_context.Pipe(duplex=False)
+        process = mp_context.Process(target=run_server_job, args=(
+            record, state['base_softs'], state['supported_dict'], state['known_softs'],
+            state['cs_template'], sender))
+        process.start()
+        sender.close()
+        try:
+            outcome = receiver.recv()
+        except EOFError:
+            outcome = {'results': [], 'error': 'The job ended without a result, see its log',
+                       'metrics': {}}
+        with state['lock']:
+            for key, value in outcome.pop('metrics').items():
+                add_sample(METRICS['extra'], key[0], key[1], value)
+            update_metrics()
+        record.update(outcome)
+        process.join()
+        record['exit_code'] = process.exitcode
+        record['status'] = 'success' if process.exitcode == 0 else 'failed'
+        record['finished'] = datetime.now().isoformat(timespec='seconds')
+
+def job_status(record):
+    '''Returns the status of a job of the job server, with the run report of every input'''
+    status = dict(record)
+    status['run_reports'] = []
+    for result in record.get('results', []):
+        if result['run_path'] is None:
+            continue
+        for report in [f for f in os.listdir(result['run_path']) if f.endswith('_report.json')] \
+        if os.path.isdir(result['run_path']) else []:
+            with open(os.path.join(result['run_path'], report)) as report_file:
+                status['run_reports'].append(json.load(report_file))
+    return status
+
+def make_server_handler(state):
+    '''Returns the HTTP handler of the job server:
+    POST /jobs submits {"args": [command-line arguments], "cwd": directory}, where only
+    the options in SERVER_JOB_OPTIONS may be given,
+    GET /jobs lists the jobs, GET /jobs/ID gives the status and run reports of a job,
+    GET /jobs/ID/log its output, GET /health the queue and known software and
+    GET /metrics the metrics of the jobs run so far in the Prometheus text format'''
+    import http.server
+
+    class ServerHandler(http.server.BaseHTTPRequestHandler):
+        '''Handles the requests to the job server'''
+        def send_body(self, code, body, content_type='application/json'):
+            if content_type == 'application/json':
+                body = json.dumps(body, indent=2)
+            body = body.encode()
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = [part for part in self.path.split('/') if part != '']
+            statuses = [record['status'] for record in list(state['jobs'].values())]
+            if parts == ['health']:
+                return self.send_body(200, {'status': 'ok', 'queued': statuses.count('queued'),
+                                            'running': statuses.count('running'),
+                                            'workers': state['workers'],
+                                            'software': state['known_softs']})
+            if parts == ['metrics']:
+                with state['lock']:
+                    samples = metric_samples()
+                for status in ('queued', 'running'):
+                    samples[('bio_saturne_server_jobs', (('status', status),))] = statuses.count(
+                        status)
+                return self.send_body(200, format_metrics(samples),
+                                      'text/plain; version=0.0.4')
+            if parts == ['jobs']:
+                return self.send_body(200, [{key: record[key] for key in ('id', 'status',
+                                            'submitted')} for record in
+                                            list(state['jobs'].values())])
+            if len(parts) in (2, 3) and parts[0] == 'jobs' and parts[1] in state['jobs']:
+                record = state['jobs'][parts[1]]
+                if len(parts) == 2:
+                    return self.send_body(200, job_status(record))
+                if parts[2] == 'log':
+                    log = ''
+                    if os.path.isfile(record['log']):
+                        with open(record['log'], errors='replace') as log_file:
+                            log = log_file.read()
+                    return self.send_body(200, log, 'text/plain')
+            return self.send_body(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self.send_body(404, {'error': 'not found'})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                args = request['args']
+                cwd = os.path.abspath(request.get('cwd', state['cwd']))
+            except (ValueError, KeyError, TypeError):
+                return self.send_body(400, {'error': 'the job must be given as {"args": '
+                                            '[command-line arguments], "cwd": directory}'})
+            if not isinstance(args, list) or not all(isinstance(a, str) for a in args) or \
+            not os.path.isdir(cwd):
+                return self.send_body(400, {'error': 'args must be a list of strings and '
+                                            'cwd an existing directory'})
+            error = check_server_job_args(args)
+            if error is not None:
+                return self.send_body(403, {'error': error})
+            with state['lock']:
+                state['count'] = state['count'] + 1
+                job_id = str(state['count'])
+            state['jobs'][job_id] = {'id': job_id, 'args': args, 'cwd': cwd,
+                                     'status': 'queued',
+                                     'submitted': datetime.now().isoformat(timespec='seconds'),
+                                     'log': os.path.join(state['log_dir'], job_id + '.log')}
+            state['queue'].put(job_id)
+            return self.send_body(202, {'id': job_id, 'status': 'queued'})
+
+        def address_string(self):
+            #Clients of a Unix socket have no address
+            return 'local'
+
+        def log_message(self, format, *args):
+            return
+    return ServerHandler
+
+def serve(args, base_softs, supported_dict):
+    '''Runs the job server on a Unix socket only its user can connect to, running up to
+    --workers jobs at once so software paths, imported modules and the template
+    code_saturne study are only prepared once'''
+    import queue
+    import threading
+    import http.server
+    import socketserver
+    import multiprocessing
+    import multiprocessing.forkserver
+    #The fork server is started before any thread, jobs are forked from it rather than
+    #from the threaded HTTP server
+    mp_context = forkserver_context()
+    multiprocessing.forkserver.ensure_running()
+    start_metrics(args.metrics_file, [])
+    known_softs = warm_softwares(base_softs)
+    cache_dir = os.path.dirname(software_cache_filepath())
+    if 'code_saturne' in known_softs:
+        cs_template_study(known_softs['code_saturne'][1], cache_dir)
+    update_metrics()
+    log_dir = os.path.join(cache_dir, 'server_logs')
+    os.makedirs(log_dir, mode=0o700, exist_ok=True)
+    state = {'jobs': {}, 'queue': queue.Queue(), 'lock': threading.Lock(), 'count': 0,
+             'workers': args.workers, 'cwd': os.getcwd(), 'log_dir': log_dir,
+             'base_softs': base_softs, 'supported_dict': supported_dict,
+             'known_softs': known_softs, 'cs_template': dict(CS_TEMPLATE),
+             'mp_context': mp_context}
+    for _ in range(args.workers):
+        threading.Thread(target=server_worker, args=(state,), daemon=True).start()
+
+    class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+        '''Threaded HTTP server on a Unix socket'''
+        daemon_threads = True
+
+    socket_filepath = os.path.abspath(args.socket or server_socket_filepath())
+    os.makedirs(os.path.dirname(socket_filepath), exist_ok=True)
+    if os.path.exists(socket_filepath):
+        os.remove(socket_filepath)
+    #The socket is created with 0600 permissions so only this user can submit jobs
+    umask = os.umask(0o177)
+    try:
+        server = UnixHTTPServer(socket_filepath, make_server_handler(state))
+    finally:
+        os.umask(umask)
+    print("Job server listening on " + socket_filepath + " with " + str(args.workers) +
+          " workers")
+    print("Known software: " + ', '.join(known_softs))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+    finally:
+        os.remove(socket_filepath)
+
+"""Stand-in executables used by --benchmark for the external tools which aren't installed.
+They do no real work (copying the synthetic surface, mesh and quality log given by the
+benchmark), so the benchmark measures the overhead of this tool itself"""
+BENCH_STAND_INS = {
+    'gmsh': '''import os
+import sys
+import shutil
+args = sys.argv[1:]
+if '--version' in args:
+    print('4.11.1')
+    sys.exit()
+shutil.copy(os.environ['BIO_SATURNE_BENCH_MESH'], args[args.index('-o') + 1])
+print('Info    : Done meshing 3D')
+print('Info    : ' + os.environ['BIO_SATURNE_BENCH_COUNTS'])
+''',
+    'ucsf-chimerax': '''import os
+import sys
+import types
+import shutil
+args = sys.argv[1:]
+if '--version' in args:
+    print('UCSF ChimeraX version: 1.6.1')
+    sys.exit()
+def run(session, command, log=True):
+    if command.startswith('save '):
+        shutil.copy(os.environ['BIO_SATURNE_BENCH_STL'], command.split()[1])
+if args[-1].endswith('.py'):
+    commands = types.ModuleType('chimerax.core.commands')
+    commands.run = run
+    sys.modules['chimerax'] = types.ModuleType('chimerax')
+    sys.modules['chimerax.core'] = types.ModuleType('chimerax.core')
+    sys.modules['chimerax.core.commands'] = commands
+    with open(args[-1]) as script_file:
+        exec(script_file.read(), {'session': None})
 else:
-    print("Unexpected Error Occurred")
+    with open(args[-1]) as script_file:
+        for line in script_file:
+            run(None, line.strip())
+''',
+    'code_saturne': '''import os
+import sys
+args = sys.argv[1:]
+if '--version' in args:
+    print('code_saturne 7.0.4')
+    sys.exit()
+if args[0] == 'create':
+    study = args[args.index('--study') + 1]
+    case = args[args.index('--study') + 2]
+    for folder in ('MESH', case + '/DATA/REFERENCE', case + '/SRC/REFERENCE', case + '/RESU'):
+        os.makedirs(os.path.join(study, folder), exist_ok=True)
+    with open(os.path.join(study, case, 'DATA/REFERENCE/cs_user_scripts.py'), 'w') as script:
+        script.write('def define_domain_parameters(domain):\\n    domain.mesh_input = None\\n')
+    with open(os.path.join(study, case, 'SRC/REFERENCE/cs_user_mesh.c'), 'w') as source:
+        source.write('/* cs_user_mesh.c */\\n')
+elif args[0] == 'run':
+    os.makedirs(os.path.join(args[args.index('--case') + 1], 'RESU',
+                             args[args.index('--id') + 1]), exist_ok=True)
+''',
+    'cs_preprocess': '''import sys
+if '--version' in sys.argv:
+    print('code_saturne preprocessor 7.0.4')
+    sys.exit()
+with open('mesh_input.csm', 'w') as mesh_file:
+    mesh_file.write('csm')
+''',
+    'cs_solver': '''import os
+import sys
+import shutil
+shutil.copy(os.environ['BIO_SATURNE_BENCH_QUALITY'],
+            os.path.join(sys.argv[sys.argv.index('-wdir') + 1], 'run_solver.log'))
+''',
+}
+
+#Metrics of the synthetic quality log, as named in code_saturne's run_solver.log
+BENCH_QUALITY_METRICS = ['cells off-centering coefficient', 'cells distance to face',
+                         'cells least-squares gradient weight', 'cell non-orthogonality',
+                         'faces warping', 'cell volume', 'faces surface', 'cell size ratio']
+
+def bench_stand_ins(bin_dir):
+    '''Writes a stand-in executable for every external tool which isn't installed, and
+    returns whether the real tool or a stand-in is used for each'''
+    os.makedirs(bin_dir, exist_ok=True)
+    tools = {}
+    for tool, source in BENCH_STAND_INS.items():
+        if which_software_path(tool) not in ("", None):
+            tools[tool] = 'real'
+            continue
+        tool_filepath = os.path.join(bin_dir, tool)
+        with open(tool_filepath, 'w') as tool_file:
+            tool_file.write('#!' + sys.executable + '\n' + source)
+        os.chmod(tool_filepath, 0o755)
+        tools[tool] = 'stand-in'
+    return tools
+
+def bench_icosphere(subdivisions, radius=20.0):
+    '''Returns the triangles of an icosphere, each subdivision giving 4 times as many'''
+    np = import_numpy()
+    golden = (1 + math.sqrt(5)) / 2
+    vertices = np.array([[-1, golden, 0], [1, golden, 0], [-1, -golden, 0], [1, -golden, 0],
+                         [0, -1, golden], [0, 1, golden], [0, -1, -golden], [0, 1, -golden],
+                         [golden, 0, -1], [golden, 0, 1], [-golden, 0, -1], [-golden, 0, 1]])
+    faces = [[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4],
+             [11, 10, 2], [10, 7, 6], [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8],
+             [3, 8, 9], [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]]
+    triangles = vertices[faces]
+    for _ in range(subdivisions):
+        corner_a, corner_b, corner_c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        mid_ab, mid_bc, mid_ca = (corner_a + corner_b) / 2, (corner_b + corner_c) / 2, \
+        (corner_c + corner_a) / 2
+        triangles = np.concatenate([np.stack(corners, axis=1) for corners in (
+            (corner_a, mid_ab, mid_ca), (mid_ab, corner_b, mid_bc),
+            (mid_ca, mid_bc, corner_c), (mid_ab, mid_bc, mid_ca))])
+    return triangles / np.linalg.norm(triangles, axis=2, keepdims=True) * radius
+
+def write_bench_stl(stl_filepath, triangles):
+    '''Writes triangles as a binary STL'''
+    np = import_numpy()
+    records = np.zeros(len(triangles), dtype=[('normal', '<f4', 3), ('vertices', '<f4', (3, 3)),
+                                              ('attribute', '<u2')])
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    records['normal'] = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    records['vertices'] = triangles
+    with open(stl_filepath, 'wb') as stl_file:
+        stl_file.write(b'bio_saturne-meshingtool benchmark surface'.ljust(80))
+        stl_file.write(np.array([len(triangles)], '<u4').tobytes())
+        stl_file.write(records.tobytes())
+
+def write_bench_mrc(map_filepath, size, voxel_size=1.0):
+    '''Writes a cubic MRC map of Gaussian density blobs with background noise'''
+    np = import_numpy()
+    rng = np.random.default_rng(0)
+    axis = np.arange(size, dtype=np.float32)
+    density = rng.normal(0, 0.02, (size, size, size)).astype(np.float32)
+    for centre in rng.uniform(size * 0.3, size * 0.7, (8, 3)):
+        squares = [(axis - coord) ** 2 for coord in centre]
+        density += np.exp(-(squares[2][:, None, None] + squares[1][None, :, None] +
+                            squares[0][None, None, :]) / (2 * (size / 10) ** 2))
+    ints = np.zeros(256, '<i4')
+    floats = ints.view('<f4')
+    ints[0:3] = size
+    ints[3] = 2
+    ints[7:10] = size
+    floats[10:13] = size * voxel_size
+    floats[13:16] = 90
+    ints[16:19] = [1, 2, 3]
+    floats[19:22] = [density.min(), density.max(), density.mean()]
+    floats[54] = density.std()
+    header = bytearray(ints.tobytes())
+    header[208:214] = b'MAP DD'
+    with open(map_filepath, 'wb') as map_file:
+        map_file.write(bytes(header))
+        map_file.write(density.tobytes())
+
+def write_bench_pdb(pdb_filepath, num_atoms):
+    '''Writes a PDB of alpha carbons packed at random in a sphere'''
+    np = import_numpy()
+    rng = np.random.default_rng(0)
+    radius = 1.9 * num_atoms ** (1 / 3)
+    directions = rng.normal(size=(num_atoms, 3))
+    coords = directions / np.linalg.norm(directions, axis=1, keepdims=True) * \
+    radius * rng.uniform(0, 1, (num_atoms, 1)) ** (1 / 3)
+    with open(pdb_filepath, 'w') as pdb_file:
+        for ind, (x_coord, y_coord, z_coord) in enumerate(coords):
+            pdb_file.write('ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00  0.00           C\n'
+                           % ((ind + 1) % 100000, (ind + 1) % 10000, x_coord, y_coord, z_coord))
+        pdb_file.write('END\n')
+
+def bench_grid_mesh(cells, length=40.0):
+    '''Returns a mesh, as read by read_msh, of a cube split into cells^3 cubes of
+    6 positively oriented tetrahedra'''
+    np = import_numpy()
+    ticks = np.linspace(0, length, cells + 1)
+    z_coords, y_coords, x_coords = np.meshgrid(ticks, ticks, ticks, indexing='ij')
+    coords = np.stack([x_coords.ravel(), y_coords.ravel(), z_coords.ravel()], axis=1)
+    index = np.arange((cells + 1) ** 3).reshape(cells + 1, cells + 1, cells + 1)
+    #The corners of every cube, numbered by their x, y and z bits
+    corners = np.stack([index[k:k + cells, j:j + cells, i:i + cells].ravel() for k in (0, 1)
+                        for j in (0, 1) for i in (0, 1)], axis=1)
+    tets = corners[:, [[0, 1, 3, 7], [0, 3, 2, 7], [0, 2, 6, 7], [0, 6, 4, 7], [0, 4, 5, 7],
+                       [0, 5, 1, 7]]].reshape(-1, 4)
+    edges = coords[tets[:, 1:]] - coords[tets[:, :1]]
+    negative = np.einsum('ij,ij->i', np.cross(edges[:, 0], edges[:, 1]), edges[:, 2]) < 0
+    tets[negative] = tets[negative][:, [0, 2, 1, 3]]
+    rows = np.concatenate([np.arange(1, len(tets) + 1)[:, None], tets + 1], axis=1)
+    return {'binary': False, 'physical_names': [],
+            'entities': [(3, 1, [0.0, 0.0, 0.0, length, length, length], [], [])],
+            'node_blocks': [[[3, 1, 0], np.arange(1, len(coords) + 1, dtype=np.uint64), coords]],
+            'element_blocks': [[[3, 1, 4], rows.astype(np.uint64)]], 'data': []}
+
+def write_bench_quality_log(log_filepath, num_cells, num_lines):
+    '''Writes a quality log in the format of code_saturne's run_solver.log, with
+    num_lines lines of solver output before the histograms'''
+    import random
+    rng = random.Random(0)
+    with open(log_filepath, 'w') as log_file:
+        for ind in range(num_lines):
+            log_file.write('  Reading mesh section %d of %d: %d elements\n'
+                           % (ind + 1, num_lines, rng.randint(1, num_cells)))
+        log_file.write('\n  Number of cells:          %d\n' % num_cells)
+        log_file.write('  Number of interior faces: %d\n' % (2 * num_cells))
+        log_file.write('  Number of vertices:       %d\n\n' % (num_cells // 5))
+        for metric in BENCH_QUALITY_METRICS:
+            edges = sorted(rng.uniform(1e-3, 1) for _ in range(11))
+            log_file.write('  Histogram of the %s:\n\n' % metric)
+            log_file.write('    minimum value =         %.5e\n' % edges[0])
+            log_file.write('    maximum value =         %.5e\n\n' % edges[-1])
+            counts = [rng.randint(0, num_cells // 5) for _ in range(10)]
+            for ind, count in enumerate(counts):
+                log_file.write('     %2d : [ %.5e ; %.5e %s = %10d\n' % (
+                    ind + 1, edges[ind], edges[ind + 1], ']' if ind == 9 else '[', count))
+            log_file.write('\n')
+
+def bench_inputs(input_dir, level):
+    '''Generates the synthetic inputs of a size level, each level being about ten
+    times larger than the last'''
+    os.makedirs(input_dir, exist_ok=True)
+    prefix = os.path.join(input_dir, 'bench_' + str(level))
+    subdivisions = 2 * level
+    map_size = 32 * 2 ** (level - 1)
+    num_atoms = 1000 * 10 ** (level - 1)
+    cells = 8 * 2 ** (level - 1)
+    inputs = {'stl': prefix + '_sphere.stl', 'map': prefix + '_blobs.map',
+              'pdb': prefix + '_atoms.pdb', 'msh': prefix + '_grid.msh',
+              'quality_log': prefix + '_run_solver.log'}
+    write_bench_stl(inputs['stl'], bench_icosphere(subdivisions))
+    write_bench_mrc(inputs['map'], map_size)
+    write_bench_pdb(inputs['pdb'], num_atoms)
+    mesh = bench_grid_mesh(cells)
+    write_msh(inputs['msh'], mesh)
+    num_nodes, num_elements = (cells + 1) ** 3, 6 * cells ** 3
+    write_bench_quality_log(inputs['quality_log'], num_elements, 1000 * 10 ** (level - 1))
+    inputs['sizes'] = {'stl_triangles': 20 * 4 ** subdivisions, 'map_voxels': map_size ** 3,
+                       'pdb_atoms': num_atoms, 'msh_elements': num_elements,
+                       'quality_log_lines': 1000 * 10 ** (level - 1)}
+    inputs['counts'] = str(num_nodes) + ' nodes ' + str(num_elements) + ' elements'
+    return inputs
+
+def bench_launcher(bench, level):
+    '''Launches a trivial process through launcher'''
+    start = time.perf_counter()
+    for _ in range(20):
+        launcher([['true']])
+    return time.perf_counter() - start, 20
+
+def bench_extract_configs(bench, level):
+    '''Parses and checks a configuration file with every mesh option'''
+    with open('configs.yaml', 'w') as configs_file:
+        configs_file.write('software: gmsh\nformat: ffea\nname: bench\nbinary: true\n'
+                           'compress: xz\nelement_order: 2\nrenumber: hilbert\npartitions: 4\n'
+                           'partition_method: rcb\ngrid_spacing: 0.5\ntimeouts:\n  gmsh: 3600\n'
+                           'gmsh_options:\n  Mesh.Algorithm3D: 10\nfallbacks:\n'
+                           '  - gmsh_options:\n      Mesh.Algorithm3D: 1\n'
+                           '    remesh_surface: true\nbudget:\n  elements: 1000000\n')
+    start = time.perf_counter()
+    for _ in range(200):
+        configs = extract_configs(load_configs('configs.yaml'), 'stl', {'gmsh': ['4.8']})
+        check_meshing_args(configs[1], bench['supported_dict'])
+    return time.perf_counter() - start, 200
+
+def bench_parse_quality_file(bench, level):
+    '''Parses the synthetic quality log'''
+    start = time.perf_counter()
+    parse_quality_file(bench['inputs'][level]['quality_log'])
+    return time.perf_counter() - start, 1
+
+def bench_generate_histograms(bench, level):
+    '''Renders the histograms of the synthetic quality log, one pdf each'''
+    mesh_stats, histograms = parse_quality_file(bench['inputs'][level]['quality_log'])
+    os.makedirs('bench_quality/bench_histograms')
+    start = time.perf_counter()
+    generate_histograms(histograms, 'bench', 'pdf', 1)
+    return time.perf_counter() - start, 1
+
+def bench_apply_retention(bench, level):
+    '''Applies a retention policy to a run directory of files and folders, compressing
+    its logs and deleting half of its intermediate files'''
+    initial_contents = get_initial_dir()
+    os.mkdir('.tmp')
+    os.mkdir('bench_loggers')
+    for ind in range(100 * 10 ** (level - 1)):
+        with open(os.path.join('bench_loggers', 'log_' + str(ind) + '.log'), 'w') as log_file:
+            log_file.write('Info    : meshing\n' * 100)
+        name = ('bench_' if ind % 2 == 0 else 'intermediate_') + str(ind)
+        if ind % 4 < 2:
+            os.mkdir(name)
+        else:
+            open(name + '.txt', 'w').close()
+    job = {'mesh_name': 'bench', 'log_foldr': 'bench_loggers', 'mesh_config_dict': {
+        'retention': {'success': {'logs': 'compress', 'intermediates': 'delete'}}}}
+    start = time.perf_counter()
+    apply_retention(job, 'success', initial_contents)
+    return time.perf_counter() - start, 1
+
+def bench_stl_features(bench, level):
+    '''Measures the synthetic surface for the cost model'''
+    start = time.perf_counter()
+    stl_features(bench['inputs'][level]['stl'])
+    return time.perf_counter() - start, 1
+
+def bench_process_map(bench, level):
+    '''Bins and thresholds the synthetic map out-of-core in small chunks'''
+    start = time.perf_counter()
+    process_map_chunked(bench['inputs'][level]['map'], 'bench',
+                        {'threshold': 0.1, 'bin_factor': 2, 'memory_limit': 4})
+    return time.perf_counter() - start, 1
+
+def bench_convert_msh(bench, level):
+    '''Converts the synthetic mesh from ASCII to binary'''
+    start = time.perf_counter()
+    convert_msh(bench['inputs'][level]['msh'], 'bench.msh', True)
+    return time.perf_counter() - start, 1
+
+def bench_mesh_step(function, *args):
+    '''Returns a benchmark case which runs a step on a copy of the synthetic mesh'''
+    def bench_step(bench, level):
+        shutil.copy(bench['inputs'][level]['msh'], 'bench.msh')
+        start = time.perf_counter()
+        function('bench.msh', *args)
+        return time.perf_counter() - start, 1
+    return bench_step
+
+def bench_pipeline(input_format, configs):
+    '''Returns a benchmark case which runs the whole pipeline on a synthetic input'''
+    def bench_run(bench, level):
+        args = ['-i', bench['inputs'][level][input_format], '-f', input_format]
+        if configs is not None:
+            with open('configs.yaml', 'w') as configs_file:
+                configs_file.write(configs)
+            args = args + ['-c', 'configs.yaml']
+        parser = make_parser()
+        start = time.perf_counter()
+        jobs = run_pipeline(parser, parser.parse_args(args), bench['base_softs'],
+                            bench['supported_dict'])
+        duration = time.perf_counter() - start
+        if jobs[0]['error'] is not None:
+            raise jobs[0]['error']
+        return duration, 1
+    return bench_run
+
+#Benchmark cases, the modules they require and whether they are run at every size level
+BENCH_CASES = [
+    ('launcher', bench_launcher, [], False),
+    ('extract_configs', bench_extract_configs, ['yaml'], False),
+    ('parse_quality_file', bench_parse_quality_file, [], True),
+    ('generate_histograms', bench_generate_histograms, ['matplotlib'], False),
+    ('apply_retention', bench_apply_retention, [], True),
+    ('stl_features', bench_stl_features, [], True),
+    ('process_map_chunked', bench_process_map, [], True),
+    ('convert_msh', bench_convert_msh, [], True),
+    ('renumber_mesh', bench_mesh_step(renumber_mesh, 'hilbert'), [], True),
+    ('partition_mesh', bench_mesh_step(partition_mesh, 4, 'rcb'), [], True),
+    ('export_ffea', bench_mesh_step(export_ffea, 'bench', 2), [], True),
+    ('pipeline_stl', bench_pipeline('stl', 'software: gmsh\nformat: msh\n'), ['yaml'], True),
+    ('pipeline_pdb', bench_pipeline('pdb', 'software: gmsh\nformat: msh\nprobe_radius: 1.4\n'),
+     ['yaml'], True),
+    ('pipeline_map', bench_pipeline('map', 'software: gmsh\nformat: msh\nout_of_core: true\n'
+                                    'bin_factor: 2\nthreshold: 0.1\n'), ['yaml'], True),
+    ('pipeline_msh', bench_pipeline('msh', None), [], True),
+]
+
+def bench_case_process(function, bench, level, case_dir, conn):
+    '''Runs a benchmark case in a forked process, writing its output to the case
+    directory and sending back its duration and peak memory'''
+    import resource
+    log_fd = os.open(os.path.join(case_dir, 'output.log'), os.O_WRONLY | os.O_CREAT, 0o644)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.chdir(case_dir)
+    outcome = {'error': None}
+    #The tools are measured one by one as they exit, as run stages are
+    usage = start_tool_memory()
+    try:
+        outcome['seconds'], outcome['calls'] = function(bench, level)
+        outcome['peak_memory_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        outcome['tools_peak_memory_mb'] = stop_tool_memory(usage)
+    #Errors which end the tool (SystemExit) also fail the case
+    except BaseException as err:
+        outcome['error'] = getattr(err, 'message', traceback.format_exc())
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.send(outcome)
+        conn.close()
+    os._exit(0)
+
+def run_bench_case(bench, case, function, level, repeats):
+    '''Runs every repeat of a benchmark case in its own forked process, so the peak
+    memory is that of the case, and returns its median and minimum durations'''
+    import multiprocessing
+    mp_context = multiprocessing.get_context('fork')
+    result = {'case': case, 'level': level, 'status': 'success'}
+    outcomes = []
+    for repeat in range(repeats):
+        case_dir = os.path.join(bench['dir'], 'runs', case + '_' + str(level) + '_' + str(repeat))
+        os.makedirs(case_dir)
+        receiver, sender = mp_context.Pipe(duplex=False)
+        process = mp_context.Process(target=bench_case_process, args=(function, bench, level,
+                                                                     case_dir, sender))
+        process.start()
+        sender.close()
+        try:
+            outcome = receiver.recv()
+        except EOFError:
+            outcome = {'error': 'The case ended without a result'}
+        process.join()
+        if outcome['error'] is not None:
+            result.update({'status': 'failed', 'error': outcome['error'],
+                           'output': os.path.join(case_dir, 'output.log')})
+            return result
+        shutil.rmtree(case_dir)
+        outcomes.append(outcome)
+    timings = sorted(outcome['seconds'] for outcome in outcomes)
+    tools_peaks = [outcome['tools_peak_memory_mb'] for outcome in outcomes
+                   if outcome['tools_peak_memory_mb'] is not None]
+    result.update({'calls': outcomes[0]['calls'], 'seconds': round(median(timings), 6),
+                   'min_seconds': round(timings[0], 6),
+                   'peak_memory_mb': round(max(o['peak_memory_mb'] for o in outcomes), 1),
+                   'tools_peak_memory_mb': round(max(tools_peaks), 1) if tools_peaks != []
+                   else None})
+    return result
+
+def print_bench_result(result):
+    '''Prints a line of the benchmark results table'''
+    if result['status'] != 'success':
+        print('{:<22}{:>6}  {}'.format(result['case'], result['level'], result['status']))
+        return
+    #Tools which used no more memory than the case itself have no peak of their own
+    tools_peak = result['tools_peak_memory_mb']
+    print('{:<22}{:>6}{:>8}{:>12.4f}{:>12.4f}{:>10.1f}{:>10}'.format(
+        result['case'], result['level'], result['calls'], result['seconds'],
+        result['min_seconds'], result['peak_memory_mb'],
+        '-' if tools_peak is None else format(tools_peak, '.1f')))
+
+def compare_benchmarks(results, baseline_filepath, tolerance):
+    '''Prints the change in duration and peak memory of every case from a baseline
+    results file, returning the number of cases slower or larger than the tolerance'''
+    try:
+        with open(baseline_filepath) as baseline_file:
+            baseline = json.load(baseline_file)
+    except (OSError, ValueError) as err:
+        raise InputError('benchmark baseline', "\nUnable to read " + baseline_filepath +
+                         ": " + str(err))
+    base_cases = {(case['case'], case['level']): case for case in baseline['cases']
+                  if case['status'] == 'success'}
+    print("\n----------------COMPARISON----------------\n")
+    print("Baseline " + baseline_filepath + " (commit " + str(baseline.get('commit')) + ")\n")
+    print('{:<22}{:>6}{:>12}{:>12}{:>10}{:>10}'.format('case', 'level', 'base (s)', 'now (s)',
+                                                        'time', 'memory'))
+    regressions = 0
+    for case in results['cases']:
+        base_case = base_cases.get((case['case'], case['level']))
+        if base_case is None or case['status'] != 'success':
+            continue
+        time_ratio = case['seconds'] / max(base_case['seconds'], 1e-9)
+        memory_ratio = case['peak_memory_mb'] / max(base_case['peak_memory_mb'], 1e-9)
+        regressed = time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance
+        regressions = regressions + regressed
+        print('{:<22}{:>6}{:>12.4f}{:>12.4f}{:>9.2f}x{:>9.2f}x{}'.format(
+            case['case'], case['level'], base_case['seconds'], case['seconds'], time_ratio,
+            memory_ratio, '  REGRESSION' if regressed else ''))
+    print("\n" + str(regressions) + " cases regressed by more than " +
+          format(tolerance * 100, 'g') + "%")
+    return regressions
+
+def bench_commit():
+    '''Returns the git commit of this script, marked as dirty if it has uncommitted
+    changes, if it is in a git repository'''
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                                text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return commit.stdout.strip() if commit.returncode == 0 else None
+
+def run_benchmark(args, base_softs, supported_dict):
+    '''Runs every benchmark case on synthetic inputs of each size level, with the real
+    external tools when installed and stand-ins otherwise, and writes the durations and
+    peak memory to the results file. Returns the exit status'''
+    import platform
+    import tempfile
+    import importlib.util
+    import_numpy()
+    results_filepath = os.path.abspath(args.benchmark)
+    bench_dir = tempfile.mkdtemp(prefix='bio_saturne_bench_')
+    tools = bench_stand_ins(os.path.join(bench_dir, 'bin'))
+    os.environ['PATH'] = os.path.join(bench_dir, 'bin') + os.pathsep + os.environ['PATH']
+    #Software versions are cached in the benchmark so every case sees a warm cache
+    os.environ['XDG_CACHE_HOME'] = os.path.join(bench_dir, 'cache')
+    #Quality records of the benchmark runs are kept out of the user's quality database
+    os.environ['XDG_DATA_HOME'] = os.path.join(bench_dir, 'data')
+    software_checks({**base_softs, 'gmsh': ['4.8'], 'ucsf-chimerax': ['1.3']})
+    print("\n----------------BENCHMARK----------------\n")
+    print("Tools: " + ', '.join(tool + ' (' + use + ')' for tool, use in tools.items()))
+    levels = sorted(set(args.bench_levels))
+    bench = {'dir': bench_dir, 'base_softs': base_softs, 'supported_dict': supported_dict,
+             'inputs': {}}
+    for level in levels:
+        bench['inputs'][level] = bench_inputs(os.path.join(bench_dir, 'inputs'), level)
+    results = {'created': datetime.now().isoformat(timespec='seconds'),
+               'commit': bench_commit(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'cpus': os.cpu_count(),
+               'repeats': args.bench_repeats, 'tools': tools,
+               'levels': {str(level): bench['inputs'][level]['sizes'] for level in levels},
+               'cases': []}
+    print('\n{:<22}{:>6}{:>8}{:>12}{:>12}{:>10}{:>10}'.format(
+        'case', 'level', 'calls', 'median (s)', 'min (s)', 'peak MB', 'tools MB'))
+    for case, function, modules, sized in BENCH_CASES:
+        missing = [module for module in modules if importlib.util.find_spec(module) is None]
+        for level in levels if sized else levels[:1]:
+            if missing != []:
+                result = {'case': case, 'level': level, 'status': 'skipped',
+                          'error': 'requires ' + ', '.join(missing)}
+            else:
+                os.environ['BIO_SATURNE_BENCH_STL'] = bench['inputs'][level]['stl']
+                os.environ['BIO_SATURNE_BENCH_MESH'] = bench['inputs'][level]['msh']
+                os.environ['BIO_SATURNE_BENCH_COUNTS'] = bench['inputs'][level]['counts']
+                os.environ['BIO_SATURNE_BENCH_QUALITY'] = bench['inputs'][level]['quality_log']
+                result = run_bench_case(bench, case, function, level, args.bench_repeats)
+            results['cases'].append(result)
+            print_bench_result(result)
+    with open(results_filepath, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print("\nResults written to " + results_filepath)
+    failed = [result for result in results['cases'] if result['status'] == 'failed']
+    for result in failed:
+        print("\n" + result['case'] + " (level " + str(result['level']) + ") failed, see " +
+              result['output'] + "\n" + result['error'])
+    if failed == []:
+        shutil.rmtree(bench_dir)
+    regressions = 0
+    if args.bench_compare is not None:
+        regressions = compare_benchmarks(results, os.path.abspath(args.bench_compare),
+                                         args.bench_tolerance)
+    return 1 if failed != [] or regressions > 0 else 0
+
+def make_parser():
+    '''Returns the parser of the command-line arguments, which are also the
+    arguments of jobs submitted to the job server'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", required=False, nargs='+', help="path to the input "
+    "file, or to several input files of the same format to run as a batch")
+    parser.add_argument("-f", "--format", required=False, help="format of the input file")
+    parser.add_argument("-c", "--configs", required=False, nargs='+', help="file name (and "
+    "path) to configuration yaml file, either one for all inputs or one per input")
+    #Histograms and visualisation are optional flags
+    parser.add_argument("-hg", "--histograms", required=False, help="flag to generate "
+    "histograms to assess mesh quality", action="store_true")
+    parser.add_argument("--hist-layout", required=False, default='pdf',
+    choices=['pdf', 'multipage', 'grid'], help="save histograms as one pdf each (pdf), "
+    "as the pages of one pdf (multipage) or as a grid on one png (grid)")
+    parser.add_argument("--hist-workers", required=False, type=int, default=os.cpu_count(),
+    help="number of worker processes used to render histograms as one pdf each")
+    parser.add_argument("-v", "--visualise", required=False, help="Generates a "
+    "visualisation of the surface in Paraview", action='store_true')
+    #Quality records of every run are appended to a database which can be queried
+    parser.add_argument("--quality-db", required=False, help="SQLite database in which to "
+    "store the quality record of the mesh, by default quality.db in the user's data "
+    "directory")
+    parser.add_argument("--no-quality-db", required=False, help="flag to not store the "
+    "quality record of the mesh in the database", action='store_true')
+    parser.add_argument("--worst", required=False, metavar="METRIC", help="list the worst "
+    "meshes in the quality database by the given metric e.g. 'non-orthogonality' and exit")
+    parser.add_argument("-n", "--num", required=False, type=int, default=10, help="number "
+    "of meshes to list with --worst")
+    parser.add_argument("--scratch-dir", required=False, help="directory (e.g. local disk "
+    "or tmpfs) in which to run, only the final mesh, logs and quality files are moved back")
+    parser.add_argument("--keep-scratch", required=False, help="flag to keep the run "
+    "directory in --scratch-dir after a successful run", action='store_true')
+    parser.add_argument("--timeout", required=False, action='append', metavar="[STAGE=]SECONDS",
+    help="wall-clock timeout for each external tool in the given stage (download, ccpem, "
+    "chimerax, gmsh or code_saturne) or for all stages, may be given more than once")
+    parser.add_argument("--convert", required=False, nargs=2, metavar=("SRC", "DST"),
+    help="convert an MSH 4.1 mesh between ASCII and binary, compressed when SRC or DST "
+    "ends with .gz, .bz2 or .xz, then exit")
+    parser.add_argument("--to", required=False, default='binary', choices=['ascii', 'binary'],
+    help="encoding of the mesh written by --convert")
+    parser.add_argument("--executor", required=False, default='inline',
+    choices=list(EXECUTORS), help="how the meshing and quality steps of the inputs are run: "
+    "in turn (inline), in a local process pool (local) or as a cluster job array (array)")
+    parser.add_argument("--stage-runner", required=False, default='sequential',
+    choices=['sequential', 'async'], help="run the stages of a single input in order "
+    "(sequential) or each as soon as the stages it needs have finished (async), which "
+    "overlaps the software checks and the CodeSaturne study with the other stages")
+    parser.add_argument("--workers", required=False, type=int, default=os.cpu_count(),
+    help="number of processes used by the local executor, or jobs run at once by --serve")
+    parser.add_argument("--array-dir", required=False, default="bio_saturne_array",
+    help="directory shared with the compute nodes for the job-array scripts and results")
+    parser.add_argument("--submit-cmd", required=False, default="sbatch --wait",
+    help="command which submits a job-array script and waits for it to finish, or 'local' "
+    "to run the tasks on this host")
+    parser.add_argument("--run-task", required=False, help=argparse.SUPPRESS)
+    parser.add_argument("--serve", required=False, help="run a job server which accepts "
+    "jobs with the input, format and output arguments over HTTP on a Unix socket, keeping "
+    "software paths and caches warm",
+    action='store_true')
+    parser.add_argument("--socket", required=False, help="Unix socket on which the job server "
+    "listens, by default server.sock in ~/.cache/bio_saturne-meshingtool")
+    parser.add_argument("--plan", required=False, help="flag to print the stages of each "
+    "input with their estimated surface triangles, volume elements, peak memory and "
+    "runtime, then exit without running", action='store_true')
+    parser.add_argument("--history", required=False, default=".", help="directory of the "
+    "run directories of prior runs, whose run reports calibrate the cost estimates")
+    parser.add_argument("--metrics-file", required=False, help="Prometheus textfile (e.g. "
+    "in node-exporter's textfile directory) to which job, stage, cache and element metrics "
+    "are added as the stages run")
+    parser.add_argument("--benchmark", required=False, metavar="RESULTS", help="run the "
+    "benchmark suite on synthetic inputs, with stand-ins for tools which aren't installed, "
+    "and write the durations and peak memory of every case to the RESULTS json file")
+    parser.add_argument("--bench-levels", required=False, type=int, nargs='+', default=[1, 2],
+    choices=[1, 2, 3, 4], help="size levels of the synthetic inputs, each about ten times "
+    "larger than the last")
+    parser.add_argument("--bench-repeats", required=False, type=int, default=3, help="number "
+    "of times each benchmark case is run, the median duration is reported")
+    parser.add_argument("--bench-compare", required=False, metavar="BASELINE", help="results "
+    "file of a previous benchmark (e.g. of another commit) to compare with")
+    parser.add_argument("--bench-tolerance", required=False, type=float, default=0.2,
+    help="fraction by which a case may be slower or use more memory than the baseline "
+    "before it is reported as a regression")
+    parser.add_argument("--check", required=False, help="flag to validate the input, "
+    "configurations and required software then exit without running", action='store_true')
+    return parser
+
+def run_jobs_in_order(jobs, soft_dict, args, launch_directory, initial_contents, cost_model,
+                      quality_db):
+    '''Runs each stage of the pipeline for every job in turn, with ChimeraX batched and
+    the heavy steps dispatched through the executor'''
+    for job in jobs:
+        os.chdir(launch_directory)
+        start_job(job, launch_directory, args.scratch_dir)
+    run_jobs(jobs, plan_job, cost_model)
+    run_jobs(jobs, prepare_surface, soft_dict)
+    surface_jobs(jobs, soft_dict)
+    #The heavy steps are dispatched through the executor, the others stay local
+    EXECUTORS[args.executor](jobs, 'mesh', (soft_dict,), args)
+    update_metrics()
+    EXECUTORS[args.executor](jobs, 'quality', (soft_dict, args, quality_db), args)
+    update_metrics()
+    run_jobs(jobs, archive_job)
+    run_jobs(jobs, finish_job, args, launch_directory, initial_contents)
+
+def run_pipeline(parser, args, base_softs, supported_dict, known_softs=None):
+    '''Runs the pipeline for the inputs given by the command-line arguments and
+    returns their jobs, reusing the paths of known_softs if given'''
+    quality_db = os.path.abspath(args.quality_db or quality_db_filepath())
+    args.array_dir = os.path.abspath(args.array_dir)
+    if args.no_quality_db:
+        quality_db = None
+    if args.input is None or args.format is None:
+        parser.error("the following arguments are required: -i/--input, -f/--format")
+    if args.configs is not None and len(args.configs) not in (1, len(args.input)):
+        parser.error("give either one configuration file for all inputs or one per input")
+    #Array tasks run on compute nodes, which can't reach a node-local scratch directory
+    if args.executor == 'array' and args.scratch_dir is not None:
+        parser.error("--scratch-dir can't be used with --executor array, the run directories"
+                     " must be on a filesystem shared with the compute nodes")
+    if args.executor != 'inline':
+        PROMPTS['interactive'] = False
+    cli_timeouts = parse_timeouts(args.timeout)
+
+    #Generate a software dictionary with all the baseline required software
+    soft_dict = base_softs.copy()
+    jobs = []
+    for ind, input_arg in enumerate(args.input):
+        configs_filepath = None
+        if args.configs is not None:
+            configs_filepath = args.configs[min(ind, len(args.configs) - 1)]
+        jobs.append(prepare_job(input_arg, args.format, configs_filepath, supported_dict,
+                                soft_dict, cli_timeouts,
+                                not args.check and PROMPTS['interactive']))
+
+    #If the visualisation flag is enabled add paraview to the software dictionary
+    if args.visualise:
+        soft_dict['paraview'] = ['5.7.0']
+
+    #Plans are estimated without running or checking any software
+    if args.plan:
+        exit_tool(1 if print_plan(jobs, calibrate_cost_model(args.history)) > 0 else 0)
+
+    #Check all the required software is installed to run the pipeline, which the async
+    #stage runner overlaps with the stages of a single job
+    start_metrics(args.metrics_file, jobs)
+    overlap = args.stage_runner == 'async' and len(jobs) == 1 and not args.check
+    if args.stage_runner == 'async' and not overlap:
+        import asyncio
+        soft_dict = asyncio.run(async_software_checks(soft_dict, known_softs))
+    elif not overlap:
+        soft_dict = software_checks(soft_dict, known_softs)
+    if args.check:
+        #The job server imports the plotting modules up front
+        check_report(soft_dict, jobs, known_softs is None)
+        exit_tool()
+    initial_contents = get_initial_dir()
+    launch_directory = os.getcwd()
+    cost_model = calibrate_cost_model(args.history)
+
+    try:
+        if overlap:
+            run_job_async(jobs[0], soft_dict, known_softs, args, launch_directory,
+                          initial_contents, cost_model, quality_db)
+        else:
+            run_jobs_in_order(jobs, soft_dict, args, launch_directory, initial_contents,
+                              cost_model, quality_db)
+    except BaseException as err:
+        #An error raised rather than failing a single input ends every input
+        for job in jobs:
+            if job['error'] is None:
+                job['error'] = err
+        #Interrupted runs are left as they are
+        if isinstance(err, Exception):
+            retain_failed_jobs(jobs, initial_contents)
+        raise
+    finally:
+        METRICS['finished'] = True
+        update_metrics()
+    retain_failed_jobs(jobs, initial_contents)
+    os.chdir(launch_directory)
+    return jobs
+
+def main():
+    #CodeSaturne is the only software required for any input format
+    base_softs = {
+        'code_saturne': ['7.0'],
+        'cs_preprocess': ['7.0'],
+        }
+    #All supported formats and softwares which may be given as arguments
+    supported_dict = {
+        'meshing_soft': ['gmsh', 'salome'],
+        'input_format':['stl', 'map', 'emd', 'msh', 'pdb'],
+        'mesh_format':['msh', 'ffea']
+    }
+    parser = make_parser()
+    args = parser.parse_args()
+
+    if args.worst is not None:
+        print_worst_meshes(os.path.abspath(args.quality_db or quality_db_filepath()),
+                           args.worst, args.num)
+        exit_tool()
+    if args.run_task is not None:
+        PROMPTS['interactive'] = False
+        exit_tool(0 if run_array_task(args.run_task) else 1)
+    if args.convert is not None:
+        print_conversion(args.convert[0], args.convert[1], args.to == 'binary')
+        exit_tool()
+    if args.serve:
+        serve(args, base_softs, supported_dict)
+        exit_tool()
+    if args.benchmark is not None:
+        exit_tool(run_benchmark(args, base_softs, supported_dict))
+    jobs = run_pipeline(parser, args, base_softs, supported_dict)
+    if summarise_jobs(jobs) > 0:
+        exit_tool(1)
+    exit_tool()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(e)
+        if not hasattr(e, 'message'):
+            print('\n----------------ERROR----------------\n')
+            print(logging.error(traceback.format_exc()))
+        elif '----------------' not in e.message:
+            print('\n----------------ERROR----------------\n')
+            print(logging.error(traceback.format_exc()))
+        exit_tool(1)
+    else:
+        print("Unexpected Error Occurred")
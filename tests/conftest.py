@@ -0,0 +1,42 @@
+'''Loads the command-line tool, whose file name isn't an importable module name, as the
+module shared by the tests'''
+import os
+import importlib.util
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'bio_saturne-meshingtool.py')
+
+@pytest.fixture(scope='session')
+def tool():
+    '''Returns the module of bio_saturne-meshingtool.py'''
+    spec = importlib.util.spec_from_file_location('bio_saturne_meshingtool', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope='session')
+def cube_mesh():
+    '''Returns a function which makes a mesh, as read by read_msh, of a cube split into
+    cells^3 cubes of 6 positively oriented tetrahedra'''
+    np = pytest.importorskip('numpy')
+    def make_mesh(cells, length=40.0):
+        ticks = np.linspace(0, length, cells + 1)
+        z_coords, y_coords, x_coords = np.meshgrid(ticks, ticks, ticks, indexing='ij')
+        coords = np.stack([x_coords.ravel(), y_coords.ravel(), z_coords.ravel()], axis=1)
+        index = np.arange((cells + 1) ** 3).reshape(cells + 1, cells + 1, cells + 1)
+        #The corners of every cube, numbered by their x, y and z bits
+        corners = np.stack([index[k:k + cells, j:j + cells, i:i + cells].ravel()
+                            for k in (0, 1) for j in (0, 1) for i in (0, 1)], axis=1)
+        tets = corners[:, [[0, 1, 3, 7], [0, 3, 2, 7], [0, 2, 6, 7], [0, 6, 4, 7],
+                           [0, 4, 5, 7], [0, 5, 1, 7]]].reshape(-1, 4)
+        edges = coords[tets[:, 1:]] - coords[tets[:, :1]]
+        negative = np.einsum('ij,ij->i', np.cross(edges[:, 0], edges[:, 1]), edges[:, 2]) < 0
+        tets[negative] = tets[negative][:, [0, 2, 1, 3]]
+        rows = np.concatenate([np.arange(1, len(tets) + 1)[:, None], tets + 1], axis=1)
+        return {'binary': False, 'physical_names': [b'3 1 "protein"'],
+                'entities': [(3, 1, [0.0, 0.0, 0.0, length, length, length], [1], [])],
+                'node_blocks': [[[3, 1, 0], np.arange(1, len(coords) + 1, dtype=np.uint64),
+                                 coords]],
+                'element_blocks': [[[3, 1, 4], rows.astype(np.uint64)]], 'data': []}
+    return make_mesh
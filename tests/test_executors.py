@@ -0,0 +1,25 @@
+'''Tests of the executors which run the heavy steps of the jobs'''
+import pytest
+
+def test_step_exit_fails_only_the_job(tool, tmp_path, monkeypatch):
+    def exiting_step(job):
+        tool.exit_tool(1)
+    monkeypatch.setattr(tool, 'heavy_steps', lambda: {'mesh': exiting_step})
+    job, error = tool.run_job_step({'run_path': str(tmp_path)}, 'mesh', ())
+    assert 'exited with status 1' in error
+
+def test_gmsh_warnings_without_prompts(tool, monkeypatch):
+    def no_input(prompt):
+        raise AssertionError('prompted: ' + prompt)
+    monkeypatch.setattr('builtins.input', no_input)
+    monkeypatch.setitem(tool.PROMPTS, 'interactive', False)
+    err = 'Warning : Surface mesh is not closed\n------------------------------\n' \
+    'Info    : 1 warnings\n'
+    tool.process_gmsh_error(err, '', 'surface', 'surface_gmsh.log')
+
+def test_array_executor_rejects_scratch(tool):
+    parser = tool.make_parser()
+    args = parser.parse_args(['-i', 'surface.stl', '-f', 'stl', '--executor', 'array',
+                              '--scratch-dir', '/tmp'])
+    with pytest.raises(SystemExit):
+        tool.run_pipeline(parser, args, {}, {})
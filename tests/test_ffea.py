@@ -0,0 +1,63 @@
+'''Tests of the export of meshes to FFEA's node, topology and surface files'''
+import pytest
+
+np = pytest.importorskip('numpy')
+
+def read_ffea(filepath):
+    '''Returns the counts and the blocks of rows of an FFEA file'''
+    counts = {}
+    blocks = []
+    with open(filepath) as ffea_file:
+        for line in ffea_file.read().splitlines()[1:]:
+            if line.endswith(':'):
+                blocks.append([])
+            elif blocks == []:
+                counts[line.split()[0]] = int(line.split()[1])
+            else:
+                blocks[-1].append([float(value) for value in line.split()])
+    return counts, [np.array(block).reshape(-1, len(block[0]) if block else 0)
+                    for block in blocks]
+
+@pytest.mark.parametrize('element_order', [1, 2])
+def test_export_cube(tool, cube_mesh, tmp_path, element_order):
+    cells = 2
+    mesh_filepath = str(tmp_path / 'cube.msh')
+    tool.write_msh(mesh_filepath, cube_mesh(cells, length=2.0))
+    node_filepath, top_filepath, surf_filepath = tool.export_ffea(
+        mesh_filepath, str(tmp_path / 'cube'), element_order)
+    node_counts, (surface_nodes, interior_nodes) = read_ffea(node_filepath)
+    top_counts, (surface_tets, interior_tets) = read_ffea(top_filepath)
+    surf_counts, (faces,) = read_ffea(surf_filepath)
+    coords = np.concatenate([surface_nodes, interior_nodes])
+    tets = np.concatenate([surface_tets, interior_tets]).astype(np.int64)
+    faces = faces.astype(np.int64)
+    #Quadratic tetrahedra gain a node at the midpoint of every edge
+    grid_tets = cube_mesh(cells)['element_blocks'][0][1][:, 1:].astype(np.int64)
+    edges = np.sort(grid_tets[:, tool.TET_EDGES].reshape(-1, 2), axis=1)
+    assert node_counts['num_nodes'] == len(coords) == (cells + 1) ** 3 + \
+    (len(np.unique(edges, axis=0)) if element_order == 2 else 0)
+    assert len(np.unique(coords, axis=0)) == len(coords)
+    assert node_counts['num_surface_nodes'] == len(surface_nodes)
+    assert tets.shape == (6 * cells ** 3, 4 if element_order == 1 else 10)
+    assert top_counts['num_surface_elements'] == len(surface_tets)
+    #Surface nodes are those on the faces of the cube, and come first
+    on_boundary = ((coords == 0) | (coords == 2)).any(axis=1)
+    assert on_boundary[:len(surface_nodes)].all()
+    assert not on_boundary[len(surface_nodes):].any()
+    if element_order == 2:
+        corners = coords[tets[:, :4]]
+        pairs = np.array(tool.TET_EDGES)
+        assert np.allclose(coords[tets[:, 4:]], corners[:, pairs].mean(axis=2))
+    corners = coords[tets[:, :4]]
+    volumes = np.einsum('ij,ij->i', np.cross(corners[:, 1] - corners[:, 0],
+                                             corners[:, 2] - corners[:, 0]),
+                        corners[:, 3] - corners[:, 0])
+    assert (volumes > 0).all()
+    #Two triangles on each square of the cube's faces, pointing outwards
+    assert surf_counts['num_surface_faces'] == len(faces) == 6 * 2 * cells ** 2
+    assert (faces[:, 0] < len(surface_tets)).all()
+    for tet, face in zip(faces[:, 0], faces[:, 1:]):
+        assert set(face) <= set(tets[tet, :4])
+    points = coords[faces[:, 1:]]
+    normals = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    assert (np.einsum('ij,ij->i', normals, points.mean(axis=1) - 1) > 0).all()
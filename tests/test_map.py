@@ -0,0 +1,77 @@
+'''Tests of the out-of-core processing of MRC maps'''
+import pytest
+
+np = pytest.importorskip('numpy')
+
+def write_map(map_filepath, data, voxel_size=1.0):
+    '''Writes a float32 MRC map of data stored by section, row and column'''
+    ints = np.zeros(256, '<i4')
+    floats = ints.view('<f4')
+    ints[0:3] = data.shape[::-1]
+    ints[3] = 2
+    ints[7:10] = data.shape[::-1]
+    floats[10:13] = np.array(data.shape[::-1]) * voxel_size
+    floats[13:16] = 90
+    ints[16:19] = [1, 2, 3]
+    floats[19:22] = [data.min(), data.max(), data.mean()]
+    header = bytearray(ints.tobytes())
+    header[208:214] = b'MAP DD'
+    with open(map_filepath, 'wb') as map_file:
+        map_file.write(bytes(header))
+        map_file.write(data.astype('<f4').tobytes())
+
+def read_map(tool, map_filepath):
+    '''Returns the header fields and the data of an MRC map'''
+    mrc = tool.read_mrc_header(map_filepath)
+    floats = np.frombuffer(mrc['header'], dtype=mrc['byteorder'] + 'f4')
+    return mrc, floats, np.array(tool.map_sections(map_filepath, mrc, 0, mrc['shape'][0]))
+
+@pytest.mark.parametrize('size,bin_factor', [(40, 3), (40, 2), (10, 4)])
+def test_binned_voxel_size(tool, tmp_path, size, bin_factor):
+    map_filepath = str(tmp_path / 'map.mrc')
+    tool.write_bench_mrc(map_filepath, size, voxel_size=1.5)
+    out_filepath = tool.process_map_chunked(map_filepath, str(tmp_path / 'map'),
+                                            {'bin_factor': bin_factor, 'memory_limit': 0.01})
+    mrc, floats, data = read_map(tool, out_filepath)
+    assert mrc['shape'] == (size // bin_factor,) * 3
+    assert mrc['voxel_size'] == pytest.approx(1.5 * bin_factor)
+    #Binned voxels are centred on the middle of the voxels they average
+    assert floats[49:52] == pytest.approx([1.5 * (bin_factor - 1) / 2] * 3)
+    _, _, original = read_map(tool, map_filepath)
+    end = (size // bin_factor) * bin_factor
+    expected = original[:end, :end, :end].reshape(
+        [size // bin_factor, bin_factor] * 3).mean(axis=(1, 3, 5))
+    assert data == pytest.approx(expected, abs=1e-5)
+
+@pytest.mark.parametrize('chunk,dust_size', [(1, 0.01), (3, 0.01), (7, 0.01), (3, 0.2)])
+def test_chunked_dust_filter(tool, tmp_path, chunk, dust_size):
+    ndimage = pytest.importorskip('scipy.ndimage')
+    map_filepath = str(tmp_path / 'map.mrc')
+    #Sparse noise near the percolation threshold gives densities which only join
+    #through later chunks
+    original = np.random.default_rng(1).random((20, 20, 20)).astype(np.float32)
+    write_map(map_filepath, original)
+    labels, _ = ndimage.label(original > 0.72)
+    sizes = np.bincount(labels.ravel())
+    keep = sizes >= dust_size * sizes[1:].max()
+    keep[0] = False
+    tool.dust_filter_chunked(map_filepath, tool.read_mrc_header(map_filepath), chunk, 0.72,
+                             dust_size)
+    _, _, data = read_map(tool, map_filepath)
+    assert 0 < keep[labels].sum() < (original > 0.72).sum()
+    assert np.array_equal(data, np.where(keep[labels], original, 0))
+
+def test_dust_size_config(tool, tmp_path):
+    pytest.importorskip('scipy.ndimage')
+    map_filepath = str(tmp_path / 'map.mrc')
+    original = np.random.default_rng(1).random((20, 20, 20)).astype(np.float32)
+    write_map(map_filepath, original)
+    expected_filepath = str(tmp_path / 'expected.mrc')
+    write_map(expected_filepath, np.where(original > 0.72, original, 0))
+    tool.dust_filter_chunked(expected_filepath, tool.read_mrc_header(expected_filepath), 20,
+                             0.72, 0.2)
+    out_filepath = tool.process_map_chunked(map_filepath, str(tmp_path / 'map'),
+                                            {'out_of_core': 'true', 'threshold': 0.72,
+                                             'dust_filter': 'true', 'dust_size': 0.2,
+                                             'memory_limit': 0.05})
+    assert np.array_equal(read_map(tool, out_filepath)[2], read_map(tool, expected_filepath)[2])
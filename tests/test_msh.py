@@ -0,0 +1,82 @@
+'''Tests of reading, writing and converting MSH 4.1 meshes'''
+import pytest
+
+np = pytest.importorskip('numpy')
+
+#Two tetrahedra in a physical volume, with coordinates which need all 17 significant
+#digits to be read back as the same doubles
+ASCII_MESH = b'''$MeshFormat
+4.1 0 8
+$EndMeshFormat
+$PhysicalNames
+1
+3 1 "protein"
+$EndPhysicalNames
+$Entities
+0 0 0 1
+1 0 0 0 1 1 1 1 1 0
+$EndEntities
+$Nodes
+1 5 1 5
+3 1 0 5
+1
+2
+3
+4
+5
+0 0 0
+1 0 0
+0 1 0
+0 0 1
+0.10000000000000001 0.30000000000000004 0.33333333333333331
+$EndNodes
+$Elements
+1 2 1 2
+3 1 4 2
+1 1 2 3 4
+2 2 3 4 5
+$EndElements
+'''
+
+@pytest.mark.parametrize('exten', ['msh', 'msh.gz', 'msh.bz2', 'msh.xz'])
+def test_convert(tool, tmp_path, monkeypatch, exten):
+    #Small chunks make every block span several reads and writes
+    monkeypatch.setattr(tool, 'MSH_CHUNK_ROWS', 2)
+    ascii_filepath = str(tmp_path / 'mesh.msh')
+    with open(ascii_filepath, 'wb') as ascii_file:
+        ascii_file.write(ASCII_MESH)
+    binary_filepath = str(tmp_path / ('mesh_binary.' + exten))
+    tool.convert_msh(ascii_filepath, binary_filepath, True)
+    with tool.open_msh(binary_filepath, 'rb') as binary_file:
+        assert binary_file.read(20) == b'$MeshFormat\n4.1 1 8\n'
+    back_filepath = str(tmp_path / 'mesh_back.msh')
+    tool.convert_msh(binary_filepath, back_filepath, False)
+    with open(back_filepath, 'rb') as back_file:
+        assert back_file.read() == ASCII_MESH
+
+def assert_same_mesh(mesh, other):
+    assert mesh['physical_names'] == other['physical_names']
+    assert mesh['entities'] == other['entities']
+    #Blocks read back also have their number of rows in the header
+    for key, header_length in (('node_blocks', 3), ('element_blocks', 3), ('data', None)):
+        assert len(mesh[key]) == len(other[key])
+        for block, other_block in zip(mesh[key], other[key]):
+            assert list(block[0])[:header_length] == list(other_block[0])[:header_length]
+            for array, other_array in zip(block[1:], other_block[1:]):
+                assert np.array_equal(array, other_array)
+
+@pytest.mark.parametrize('binary', [False, True])
+@pytest.mark.parametrize('exten', ['msh', 'msh.gz'])
+def test_write_read(tool, cube_mesh, tmp_path, monkeypatch, binary, exten):
+    monkeypatch.setattr(tool, 'MSH_CHUNK_ROWS', 7)
+    mesh = cube_mesh(3)
+    mesh['binary'] = binary
+    tags = mesh['element_blocks'][0][1][:, 0]
+    mesh['data'] = [[['ElementData', [b'"partition"'], [b'0'],
+                      [b'0', b'1', str(len(tags)).encode()]], tags,
+                     (tags % 4 + 1)[:, None].astype(np.float64)]]
+    msh_filepath = str(tmp_path / ('mesh.' + exten))
+    tool.write_msh(msh_filepath, mesh)
+    read = tool.read_msh(msh_filepath)
+    assert read['binary'] == binary
+    assert_same_mesh(mesh, read)
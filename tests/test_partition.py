@@ -0,0 +1,43 @@
+'''Tests of the native partitioning of meshes'''
+import pytest
+
+np = pytest.importorskip('numpy')
+
+@pytest.mark.parametrize('cells', [1, 3])
+def test_tet_neighbours(tool, cube_mesh, cells):
+    coords, tets, _ = tool.mesh_tetrahedra(cube_mesh(cells))
+    neighbours = tool.tet_neighbours(tets, len(coords))
+    #6 faces inside each cube, and 2 triangles on each square between cubes
+    assert len(neighbours) == 6 * cells ** 3 + 2 * 3 * cells ** 2 * (cells - 1)
+    for first, second in neighbours:
+        assert len(set(tets[first]) & set(tets[second])) == 3
+
+@pytest.mark.parametrize('method', ['rcb', 'inertial'])
+@pytest.mark.parametrize('num_parts', [2, 3, 5, 8])
+def test_partition_balance(tool, cube_mesh, tmp_path, method, num_parts):
+    mesh_filepath = str(tmp_path / 'mesh.msh')
+    tool.write_msh(mesh_filepath, cube_mesh(4))
+    stats = tool.partition_mesh(mesh_filepath, num_parts, method)
+    num_tets = 6 * 4 ** 3
+    assert stats['max_elements'] - stats['min_elements'] <= 1
+    assert stats['load_imbalance'] == pytest.approx(
+        stats['max_elements'] / (num_tets / num_parts), abs=1e-4)
+    #Compact partitions cut far fewer faces than an assignment at random
+    assert 0 < stats['edge_cut'] < stats['shared_faces'] * (1 - 1 / num_parts) / 2
+    mesh = tool.read_msh(mesh_filepath)
+    (_, tags, values), = [data for data in mesh['data'] if data[0][1] == [b'"partition"']]
+    assert np.array_equal(np.sort(tags), mesh['element_blocks'][0][1][:, 0].astype(np.int64))
+    sizes = np.bincount(values[:, 0].astype(np.int64), minlength=num_parts + 1)
+    assert sizes[0] == 0
+    assert sizes[1:].min() == stats['min_elements']
+    assert sizes[1:].max() == stats['max_elements']
+    assert sizes.sum() == num_tets
+
+def test_repartition_replaces_data(tool, cube_mesh, tmp_path):
+    mesh_filepath = str(tmp_path / 'mesh.msh')
+    tool.write_msh(mesh_filepath, cube_mesh(2))
+    tool.partition_mesh(mesh_filepath, 4, 'rcb')
+    tool.partition_mesh(mesh_filepath, 2, 'rcb')
+    data = tool.read_msh(mesh_filepath)['data']
+    assert len(data) == 1
+    assert set(data[0][2][:, 0].tolist()) == {1.0, 2.0}
@@ -0,0 +1,36 @@
+'''Tests of the cross-run quality database'''
+import os
+import pytest
+
+def quality_record(mesh_name, maximum):
+    '''Returns a quality record with one histogram of the non-orthogonality'''
+    return {'input': mesh_name + '.stl', 'input_format': 'stl', 'config_hash': 'abc',
+            'timestamp': '2026-10-19T00:00:00', 'mesh_name': mesh_name,
+            'run_directory': mesh_name + '_run', 'quality_file': mesh_name + '.log',
+            'mesh_stats': {}, 'histograms': [{'metric': 'Histogram of the cell non-orthogonality',
+                                              'minimum': 0.0, 'maximum': maximum,
+                                              'bins': [0.0, maximum], 'counts': [1]}]}
+
+def test_worst_meshes_are_read_only(tool, tmp_path):
+    db_filepath = str(tmp_path / 'quality.db')
+    for mesh_name, maximum in (('good', 10.0), ('bad', 80.0)):
+        tool.store_quality_record(db_filepath, quality_record(mesh_name, maximum))
+    contents = open(db_filepath, 'rb').read()
+    value, rows = tool.query_worst_meshes(db_filepath, 'cell non-orthogonality', 1)
+    assert value == 'maximum'
+    assert [(row[0], row[3]) for row in rows] == [(80.0, 'bad')]
+    assert open(db_filepath, 'rb').read() == contents
+    assert sorted(os.listdir(tmp_path)) == ['quality.db']
+
+def test_missing_database(tool, tmp_path):
+    db_filepath = str(tmp_path / 'data' / 'quality.db')
+    with pytest.raises(tool.InputError):
+        tool.query_worst_meshes(db_filepath, 'cell non-orthogonality', 1)
+    assert os.listdir(tmp_path) == []
+
+def test_database_without_tables(tool, tmp_path):
+    db_filepath = tmp_path / 'quality.db'
+    db_filepath.write_bytes(b'')
+    with pytest.raises(tool.InputError):
+        tool.query_worst_meshes(str(db_filepath), 'cell non-orthogonality', 1)
+    assert db_filepath.read_bytes() == b''
@@ -0,0 +1,36 @@
+'''Tests of racing gmsh configurations'''
+import os
+import sys
+
+#Stand-in for gmsh which writes an empty mesh and reports warnings
+GMSH_WARNINGS = '''import sys
+args = sys.argv[1:]
+open(args[args.index('-o') + 1], 'w').close()
+print('Info    : 8 nodes 12 elements')
+sys.stderr.write('Warning : Surface mesh is not closed\\n------------------------------\\n'
+                 'Info    : 1 warnings\\n')
+'''
+
+def test_race_candidates_with_warnings_finish(tool, tmp_path, monkeypatch):
+    def no_input(prompt):
+        raise AssertionError('prompted: ' + prompt)
+    monkeypatch.setattr('builtins.input', no_input)
+    gmsh_filepath = tmp_path / 'gmsh.py'
+    gmsh_filepath.write_text(GMSH_WARNINGS)
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('.tmp')
+    os.mkdir('loggers')
+    mesh_config_dict = {'format': 'msh', 'surface_cache': 'false', 'race': {
+        'mode': 'first', 'cores': 2, 'candidates': [
+            {'gmsh_options': {'Mesh.Algorithm3D': 1}},
+            {'gmsh_options': {'Mesh.Algorithm3D': 10}}]}}
+    run_report = {'run_path': str(tmp_path), 'mesh_name': 'surface_3d', 'sizes': {},
+                  'mesh_attempts': []}
+    monkeypatch.setattr(tool, 'gmsh_volume_cmd', lambda soft_dict, mesh_config_dict, geofile,
+                        mesh_filename, log_file: [sys.executable, str(gmsh_filepath), '-o',
+                                                  mesh_filename])
+    winner = tool.gmsh_race({}, mesh_config_dict, str(tmp_path / 'surface.stl'), 'surface',
+                            'loggers', 'surface_3d.msh', 'surface_3d', run_report)
+    assert winner in (0, 1)
+    assert os.path.isfile('surface_3d.msh')
+    assert run_report['sizes'] == {'nodes': 8, 'elements': 12}
@@ -0,0 +1,83 @@
+'''Tests of the space-filling curves and the renumbering of meshes'''
+import pytest
+
+np = pytest.importorskip('numpy')
+
+def full_grid(size):
+    '''Returns every point of a cubic integer grid'''
+    return np.stack(np.meshgrid(*[np.arange(size)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+
+@pytest.mark.parametrize('method', ['hilbert', 'morton'])
+def test_keys_fill_the_grid(tool, method):
+    grid = full_grid(8)
+    keys = tool.hilbert_keys(grid) if method == 'hilbert' else tool.morton_keys(grid)
+    assert np.array_equal(np.sort(keys), np.arange(8 ** 3))
+
+def test_hilbert_steps_to_neighbours(tool):
+    #The curve starts at the origin and fills each cube of 8^k cells before leaving it
+    grid = full_grid(8).astype(np.int64)
+    path = grid[np.argsort(tool.hilbert_keys(grid))]
+    assert (np.abs(np.diff(path, axis=0)).sum(axis=1) == 1).all()
+
+def test_morton_interleaves_bits(tool):
+    grid = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [2 ** 21 - 1] * 3], dtype=np.uint64)
+    assert tool.morton_keys(grid).tolist() == [4, 2, 1, 2 ** 63 - 1]
+
+def tet_corners(tool, mesh):
+    '''Returns the tetrahedra of a mesh as sets of the coordinates of their corners'''
+    coords, tets = tool.mesh_tetrahedra(mesh)[:2]
+    return sorted(tuple(sorted(map(tuple, corners))) for corners in coords[tets].tolist())
+
+@pytest.mark.parametrize('method', ['rcm', 'hilbert', 'morton'])
+def test_renumber(tool, cube_mesh, tmp_path, method):
+    if method == 'rcm':
+        pytest.importorskip('scipy')
+    mesh = cube_mesh(5)
+    #Shuffle the node tags so the mesh starts with a poor numbering
+    shuffled = np.random.default_rng(0).permutation(len(mesh['node_blocks'][0][1])) + 1
+    block = mesh['node_blocks'][0]
+    rows = mesh['element_blocks'][0][1]
+    rows[:, 1:] = shuffled[rows[:, 1:].astype(np.int64) - 1]
+    order = np.argsort(shuffled)
+    block[1], block[2] = shuffled[order].astype(np.uint64), block[2][order]
+    mesh_filepath = str(tmp_path / 'mesh.msh')
+    tool.write_msh(mesh_filepath, mesh)
+    stats = tool.renumber_mesh(mesh_filepath, method)
+    renumbered = tool.read_msh(mesh_filepath)
+    #The same tetrahedra, with node and element tags still numbered from 1 in order
+    assert tet_corners(tool, renumbered) == tet_corners(tool, mesh)
+    tags = renumbered['node_blocks'][0][1]
+    assert np.array_equal(tags, np.arange(1, len(tags) + 1))
+    rows = renumbered['element_blocks'][0][1]
+    assert np.array_equal(rows[:, 0], np.arange(1, len(rows) + 1))
+    assert (np.diff(rows[:, 1:].min(axis=1).astype(np.int64)) >= 0).all()
+    #Space-filling curves keep a few long jumps, so only the profile halves for them
+    assert stats['bandwidth_after'] < stats['bandwidth_before']
+    assert stats['profile_after'] < stats['profile_before'] / 2
+    _, _, index = tool.mesh_nodes(renumbered)
+    edges = tool.node_graph(renumbered, index)
+    assert tool.bandwidth_profile(edges, np.arange(len(tags)), len(tags)) == \
+    (stats['bandwidth_after'], stats['profile_after'])
+
+def test_renumber_keeps_data(tool, cube_mesh, tmp_path):
+    mesh = cube_mesh(3)
+    coords = mesh['node_blocks'][0][2]
+    rows = mesh['element_blocks'][0][1]
+    centroids = coords[rows[:, 1:].astype(np.int64) - 1].mean(axis=1)
+    #Node data of the node heights and element data of the element centroids
+    mesh['data'] = [[['NodeData', [b'"height"'], [b'0'], [b'0', b'1', str(len(coords)).encode()]],
+                     np.arange(1, len(coords) + 1), coords[:, 2:]],
+                    [['ElementData', [b'"centroid"'], [b'0'],
+                      [b'0', b'3', str(len(rows)).encode()]], rows[:, 0].astype(np.int64),
+                     centroids]]
+    mesh_filepath = str(tmp_path / 'mesh.msh')
+    tool.write_msh(mesh_filepath, mesh)
+    tool.renumber_mesh(mesh_filepath, 'hilbert')
+    renumbered = tool.read_msh(mesh_filepath)
+    _, coords, index = tool.mesh_nodes(renumbered)
+    heights, centroids = renumbered['data']
+    assert np.array_equal(heights[1], np.arange(1, len(coords) + 1))
+    assert np.allclose(heights[2][:, 0], coords[index[heights[1]], 2])
+    rows = renumbered['element_blocks'][0][1]
+    assert np.array_equal(centroids[1], rows[:, 0].astype(np.int64))
+    assert np.allclose(centroids[2], coords[index[rows[:, 1:].astype(np.int64)]].mean(axis=1))
@@ -0,0 +1,34 @@
+'''Tests of the retention policy applied to run directories'''
+import os
+
+def make_run_directory(run_path):
+    '''Writes the files a run leaves in its run directory and its .tmp'''
+    os.makedirs(run_path / 'surface_3d_loggers')
+    os.makedirs(run_path / '.tmp')
+    (run_path / 'surface_3d.msh').write_bytes(b'm' * 100)
+    (run_path / 'surface_3d_loggers' / 'surface_3d_gmsh.log').write_bytes(b'l' * 10)
+    (run_path / 'surface.geo').write_bytes(b'g' * 20)
+    (run_path / '.tmp' / 'surface_race0.geo').write_bytes(b'r' * 30)
+
+def test_files_are_counted_and_compressed_once(tool, tmp_path, monkeypatch):
+    make_run_directory(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    job = {'mesh_name': 'surface_3d', 'log_foldr': 'surface_3d_loggers', 'mesh_config_dict': {
+        'retention': {'success': {'intermediates': 'compress'}}}}
+    summary = tool.apply_retention(job, 'success', [])
+    assert summary['outputs'] == {'files': 1, 'bytes': 100}
+    intermediates = summary['classes']['intermediates']
+    assert (intermediates['files'], intermediates['bytes']) == (2, 50)
+    assert sorted(os.listdir('.tmp')) == ['surface.geo.gz', 'surface_race0.geo.gz']
+    assert summary['classes']['logs']['files'] == 1
+    assert summary['kept_bytes'] == 100 + 10 + intermediates['kept_bytes']
+
+def test_deleted_intermediates(tool, tmp_path, monkeypatch):
+    make_run_directory(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    job = {'mesh_name': 'surface_3d', 'log_foldr': 'surface_3d_loggers', 'mesh_config_dict': {
+        'retention': {'failure': {'intermediates': 'delete', 'logs': 'delete'}}}}
+    summary = tool.apply_retention(job, 'failure', [])
+    assert os.listdir('.tmp') == []
+    assert sorted(os.listdir('.')) == ['.tmp', 'surface_3d.msh']
+    assert summary['kept_bytes'] == 100
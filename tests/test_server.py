@@ -0,0 +1,99 @@
+'''Tests of the job server and the arguments accepted from its jobs'''
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import subprocess
+import http.client
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'bio_saturne-meshingtool.py')
+
+@pytest.mark.parametrize('job_args', [
+    ['-i', 'surface.stl', '-f', 'stl', '-c', 'configs.yaml'],
+    ['-i', 'a.pdb', 'b.pdb', '-f', 'pdb', '-c', 'configs.yaml', '-hg', '--hist-layout', 'grid',
+     '--timeout', 'gmsh=60', '--no-quality-db', '--check'],
+])
+def test_job_options_accepted(tool, job_args):
+    assert tool.check_server_job_args(job_args) is None
+
+@pytest.mark.parametrize('job_args', [
+    ['-i', 'm.msh', '-f', 'msh', '--executor', 'array', '--submit-cmd', 'touch PWNED'],
+    ['-i', 'm.msh', '-f', 'msh', '--sub', 'touch PWNED'],
+    ['--run-task', 'task_0.pkl'],
+    ['--serve'],
+    ['-i', 'm.msh', '-f', 'msh', '--scratch-dir', '/tmp'],
+    ['-i', 'm.msh', '-f', 'msh', '--metrics-file', 'metrics.prom'],
+    ['-i', 'm.msh', '-f', 'msh', '--quality-db', 'quality.db'],
+    ['--not-an-option'],
+])
+def test_job_options_refused(tool, job_args):
+    assert tool.check_server_job_args(job_args) is not None
+
+class UnixConnection(http.client.HTTPConnection):
+    '''HTTP connection to the job server's Unix socket'''
+    def __init__(self, socket_filepath):
+        super().__init__('localhost', timeout=60)
+        self.socket_filepath = socket_filepath
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_filepath)
+
+def request(socket_filepath, method, path, body=None):
+    '''Sends a request to the job server and returns its JSON response'''
+    connection = UnixConnection(socket_filepath)
+    connection.request(method, path, body=None if body is None else json.dumps(body))
+    response = json.loads(connection.getresponse().read())
+    connection.close()
+    return response
+
+def test_jobs_copy_the_template_study(tool, tmp_path):
+    pytest.importorskip('numpy')
+    pytest.importorskip('yaml')
+    bin_dir = str(tmp_path / 'bin')
+    if 'real' in tool.bench_stand_ins(bin_dir).values():
+        pytest.skip('the jobs need the stand-ins of every tool')
+    #code_saturne logs the command it is given before running its stand-in
+    calls_filepath = str(tmp_path / 'code_saturne_calls')
+    os.rename(os.path.join(bin_dir, 'code_saturne'), os.path.join(bin_dir, 'code_saturne.py'))
+    with open(os.path.join(bin_dir, 'code_saturne'), 'w') as wrapper:
+        wrapper.write('#!/bin/sh\necho "$1" >> ' + calls_filepath + '\nexec ' +
+                      os.path.join(bin_dir, 'code_saturne.py') + ' "$@"\n')
+    os.chmod(os.path.join(bin_dir, 'code_saturne'), 0o755)
+    quality_filepath = str(tmp_path / 'run_solver.log')
+    tool.write_bench_quality_log(quality_filepath, 1000, 10)
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ['PATH'],
+               XDG_CACHE_HOME=str(tmp_path / 'cache'), XDG_DATA_HOME=str(tmp_path / 'data'),
+               BIO_SATURNE_BENCH_QUALITY=quality_filepath)
+    socket_filepath = str(tmp_path / 'server.sock')
+    server = subprocess.Popen([sys.executable, SCRIPT, '--serve', '--socket', socket_filepath,
+                               '--workers', '1'], cwd=str(tmp_path), env=env,
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while not os.path.exists(socket_filepath):
+            assert server.poll() is None and time.monotonic() < deadline
+            time.sleep(0.1)
+        for job in range(2):
+            job_dir = tmp_path / ('job_' + str(job))
+            job_dir.mkdir()
+            tool.write_msh(str(job_dir / 'mesh.msh'), tool.bench_grid_mesh(2))
+            job_id = request(socket_filepath, 'POST', '/jobs', {
+                'args': ['-i', 'mesh.msh', '-f', 'msh', '--no-quality-db'],
+                'cwd': str(job_dir)})['id']
+            status = request(socket_filepath, 'GET', '/jobs/' + job_id)
+            while status['status'] in ('queued', 'running'):
+                assert time.monotonic() < deadline
+                time.sleep(0.1)
+                status = request(socket_filepath, 'GET', '/jobs/' + job_id)
+            assert status['status'] == 'success', status
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=30)
+    #Only the server creates a study, the jobs copy it
+    with open(calls_filepath) as calls_file:
+        assert calls_file.read().split().count('create') == 1
@@ -0,0 +1,13 @@
+'''Tests of the stages recorded in the run report'''
+import sys
+
+def test_stage_memory_of_its_own_tools(tool, tmp_path):
+    run_report = {'run_path': str(tmp_path), 'mesh_name': 'mesh', 'stages': []}
+    allocate = [sys.executable, '-c', 'block = bytearray(200 * 1024 * 1024)']
+    tool.run_stage(run_report, 'big', tool.launcher, allocate)
+    tool.run_stage(run_report, 'small', tool.launcher, ['true'])
+    tool.run_stage(run_report, 'none', len, [])
+    big, small, none = run_report['stages']
+    assert big['peak_memory_mb'] > 200
+    assert small['peak_memory_mb'] is None
+    assert none['peak_memory_mb'] is None
@@ -0,0 +1,65 @@
+'''Regression test of the start-up time of the command-line tool, run with
+python -X importtime on a --check dry-run'''
+import os
+import re
+import sys
+import subprocess
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'bio_saturne-meshingtool.py')
+#Modules which must only be imported on the paths which need them
+HEAVY_MODULES = ['numpy', 'matplotlib', 'scipy', 'sqlite3', 'asyncio', 'multiprocessing']
+#Time from the start of the script to the end of the checks
+STARTUP_BUDGET_MS = 1000
+
+def write_stand_in(bin_dir, tool, version):
+    '''Writes an executable which only reports its version'''
+    tool_filepath = os.path.join(bin_dir, tool)
+    with open(tool_filepath, 'w') as tool_file:
+        tool_file.write('#!/bin/sh\necho "' + tool + ' ' + version + '"\n')
+    os.chmod(tool_filepath, 0o755)
+
+@pytest.fixture
+def check_env(tmp_path):
+    '''Returns the environment of a --check run with stand-ins for the required software'''
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for tool, version in (('code_saturne', '7.0.4'), ('cs_preprocess', '7.0.4'),
+                          ('gmsh', '4.11.1')):
+        write_stand_in(str(bin_dir), tool, version)
+    env = dict(os.environ)
+    env['PATH'] = str(bin_dir) + os.pathsep + env['PATH']
+    env['XDG_CACHE_HOME'] = str(tmp_path / 'cache')
+    env['XDG_DATA_HOME'] = str(tmp_path / 'data')
+    return env
+
+def run_check(args, cwd, env):
+    '''Runs --check with -X importtime, returning the modules imported and the reported
+    start-up time in ms'''
+    process = subprocess.run([sys.executable, '-X', 'importtime', SCRIPT] + args + ['--check'],
+                             cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                             timeout=60, check=False)
+    assert process.returncode == 0, process.stdout + process.stderr
+    modules = set(re.findall(r'^import time:\s*\d+ \|\s*\d+ \|\s*([\w.]+)', process.stderr,
+                             re.MULTILINE))
+    startup_ms = float(re.search(r'Checks completed in (\d+) ms', process.stdout).group(1))
+    return modules, startup_ms
+
+def assert_fast_start(modules, startup_ms):
+    '''Asserts no heavy module was imported and start-up stayed within the budget'''
+    heavy = [module for module in modules if module.split('.')[0] in HEAVY_MODULES]
+    assert heavy == []
+    assert startup_ms < STARTUP_BUDGET_MS
+
+def test_check_msh(tmp_path, check_env):
+    (tmp_path / 'mesh.msh').write_text('$MeshFormat\n4.1 0 8\n$EndMeshFormat\n')
+    assert_fast_start(*run_check(['-i', 'mesh.msh', '-f', 'msh'], tmp_path, check_env))
+
+def test_check_stl(tmp_path, check_env):
+    pytest.importorskip('yaml')
+    (tmp_path / 'surface.stl').write_bytes(bytes(84))
+    (tmp_path / 'configs.yaml').write_text('software: gmsh\nformat: msh\nname: surface_3d\n')
+    assert_fast_start(*run_check(['-i', 'surface.stl', '-f', 'stl', '-c', 'configs.yaml'],
+                                 tmp_path, check_env))